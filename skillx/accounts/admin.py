@@ -1,3 +1,29 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Skill, SkillAlias
+from .skills import normalize_skill_name
+
+
+class SkillAliasInline(admin.TabularInline):
+    model = SkillAlias
+    extra = 1
+
+
+@admin.register(Skill)
+class SkillAdmin(admin.ModelAdmin):
+    list_display = ('name', 'normalized_name')
+    search_fields = ('normalized_name', 'aliases__alias')
+    exclude = ('normalized_name',)
+    inlines = [SkillAliasInline]
+
+    def save_model(self, request, obj, form, change):
+        obj.normalized_name = normalize_skill_name(obj.name)
+        super().save_model(request, obj, form, change)
+
+    def save_formset(self, request, form, formset, change):
+        aliases = formset.save(commit=False)
+        for alias in aliases:
+            alias.alias = normalize_skill_name(alias.alias)
+            alias.save()
+        for alias in formset.deleted_objects:
+            alias.delete()
@@ -0,0 +1,21 @@
+"""
+Hot/cold message tiering.
+
+Messages older than MESSAGE_ARCHIVE_AFTER_DAYS are moved to
+ArchivedMessage by the archive_messages command. Every archived message
+is older than archive_cutoff(), so a history query only needs to read the
+archive when its range reaches past that point.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def archive_cutoff():
+    return timezone.now() - timedelta(days=settings.MESSAGE_ARCHIVE_AFTER_DAYS)
+
+
+def reaches_archive(timestamp):
+    """True if archived messages may exist at or after timestamp"""
+    return timestamp < archive_cutoff()
@@ -0,0 +1,193 @@
+"""
+Audit trail for API requests, written off the request path.
+
+SecurityAuditMiddleware only puts a tuple of the request's details on a
+bounded in-process queue. A background thread takes them off in batches
+of up to AUDIT_BATCH_SIZE, turns them into structured records and hands
+each batch to the configured backend:
+
+- 'logging'  one JSON line per record on the "security" logger
+- 'file'     JSON lines appended to AUDIT_LOG_FILE
+- 'database' AuditEvent rows, one bulk insert per batch
+
+When the queue is full AUDIT_QUEUE_FULL decides: 'drop' discards the
+record at once, 'block' waits up to AUDIT_BLOCK_TIMEOUT seconds (None:
+indefinitely) for room and only then drops it. Dropped and failed
+records are counted, see AuditLog.stats().
+"""
+import atexit
+import json
+import logging
+import queue
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import AuditEvent
+
+logger = logging.getLogger('security')
+
+SENSITIVE_PREFIXES = (
+    '/api/conversations/',
+    '/api/my-connections/',
+    '/api/pending-requests/',
+    '/api/profile/',
+    '/api/messages/',
+    '/api/export/',
+)
+FIELDS = ('timestamp', 'method', 'path', 'status_code', 'user_id', 'ip_address', 'user_agent')
+
+
+def to_record(entry):
+    record = dict(zip(FIELDS, entry))
+    record['timestamp'] = datetime.fromtimestamp(record['timestamp'], tz=timezone.utc)
+    record['ip_address'] = (record['ip_address'] or '')[:45]
+    record['user_agent'] = record['user_agent'][:255]
+    record['path'] = record['path'][:255]
+    record['sensitive'] = record['path'].startswith(SENSITIVE_PREFIXES)
+    return record
+
+
+def to_json(record):
+    return json.dumps({**record, 'timestamp': record['timestamp'].isoformat()})
+
+
+class LoggingBackend:
+    def write(self, records):
+        for record in records:
+            logger.info(to_json(record))
+
+
+class FileBackend:
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, records):
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(''.join(to_json(record) + '\n' for record in records))
+
+
+class DatabaseBackend:
+    def write(self, records):
+        close_old_connections()
+        AuditEvent.objects.bulk_create([AuditEvent(**record) for record in records])
+
+
+def backend_from_settings():
+    name = settings.AUDIT_LOG_BACKEND
+    if name == 'file':
+        return FileBackend(settings.AUDIT_LOG_FILE)
+    if name == 'database':
+        return DatabaseBackend()
+    return LoggingBackend()
+
+
+class AuditLog:
+    def __init__(self, backend, queue_size=10000, batch_size=500, flush_interval=1.0, when_full='drop', block_timeout=0.05,
+                 background=True):
+        self.backend = backend
+        self.background = background
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block = when_full == 'block'
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def record(self, entry):
+        """Queue one FIELDS tuple; never raises"""
+        if self._thread is None and self.background:
+            self.start()
+        try:
+            if self.block:
+                self.queue.put(entry, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def _take_batch(self, timeout):
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                self.backend.write([to_record(entry) for entry in batch])
+                self.written += len(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception('Could not write %d audit records', len(batch))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take_batch(self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        while True:
+            batch = self._take_batch(timeout=0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+
+_audit_log = None
+_lock = threading.Lock()
+
+
+def get_audit_log():
+    """The process-wide AuditLog, configured from settings on first use"""
+    global _audit_log
+    if _audit_log is None:
+        with _lock:
+            if _audit_log is None:
+                _audit_log = AuditLog(
+                    backend_from_settings(),
+                    queue_size=settings.AUDIT_QUEUE_SIZE,
+                    batch_size=settings.AUDIT_BATCH_SIZE,
+                    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+                    when_full=settings.AUDIT_QUEUE_FULL,
+                    block_timeout=settings.AUDIT_BLOCK_TIMEOUT,
+                )
+                # Write what is still queued when the process exits
+                atexit.register(_audit_log.close)
+    return _audit_log
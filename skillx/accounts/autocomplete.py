@@ -0,0 +1,207 @@
+"""
+In-process prefix index for skill type-ahead.
+
+Every skill someone lists is kept, with its aliases, in a sorted array of
+normalized names. A lookup bisects to the first name with the prefix and
+walks forward, so answering a keystroke never touches the database. Each
+skill is weighted by how many have/want listings it has.
+
+Profile changes in this process are applied to the index as they commit:
+skills_changed() adjusts the weights of the skills a user added or
+removed, and alias_added() / alias_removed() follow SkillAlias writes.
+Anything else (renamed or deleted skills) calls invalidate(), and other
+processes' changes show once their copy is older than
+SKILL_AUTOCOMPLETE_TTL seconds. Either way the index is rebuilt on a
+background thread while lookups keep using the old one; only the first
+lookup in a process waits for a build.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+
+from .models import Skill, SkillAlias, UserSkillHave, UserSkillWant
+
+TTL = getattr(settings, 'SKILL_AUTOCOMPLETE_TTL', 300)
+# Prefixes this short match many skills, so their answers are memoized
+MEMO_PREFIX_LENGTH = 2
+
+
+class PrefixIndex:
+    def __init__(self, entries, weights):
+        """entries: (key, skill_id, name) tuples, key normalized; weights: skill_id to listings"""
+        entries = sorted(entries)
+        # Replaced together, so a lookup never sees keys and entries out of step
+        self.sorted = ([entry[0] for entry in entries], entries)
+        self.weights = weights
+        self.built_at = time.monotonic()
+        self._memo = {}
+
+    def complete(self, prefix, limit):
+        """Up to limit (skill_id, name, weight) for skills with a name or alias starting with prefix"""
+        memo_key = (prefix, limit)
+        memo = self._memo
+        if len(prefix) <= MEMO_PREFIX_LENGTH and memo_key in memo:
+            return memo[memo_key]
+
+        keys, entries = self.sorted
+        best = {}
+        for i in range(bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            _, skill_id, name = entries[i]
+            weight = self.weights.get(skill_id, 0)
+            if weight > 0:
+                best[skill_id] = (skill_id, name, weight)
+
+        results = heapq.nsmallest(limit, best.values(), key=lambda entry: (-entry[2], entry[1].lower()))
+        if len(prefix) <= MEMO_PREFIX_LENGTH:
+            memo[memo_key] = results
+        return results
+
+    def add_entries(self, entries):
+        _, current = self.sorted
+        known = set(current)
+        entries = [entry for entry in entries if entry not in known]
+        if entries:
+            merged = sorted(current + entries)
+            self.sorted = ([entry[0] for entry in merged], merged)
+
+    def remove_entries(self, entries):
+        entries = set(entries)
+        kept = [entry for entry in self.sorted[1] if entry not in entries]
+        self.sorted = ([entry[0] for entry in kept], kept)
+
+    def adjust(self, deltas):
+        """Add deltas (skill_id to change in listings) to the weights"""
+        for skill_id, delta in deltas.items():
+            self.weights[skill_id] = self.weights.get(skill_id, 0) + delta
+
+    def clear_memo(self):
+        self._memo = {}
+
+
+_index = None
+_stale = False
+_rebuilding = False
+_lock = threading.Lock()
+
+
+def build_index():
+    weights = {}
+    for through in (UserSkillHave, UserSkillWant):
+        for skill_id, count in through.objects.values_list('skill_id').annotate(count=Count('id')).order_by():
+            weights[skill_id] = weights.get(skill_id, 0) + count
+
+    names = {}
+    entries = []
+    for skill_id, name, normalized_name in Skill.objects.filter(id__in=list(weights)).values_list('id', 'name', 'normalized_name'):
+        names[skill_id] = name
+        entries.append((normalized_name, skill_id, name))
+    entries.extend(
+        (alias, skill_id, names[skill_id])
+        for skill_id, alias in SkillAlias.objects.filter(skill_id__in=list(weights)).values_list('skill_id', 'alias')
+    )
+    return PrefixIndex(entries, weights)
+
+
+def _rebuild():
+    global _index, _rebuilding
+    try:
+        index = build_index()
+        with _lock:
+            _index = index
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def _rebuild_in_background():
+    global _stale, _rebuilding
+    with _lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+        _stale = False
+    threading.Thread(target=_rebuild, name='skill-autocomplete', daemon=True).start()
+
+
+def get_index():
+    global _index
+    index = _index
+    if index is None:
+        with _lock:
+            # Another thread may have built it while this one waited
+            if _index is None:
+                _index = build_index()
+            return _index
+
+    if _stale or time.monotonic() - index.built_at >= TTL:
+        _rebuild_in_background()
+    return index
+
+
+def _update(change):
+    """Apply change(index) to the built index, if there is one"""
+    global _stale
+    with _lock:
+        if _index is None:
+            return
+        change(_index)
+        _index.clear_memo()
+        if _rebuilding:
+            # The index being built may have read the data before this change
+            _stale = True
+
+
+def skills_changed(deltas, skills):
+    """
+    A user's listings changed after commit: deltas maps skill_id to +1/-1,
+    skills are the Skill objects of the added ones.
+    """
+    def change(index):
+        known = set(index.sorted[1])
+        new = [skill for skill in skills if (skill.normalized_name, skill.id, skill.name) not in known]
+        if new:
+            entries = [(skill.normalized_name, skill.id, skill.name) for skill in new]
+            names = {skill.id: skill.name for skill in new}
+            entries.extend(
+                (alias, skill_id, names[skill_id])
+                for skill_id, alias in SkillAlias.objects.filter(skill_id__in=list(names)).values_list('skill_id', 'alias')
+            )
+            index.add_entries(entries)
+        index.adjust(deltas)
+
+    if deltas:
+        _update(change)
+
+
+def alias_added(alias):
+    _update(lambda index: index.add_entries([(alias.alias, alias.skill_id, alias.skill.name)]))
+
+
+def alias_removed(alias):
+    _update(lambda index: index.remove_entries([(alias.alias, alias.skill_id, alias.skill.name)]))
+
+
+def invalidate():
+    """Rebuild the index in the background, serving the current one meanwhile"""
+    global _stale
+    _stale = True
+
+
+def discard():
+    """Drop the index; the next lookup builds a new one before answering"""
+    global _index, _stale
+    with _lock:
+        _index = None
+        _stale = False
+
+
+def complete(prefix, limit=10):
+    """Skills starting with the normalized prefix, most listed first"""
+    return get_index().complete(prefix, limit)
@@ -0,0 +1,238 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Supports zstd and brotli when the zstandard / brotli packages are
+installed, and gzip always. RESPONSE_COMPRESSION_LEVELS sets the level of
+each encoding and, by its order, which one wins when the client accepts
+several equally; leave an encoding out to disable it. Responses smaller
+than RESPONSE_COMPRESSION_MIN_SIZE bytes are sent as they are, since the
+saving would not pay for the CPU. Streaming responses are compressed
+chunk by chunk and flushed after each chunk, so clients still receive
+every chunk as soon as it is produced.
+
+Like Django's GZipMiddleware this does nothing against BREACH; API
+responses do not carry CSRF tokens or other secrets next to reflected
+input.
+
+For every endpoint and encoding the middleware counts responses, bytes
+before and after and the CPU time spent compressing; stats() returns them.
+"""
+import re
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/([\w.+-]+\+)?(json|x-ndjson|xml|javascript)\b)')
+ACCEPT_ENCODING_RE = re.compile(r'^\s*([\w*-]+)\s*(?:;\s*q\s*=\s*([\d.]+))?\s*$')
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+def available_encoders():
+    """Content-Encoding name -> encoder class, for the libraries installed"""
+    encoders = {'gzip': GzipEncoder}
+    if brotli is not None:
+        encoders['br'] = BrotliEncoder
+    if zstandard is not None:
+        encoders['zstd'] = ZstdEncoder
+    return encoders
+
+
+def negotiate(accept_encoding, preference):
+    """
+    The encoding from preference (most preferred first) that the client
+    ranks highest in its Accept-Encoding header, or None.
+    """
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        match = ACCEPT_ENCODING_RE.match(part)
+        if not match:
+            continue
+        try:
+            weights[match.group(1).lower()] = float(match.group(2) or 1)
+        except ValueError:
+            continue
+
+    best, best_weight = None, 0
+    for encoding in preference:
+        weight = weights.get(encoding, weights.get('*', 0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(endpoint, encoding, bytes_in, bytes_out, cpu_seconds):
+    with _stats_lock:
+        row = _stats.setdefault((endpoint, encoding), [0, 0, 0, 0.0])
+        row[0] += 1
+        row[1] += bytes_in
+        row[2] += bytes_out
+        row[3] += cpu_seconds
+
+
+def stats():
+    """Per endpoint and encoding totals since the process started, largest first"""
+    with _stats_lock:
+        rows = [(key, list(values)) for key, values in _stats.items()]
+
+    return sorted((
+        {
+            'endpoint': endpoint,
+            'encoding': encoding,
+            'responses': responses,
+            'bytes_in': bytes_in,
+            'bytes_out': bytes_out,
+            'ratio': round(bytes_in / bytes_out, 2) if bytes_out else None,
+            'cpu_ms': round(cpu * 1000, 3),
+            'cpu_ms_per_response': round(cpu * 1000 / responses, 3),
+        }
+        for (endpoint, encoding), (responses, bytes_in, bytes_out, cpu) in rows
+    ), key=lambda row: -row['bytes_in'])
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = settings.RESPONSE_COMPRESSION_MIN_SIZE
+        encoders = available_encoders()
+        self.levels = {
+            encoding: level
+            for encoding, level in settings.RESPONSE_COMPRESSION_LEVELS.items()
+            if encoding in encoders
+        }
+        self.encoders = encoders
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if (
+            response.has_header('Content-Encoding')
+            or not COMPRESSIBLE_TYPES.match(response.get('Content-Type', ''))
+            or (not response.streaming and len(response.content) < self.min_size)
+        ):
+            return response
+
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING'), self.levels)
+        if encoding is None:
+            return response
+
+        encoder = self.encoders[encoding](self.levels[encoding])
+        match = getattr(request, 'resolver_match', None)
+        endpoint = '/' + match.route if match else '<unmatched>'
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.compress_async(response.streaming_content, encoder, endpoint, encoding)
+            else:
+                response.streaming_content = self.compress_stream(response.streaming_content, encoder, endpoint, encoding)
+            del response.headers['Content-Length']
+        else:
+            start = time.thread_time()
+            compressed = encoder.compress(response.content) + encoder.finish()
+            record(endpoint, encoding, len(response.content), len(compressed), time.thread_time() - start)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The bytes changed, so a strong ETag no longer applies
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def _compress_chunk(encoder, chunk, totals):
+        start = time.thread_time()
+        out = encoder.compress(chunk) + encoder.flush()
+        totals[0] += len(chunk)
+        totals[1] += len(out)
+        totals[2] += time.thread_time() - start
+        return out
+
+    @staticmethod
+    def _finish(encoder, totals, endpoint, encoding):
+        start = time.thread_time()
+        out = encoder.finish()
+        record(endpoint, encoding, totals[0], totals[1] + len(out), totals[2] + time.thread_time() - start)
+        return out
+
+    def compress_stream(self, chunks, encoder, endpoint, encoding):
+        totals = [0, 0, 0.0]
+        for chunk in chunks:
+            out = self._compress_chunk(encoder, chunk, totals)
+            if out:
+                yield out
+        yield self._finish(encoder, totals, endpoint, encoding)
+
+    async def compress_async(self, chunks, encoder, endpoint, encoding):
+        totals = [0, 0, 0.0]
+        async for chunk in chunks:
+            out = self._compress_chunk(encoder, chunk, totals)
+            if out:
+                yield out
+        yield self._finish(encoder, totals, endpoint, encoding)
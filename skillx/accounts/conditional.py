@@ -0,0 +1,63 @@
+"""
+Conditional GET for the per-user read endpoints.
+
+Every change to a user's own data publishes a ChangeEvent for that user
+(accounts.events). The id of the user's latest event is therefore a
+version of that data, cheap to look up through the (user, id) index.
+
+The lists also show other users' profiles: everyone the user has a
+connection request with, either way, and their conversation partners.
+Rather than publishing an event to each of them, a profile change or an
+account deletion bumps their User.partners_version (events.notify()),
+which is read from the user's own row.
+
+Together they become a weak ETag. When the client's If-None-Match still
+matches, the view is not run at all: the response is a bare 304 after
+that one query. No Last-Modified is sent: at one second resolution it
+would call two changes in the same second unchanged.
+"""
+from functools import wraps
+
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from rest_framework.views import APIView
+
+from .models import ChangeEvent, ChangeEventFloor, User
+
+
+def user_version(user_id):
+    """Version of everything user_id can see, in one query"""
+    row = User.objects.filter(id=user_id).annotate(
+        latest_id=Subquery(ChangeEvent.objects.filter(user_id=OuterRef('id')).order_by('-id').values('id')[:1]),
+        floor=Subquery(ChangeEventFloor.objects.values('pruned_through')[:1]),
+    ).values_list('latest_id', 'floor', 'partners_version').first()
+
+    latest_id, floor, partners_version = row or (None, None, 0)
+    # After pruning removed all of a user's events, stay above every id
+    # they were ever given instead of falling back to an earlier version
+    return f'{max(latest_id or 0, floor or 0)}.{partners_version}'
+
+
+def conditional_get(view):
+    """
+    Decorator for GET handlers (APIView methods or @api_view functions)
+    whose response depends only on the requesting user's data.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[1] if isinstance(args[0], APIView) else args[0]
+
+        etag = f'W/"{request.user.id}-{user_version(request.user.id)}"'
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = view(*args, **kwargs)
+            if response.status_code == 200:
+                response['ETag'] = etag
+
+        # Responses differ per user, and must be revalidated before reuse
+        patch_vary_headers(response, ['Authorization'])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,32 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .events import user_group
+
+
+class UserEventsConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Streams the authenticated user's events (new messages, read receipts,
+    deletions, connection changes) as {"type": ..., "data": ...} frames.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Clients only listen; answer keep-alive pings
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def user_event(self, event):
+        await self.send_json({'type': event['event'], 'data': event['payload']})
@@ -2,24 +2,52 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.response import Response
-from .models import User, Message
+from django.db.models import F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Substr
+from .archive import reaches_archive
+from .conditional import conditional_get
+from .models import ArchivedMessage, Conversation, Message
+from .pagination import decode_cursor, encode_cursor, get_page_number, get_page_size
+from .querybudget import query_budget
+from .scoping import owned, owns
 
+# Number of characters of the last message returned in summary mode
+PREVIEW_LENGTH = 100
+
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+
+def _truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+@owns(Message, ArchivedMessage, Conversation)
+@query_budget(3)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@conditional_get
 def get_conversations(request):
     """
     Get all conversations for authenticated user
+
+    Pass ?summary=true to get one paginated row per conversation partner
+    (last message preview, unread count, partner profile) instead of the
+    full message history.
     """
+    if _truthy(request.query_params.get('summary')):
+        return get_conversation_summaries(request)
+
     try:
         user = request.user
         conversations = []
         
         # Get all messages where user is sender or receiver
-        sent_messages = Message.objects.filter(sender=user).order_by('timestamp')
-        received_messages = Message.objects.filter(receiver=user).order_by('timestamp')
+        messages = owned(request, Message).select_related('sender', 'receiver')
+        archived_messages = owned(request, ArchivedMessage).select_related('sender', 'receiver')
         
         # Combine and sort messages chronologically (oldest first)
-        all_messages = list(sent_messages) + list(received_messages)
+        all_messages = list(messages) + list(archived_messages)
         all_messages.sort(key=lambda x: x.timestamp)
         
         # Group messages by conversation (other user)
@@ -77,3 +105,168 @@ def get_conversations(request):
             {'error': str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+def get_conversation_summaries(request):
+    """
+    One row per conversation partner, newest activity first.
+
+    Served from the denormalized Conversation table in a single indexed
+    query, so the cost depends on page_size rather than on the user's
+    message volume.
+    """
+    try:
+        page = get_page_number(request)
+        page_size = get_page_size(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = request.user
+        offset = (page - 1) * page_size
+        # Conversations whose hot messages were all deleted show their
+        # newest archived one, see ConversationManager.refresh_last_message
+        last_archived = owned(request, ArchivedMessage).filter(
+            Q(sender_id=OuterRef('user_low_id'), receiver_id=OuterRef('user_high_id')) |
+            Q(sender_id=OuterRef('user_high_id'), receiver_id=OuterRef('user_low_id'))
+        ).order_by('-timestamp', '-id')
+
+        conversations = list(
+            owned(request, Conversation)
+            .select_related('user_low', 'user_high')
+            .annotate(
+                last_message_preview=Coalesce(
+                    Substr('last_message__content', 1, PREVIEW_LENGTH),
+                    Substr(Subquery(last_archived.values('content')[:1]), 1, PREVIEW_LENGTH),
+                ),
+                last_message_sender_id=Coalesce(
+                    F('last_message__sender_id'),
+                    Subquery(last_archived.values('sender_id')[:1]),
+                    output_field=IntegerField(),
+                ),
+            )
+            .order_by('-last_activity', '-id')
+            [offset:offset + page_size + 1]
+        )
+        has_next = len(conversations) > page_size
+        conversations = conversations[:page_size]
+
+        conversations_list = []
+        for conversation in conversations:
+            other_user = conversation.other_user(user)
+            conversations_list.append({
+                'id': conversation.id,
+                'other_user_id': other_user.id,
+                'other_user_username': other_user.username,
+                'other_user_email': other_user.email,
+                'other_user_skills': other_user.skills_have,
+                'last_message_id': conversation.last_message_id,
+                'last_message': conversation.last_message_preview or '',
+                'last_message_is_from_me': conversation.last_message_sender_id == user.id,
+                'last_message_timestamp': conversation.last_activity.isoformat(),
+                'unread_count': conversation.unread_count_for(user),
+            })
+
+        return Response({
+            'results': conversations_list,
+            'page': page,
+            'page_size': page_size,
+            'has_next': has_next,
+        })
+
+    except Exception as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@owns(Message, ArchivedMessage)
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_conversation_messages(request, user_id):
+    """
+    Page through the messages exchanged with one user.
+
+    Uses keyset pagination on (timestamp, id): ?before=<cursor> returns the
+    page just older than the cursor, ?after=<cursor> the page just newer,
+    and no cursor returns the most recent page. Results are always in
+    chronological order.
+    """
+    before = request.query_params.get('before')
+    after = request.query_params.get('after')
+    if before and after:
+        return Response({'error': 'Use either before or after, not both'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        page_size = get_page_size(request, default=MESSAGE_PAGE_SIZE, maximum=MAX_MESSAGE_PAGE_SIZE)
+        cursor = decode_cursor(before or after) if (before or after) else None
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+
+    def thread_page(model):
+        messages = owned(request, model).filter(
+            Q(sender=user, receiver_id=user_id) |
+            Q(sender_id=user_id, receiver=user)
+        )
+
+        if after:
+            timestamp, pk = cursor
+            messages = messages.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            ).order_by('timestamp', 'id')
+        else:
+            if before:
+                timestamp, pk = cursor
+                messages = messages.filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+                )
+            messages = messages.order_by('-timestamp', '-id')
+
+        return list(messages.values('id', 'content', 'timestamp', 'sender_id', 'is_read')[:page_size + 1])
+
+    page = thread_page(Message)
+
+    # Archived messages are all older than the archive cutoff, so the
+    # archive is only read when this page reaches past it
+    if after:
+        needs_archive = reaches_archive(cursor[0])
+    else:
+        needs_archive = len(page) <= page_size or reaches_archive(page[-1]['timestamp'])
+    if needs_archive:
+        page = sorted(
+            page + thread_page(ArchivedMessage),
+            key=lambda message: (message['timestamp'], message['id']),
+            reverse=not after,
+        )[:page_size + 1]
+
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    if not after:
+        page.reverse()
+
+    results = [{
+        'id': message['id'],
+        'content': message['content'],
+        'timestamp': message['timestamp'].isoformat(),
+        'sender_id': message['sender_id'],
+        'is_from_me': message['sender_id'] == user.id,
+        'is_read': message['is_read'],
+    } for message in page]
+
+    if page:
+        older_cursor = encode_cursor(page[0]['timestamp'], page[0]['id'])
+        newer_cursor = encode_cursor(page[-1]['timestamp'], page[-1]['id'])
+    else:
+        older_cursor = newer_cursor = before or after
+
+    return Response({
+        'results': results,
+        'older_cursor': older_cursor,
+        'newer_cursor': newer_cursor,
+        'has_older': has_more if not after else True,
+        'has_newer': has_more if after else bool(before),
+    })
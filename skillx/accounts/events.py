@@ -0,0 +1,179 @@
+"""
+Change notifications for everything that affects a user's view of the app.
+
+Views call publish() inside their write transaction. It records one
+ChangeEvent row per affected user (read by the sync endpoint) and, once
+the transaction commits, hands the event to the channel layer so
+connected WebSocket clients (accounts.consumers.UserEventsConsumer) and
+waiting long-poll requests hear about it immediately. Rolled-back
+changes are never announced.
+
+Sync cursors rely on each user's events committing in id order, so
+writers to the same user must not overlap. Transactions that publish
+start with lock_users() on everyone they will publish to, before any
+other write: rows inserted later (messages, connection requests) check
+their foreign keys against those users, and InnoDB takes shared locks on
+the referenced rows for that, which would deadlock with an exclusive
+lock taken afterwards.
+"""
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import ChangeEvent, ChangeEventFloor, ConnectionRequest, Conversation, User
+
+# Wakes up long-poll sync requests served by this process
+_changes = threading.Condition()
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def lock_users(user_ids):
+    """
+    Lock the users' rows, in id order, until the transaction ends; call it
+    before the transaction's first write. Returns the ids that exist.
+    """
+    return set(
+        User.objects.select_for_update()
+        .filter(id__in=sorted({int(user_id) for user_id in user_ids}))
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+
+
+def publish(user_ids, event_type, payload):
+    """Record event_type/payload for every user in user_ids and push it after commit"""
+    publish_many([(user_ids, event_type, payload)])
+
+
+def publish_many(events):
+    """
+    publish() for a list of (user_ids, event_type, payload) in two queries.
+    The users must have been locked with lock_users() first.
+    """
+    all_user_ids = {int(user_id) for user_ids, _, _ in events for user_id in user_ids}
+    # Users deleted since the caller looked them up get no events
+    existing = set(User.objects.filter(id__in=all_user_ids).values_list('id', flat=True))
+
+    deliveries = []
+    for user_ids, event_type, payload in events:
+        user_ids = sorted({int(user_id) for user_id in user_ids} & existing)
+        deliveries.append((user_ids, event_type, payload))
+
+    ChangeEvent.objects.bulk_create([
+        ChangeEvent(user_id=user_id, event_type=event_type, payload=payload)
+        for user_ids, event_type, payload in deliveries
+        for user_id in user_ids
+    ])
+
+    transaction.on_commit(lambda: _send(deliveries))
+
+
+def notify(user_ids, event_type, payload):
+    """
+    For changes to other users' profiles shown in user_ids' lists: after
+    commit, bump their partners_version, which their ETags include, and
+    push event_type/payload without recording a ChangeEvent.
+    """
+    user_ids = sorted({int(user_id) for user_id in user_ids})
+    deliveries = [(user_ids, event_type, payload)]
+
+    def send():
+        # After commit, in one statement, so the users' rows are not
+        # locked out of order inside the transaction (see lock_users)
+        if user_ids:
+            User.objects.filter(id__in=user_ids).update(partners_version=F('partners_version') + 1)
+        _send(deliveries)
+    transaction.on_commit(send)
+
+
+def changes_since(user_id, cursor, limit):
+    """Up to limit of the user's events after cursor, oldest first"""
+    return list(
+        ChangeEvent.objects.for_user(user_id).filter(id__gt=cursor)
+        .order_by('id')
+        .values('id', 'event_type', 'payload', 'created_at')[:limit]
+    )
+
+
+def cursor_floor():
+    """Cursors below this may have missed events that were pruned since"""
+    return ChangeEventFloor.objects.values_list('pruned_through', flat=True).first() or 0
+
+
+def current_cursor(user_id):
+    """Cursor a client should start syncing from after a full reload"""
+    latest = (
+        ChangeEvent.objects.for_user(user_id)
+        .order_by('-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+    return max(latest or 0, cursor_floor())
+
+
+def wait_for_changes(timeout):
+    """Block until an event is published in this process or timeout expires"""
+    with _changes:
+        _changes.wait(timeout)
+
+
+def _send(deliveries):
+    with _changes:
+        _changes.notify_all()
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    for user_ids, event_type, payload in deliveries:
+        for user_id in user_ids:
+            async_to_sync(channel_layer.group_send)(user_group(user_id), {
+                'type': 'user.event',
+                'event': event_type,
+                'payload': payload,
+            })
+
+
+def related_user_ids(user_id):
+    """
+    Users whose responses include user_id's profile: everyone they have a
+    connection request with, either way, and their conversation partners.
+    """
+    related = set()
+    requests = ConnectionRequest.objects.filter(
+        Q(sender_id=user_id) | Q(receiver_id=user_id)
+    ).values_list('sender_id', 'receiver_id')
+    conversations = Conversation.objects.for_user(user_id).values_list('user_low_id', 'user_high_id')
+    for pair in list(requests) + list(conversations):
+        related.update(pair)
+    related.discard(user_id)
+    return related
+
+
+def profile_payload(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'bio': user.bio,
+        'skills_have': user.skills_have,
+        'skills_want': user.skills_want,
+    }
+
+
+def message_payload(message):
+    # No content: events stay small and the body is stored once, in the
+    # message; clients fetch it from the conversation
+    return {
+        'id': message.id,
+        'sender_id': message.sender_id,
+        'receiver_id': message.receiver_id,
+        'timestamp': message.timestamp.isoformat(),
+        'is_read': message.is_read,
+    }
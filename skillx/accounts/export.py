@@ -0,0 +1,125 @@
+"""
+Personal data export: a user's profile, connection requests and messages
+(including archived ones), streamed as NDJSON or as a zip of JSON files.
+
+Rows are read in keyset chunks of chunk_size (id > last id, LIMIT n)
+rather than with QuerySet.iterator(), because the MySQL driver buffers a
+whole result set client side. Each chunk is encoded and handed to the
+response before the next one is read, so memory stays flat however long
+the history is.
+"""
+import io
+import zipfile
+
+from .events import profile_payload
+from .models import ArchivedMessage, ConnectionRequest, Message
+from .renderers import FastJSONRenderer
+
+CHUNK_SIZE = 1000
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'zip': ('application/zip', 'zip'),
+}
+
+_renderer = FastJSONRenderer()
+
+
+def dumps(data):
+    return _renderer.render(data)
+
+
+def chunked(queryset, chunk_size):
+    """Lists of up to chunk_size value dicts from queryset, in id order"""
+    last_id = None
+    while True:
+        page = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(page.order_by('id')[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1]['id']
+
+
+def profile(user):
+    return {**profile_payload(user), 'date_joined': user.date_joined}
+
+
+def connection_chunks(user, chunk_size):
+    return chunked(
+        ConnectionRequest.objects.for_user(user).values(
+            'id', 'sender_id', 'sender__username', 'receiver_id', 'receiver__username', 'status', 'created_at',
+        ),
+        chunk_size,
+    )
+
+
+def message_chunks(user, chunk_size):
+    """Hot messages, then archived ones, each row marked with 'archived'"""
+    fields = ('id', 'sender_id', 'receiver_id', 'content', 'timestamp', 'is_read')
+    for model, archived in ((Message, False), (ArchivedMessage, True)):
+        queryset = model.objects.for_user(user).values(*fields)
+        for rows in chunked(queryset, chunk_size):
+            yield [{**row, 'archived': archived} for row in rows]
+
+
+def sections(user, chunk_size):
+    return (
+        ('connections', connection_chunks(user, chunk_size)),
+        ('messages', message_chunks(user, chunk_size)),
+    )
+
+
+def stream_ndjson(user, chunk_size=CHUNK_SIZE):
+    """One {"type": ..., "data": {...}} line per record, one bytes chunk per query"""
+    yield dumps({'type': 'profile', 'data': profile(user)}) + b'\n'
+    for name, chunks in sections(user, chunk_size):
+        kind = name[:-1]
+        for rows in chunks:
+            yield b''.join(dumps({'type': kind, 'data': row}) + b'\n' for row in rows)
+
+
+class _Pipe(io.RawIOBase):
+    """Unseekable file that collects what zipfile writes until drained"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_zip(user, chunk_size=CHUNK_SIZE):
+    """profile.json, connections.json and messages.json, zipped on the fly"""
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('profile.json', dumps(profile(user)))
+        yield pipe.drain()
+
+        for name, chunks in sections(user, chunk_size):
+            with archive.open(f'{name}.json', 'w', force_zip64=True) as file:
+                file.write(b'[')
+                separator = b''
+                for rows in chunks:
+                    for row in rows:
+                        file.write(separator + dumps(row))
+                        separator = b','
+                    yield pipe.drain()
+                file.write(b']')
+            yield pipe.drain()
+    yield pipe.drain()
+
+
+def stream_export(user, export_format, chunk_size=CHUNK_SIZE):
+    stream = stream_zip if export_format == 'zip' else stream_ndjson
+    # Skip empty chunks, which would still cost a flush downstream
+    return filter(None, stream(user, chunk_size))
@@ -0,0 +1,99 @@
+"""
+Sparse fieldsets: ?fields=id,sender.username returns only those fields.
+
+Dotted names select fields of nested serializers; naming a nested
+serializer without a dot keeps all of its fields. Unknown names are
+ignored. Serializers opt in with SparseFieldsSerializerMixin, and views
+with SparseFieldsetMixin. The view mixin also narrows the queryset with
+select_related() and only() so that just the columns being rendered are
+loaded, in a single query.
+"""
+from rest_framework import serializers
+
+
+def parse_fields(raw):
+    """
+    Turn "id,sender.id,sender.username" into a tree of requested names,
+    {'id': None, 'sender': {'id': None, 'username': None}}, where None
+    means the whole field. Returns None (everything) when raw names nothing.
+    """
+    tree = {}
+    for path in (raw or '').split(','):
+        parts = [part.strip() for part in path.split('.')]
+        if not all(parts):
+            continue
+        node = tree
+        for part in parts[:-1]:
+            child = node.get(part, {})
+            if child is None:
+                # The whole of this field is already requested
+                break
+            node[part] = child
+            node = child
+        else:
+            node[parts[-1]] = None
+    return tree or None
+
+
+class SparseFieldsSerializerMixin:
+    """Drops the fields not named in context['fields'] (see parse_fields)"""
+
+    def _requested(self):
+        tree = self.context.get('fields')
+        if tree is None:
+            return None
+
+        # Field names from the root serializer down to this one
+        path = []
+        serializer = self
+        while serializer.parent is not None:
+            if not isinstance(serializer.parent, serializers.ListSerializer):
+                path.append(serializer.field_name)
+            serializer = serializer.parent
+        for name in reversed(path):
+            tree = tree.get(name)
+            if tree is None:
+                return None
+        return tree
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self._requested()
+        if requested is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in requested}
+
+    def projection(self, prefix=''):
+        """Model field paths the rendered fields read, for QuerySet.only()"""
+        paths = [prefix + self.Meta.model._meta.pk.name]
+        for field in self.fields.values():
+            if isinstance(field, SparseFieldsSerializerMixin):
+                # The relation itself has to be loaded to be followed
+                paths.append(f'{prefix}{field.source}')
+                paths.extend(field.projection(f'{prefix}{field.source}__'))
+            elif field.source != '*':
+                paths.append(prefix + field.source.replace('.', '__'))
+        return paths
+
+    def relations(self, prefix=''):
+        """Related fields to pass to QuerySet.select_related()"""
+        paths = []
+        for field in self.fields.values():
+            if isinstance(field, SparseFieldsSerializerMixin):
+                paths.append(f'{prefix}{field.source}')
+                paths.extend(field.relations(f'{prefix}{field.source}__'))
+        return paths
+
+
+class SparseFieldsetMixin:
+    """View helper: serialize with ?fields= applied and a projected queryset"""
+
+    def serialize(self, request, serializer_class, instance, many=False):
+        serializer = serializer_class(instance, many=many, context={
+            'request': request,
+            'fields': parse_fields(request.query_params.get('fields')),
+        })
+        if many and hasattr(instance, 'only'):
+            fields = serializer.child
+            serializer.instance = instance.select_related(*fields.relations()).only(*fields.projection())
+        return serializer
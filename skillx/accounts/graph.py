@@ -0,0 +1,210 @@
+"""
+In-process connection graph for mutual counts and friends-of-friends.
+
+Accepted ConnectionRequests are loaded once into a map of user id to the
+sorted numpy array of that user's connections. Mutual counts are an
+intersection of two sorted arrays and suggestions a count over the
+neighbours' arrays, so neither needs a self-join on ConnectionRequest.
+
+Views report changes with connection_added() / connection_removed() after
+their transaction commits. The change is applied to this process's graph,
+a version counter in the cache is bumped and the change is stored in the
+cache under the new version. Other processes notice that their copy is
+out of date and apply the changes they missed in order. They only reload
+the whole graph when some of those changes are no longer cached, or when
+they are more than CONNECTION_GRAPH_MAX_DELTAS versions behind.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ConnectionRequest
+
+VERSION_KEY = 'connection_graph:version'
+DELTA_KEY = 'connection_graph:delta:{}'
+# Long enough for an idle worker to catch up rather than reload
+DELTA_TIMEOUT = 24 * 60 * 60
+MAX_DELTAS = getattr(settings, 'CONNECTION_GRAPH_MAX_DELTAS', 1000)
+EMPTY = np.empty(0, dtype=np.int64)
+
+
+class ConnectionGraph:
+    def __init__(self, adjacency, version):
+        self.adjacency = adjacency
+        self.version = version
+
+    @classmethod
+    def from_edges(cls, edges, version):
+        """Build from an (n, 2) array of connected pairs, in any order and direction"""
+        edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+        both = np.unique(np.concatenate([edges, edges[:, ::-1]]), axis=0)
+        users, starts = np.unique(both[:, 0], return_index=True)
+        neighbours = np.split(both[:, 1], starts[1:]) if len(both) else []
+        return cls(dict(zip(users.tolist(), neighbours)), version)
+
+    def connections(self, user_id):
+        return self.adjacency.get(user_id, EMPTY)
+
+    def is_connected(self, user_id, other_id):
+        neighbours = self.connections(user_id)
+        i = np.searchsorted(neighbours, other_id)
+        return i < len(neighbours) and neighbours[i] == other_id
+
+    def mutual_count(self, user_id, other_id):
+        return len(np.intersect1d(self.connections(user_id), self.connections(other_id), assume_unique=True))
+
+    def suggestions(self, user_id, limit, exclude=()):
+        """
+        Up to limit (user_id, mutual_count) pairs for users two hops away,
+        most mutual connections first.
+        """
+        neighbours = self.connections(user_id)
+        if not len(neighbours):
+            return []
+
+        reachable = np.concatenate([self.connections(int(n)) for n in neighbours])
+        candidates, counts = np.unique(reachable, return_counts=True)
+        excluded = np.concatenate([neighbours, np.array([user_id, *exclude], dtype=np.int64)])
+        keep = ~np.isin(candidates, excluded)
+        candidates, counts = candidates[keep], counts[keep]
+
+        order = np.lexsort((candidates, -counts))[:limit]
+        return [(int(candidates[i]), int(counts[i])) for i in order]
+
+    # Updates replace the arrays instead of changing them in place, so
+    # concurrent readers always see a consistent array
+    def add(self, user_id, other_id):
+        for a, b in ((user_id, other_id), (other_id, user_id)):
+            neighbours = self.connections(a)
+            i = np.searchsorted(neighbours, b)
+            if i == len(neighbours) or neighbours[i] != b:
+                self.adjacency[a] = np.insert(neighbours, i, b)
+
+    def remove(self, user_id, other_id):
+        for a, b in ((user_id, other_id), (other_id, user_id)):
+            neighbours = self.connections(a)
+            i = np.searchsorted(neighbours, b)
+            if i < len(neighbours) and neighbours[i] == b:
+                self.adjacency[a] = np.delete(neighbours, i)
+
+    def drop(self, user_id):
+        """Remove user_id and all of their connections"""
+        for other_id in self.connections(user_id).tolist():
+            self.remove(user_id, other_id)
+        self.adjacency.pop(user_id, None)
+
+
+_graph = None
+_lock = threading.Lock()
+
+
+def _initial_version():
+    # Versions restart above any used before the counter was evicted, so
+    # deltas left from before are never mistaken for new ones
+    return int(time.time() * 1000000)
+
+
+def _cache_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def _bump_version():
+    cache.add(VERSION_KEY, _initial_version(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        # Evicted between add() and incr(), any new value forces a reload
+        version = _initial_version()
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def load_graph():
+    version = _cache_version()
+    edges = ConnectionRequest.objects.filter(status='accepted').values_list('sender_id', 'receiver_id')
+    return ConnectionGraph.from_edges(list(edges), version)
+
+
+def _apply(graph, delta):
+    action, user_id, other_id = delta
+    if action == 'add':
+        graph.add(user_id, other_id)
+    elif action == 'remove':
+        graph.remove(user_id, other_id)
+    else:
+        graph.drop(user_id)
+
+
+def _catch_up(graph, version):
+    """Apply the cached changes after graph.version up to version; False if any is missing"""
+    if version == graph.version:
+        return True
+    if not 0 < version - graph.version <= MAX_DELTAS:
+        return False
+
+    keys = [DELTA_KEY.format(v) for v in range(graph.version + 1, version + 1)]
+    deltas = cache.get_many(keys)
+    if len(deltas) < len(keys):
+        return False
+    for key in keys:
+        _apply(graph, deltas[key])
+    graph.version = version
+    return True
+
+
+def get_graph():
+    """This process's graph, brought up to date with other processes' changes"""
+    global _graph
+    version = _cache_version()
+    graph = _graph
+    if graph is not None and graph.version == version:
+        return graph
+
+    with _lock:
+        if _graph is not None and not _catch_up(_graph, version):
+            _graph = None
+        if _graph is None:
+            _graph = load_graph()
+        return _graph
+
+
+def _changed(delta):
+    global _graph
+    with _lock:
+        version = _bump_version()
+        cache.set(DELTA_KEY.format(version), delta, DELTA_TIMEOUT)
+        graph = _graph
+        if graph is not None and _catch_up(graph, version - 1):
+            _apply(graph, delta)
+            graph.version = version
+        else:
+            # Missed a change that is no longer cached, reload on next use
+            _graph = None
+
+
+def connection_added(user_id, other_id):
+    _changed(('add', user_id, other_id))
+
+
+def connection_removed(user_id, other_id):
+    _changed(('remove', user_id, other_id))
+
+
+def user_removed(user_id):
+    """A deleted user's connections are gone"""
+    _changed(('drop', user_id, None))
+
+
+def invalidate():
+    """Make every process reload the whole graph"""
+    global _graph
+    with _lock:
+        _bump_version()
+        _graph = None
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+
+from accounts.archive import archive_cutoff
+from accounts.models import ArchivedMessage, Conversation, Message
+
+
+class Command(BaseCommand):
+    help = (
+        'Move read messages older than MESSAGE_ARCHIVE_AFTER_DAYS into the '
+        'ArchivedMessage table, in chunks'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of messages moved per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Stop after moving this many messages',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        batch_size = options['batch_size']
+        limit = options['limit']
+
+        # Unread messages stay hot for the unread counters, and so does the
+        # last message of each conversation for the inbox preview
+        candidates = Message.objects.filter(
+            timestamp__lt=cutoff,
+            is_read=True,
+        ).exclude(
+            Exists(Conversation.objects.filter(last_message_id=OuterRef('pk')))
+        ).order_by('id')
+
+        moved = 0
+        while limit is None or moved < limit:
+            size = batch_size if limit is None else min(batch_size, limit - moved)
+            with transaction.atomic():
+                batch = list(
+                    candidates.select_for_update()
+                    .values('id', 'sender_id', 'receiver_id', 'content', 'timestamp', 'is_read')[:size]
+                )
+                if not batch:
+                    break
+
+                ArchivedMessage.objects.bulk_create(
+                    [ArchivedMessage(**row) for row in batch],
+                    ignore_conflicts=True,
+                )
+                Message.objects.filter(id__in=[row['id'] for row in batch]).delete()
+            moved += len(batch)
+            self.stdout.write(f'   Moved {moved} messages')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved} messages older than {cutoff:%Y-%m-%d} '
+            f'({settings.MESSAGE_ARCHIVE_AFTER_DAYS} days)'
+        ))
@@ -0,0 +1,98 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest, Least
+
+from accounts.models import ArchivedMessage, Conversation, Message
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Conversation table from existing messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of conversations written per INSERT (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        # One row per ordered user pair, aggregated by the database. Pairs
+        # whose hot messages were all deleted keep their archived history.
+        archived_pairs = (
+            ArchivedMessage.objects
+            .annotate(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+            .values('low', 'high')
+            .annotate(last_activity=Max('timestamp'))
+            .order_by()
+        )
+        pairs = (
+            Message.objects
+            .annotate(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+            .values('low', 'high')
+            .annotate(
+                last_activity=Max('timestamp'),
+                unread_low=Count('id', filter=Q(is_read=False, receiver_id__lt=F('sender_id'))),
+                unread_high=Count('id', filter=Q(is_read=False, receiver_id__gt=F('sender_id'))),
+            )
+            .order_by()
+        )
+
+        last_message = Message.objects.filter(
+            Q(sender_id=OuterRef('user_low_id'), receiver_id=OuterRef('user_high_id')) |
+            Q(sender_id=OuterRef('user_high_id'), receiver_id=OuterRef('user_low_id'))
+        ).order_by('-timestamp', '-id').values('id')[:1]
+
+        with transaction.atomic():
+            # Archived messages are older than the hot ones, so pairs with
+            # both take their activity and unread counts from the second pass
+            self.write_pairs(archived_pairs, batch_size)
+            written = self.write_pairs(pairs, batch_size)
+
+            Conversation.objects.update(last_message_id=Subquery(last_message))
+
+            # Conversations whose messages are all gone, archived ones included
+            archived = ArchivedMessage.objects.filter(
+                Q(sender_id=OuterRef('user_low_id'), receiver_id=OuterRef('user_high_id')) |
+                Q(sender_id=OuterRef('user_high_id'), receiver_id=OuterRef('user_low_id'))
+            )
+            removed, _ = Conversation.objects.filter(last_message__isnull=True).exclude(Exists(archived)).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {written} conversations, removed {removed} empty ones'
+        ))
+
+    def write_pairs(self, pairs, batch_size):
+        batch = []
+        written = 0
+        for pair in pairs.iterator(chunk_size=batch_size):
+            batch.append(Conversation(
+                user_low_id=pair['low'],
+                user_high_id=pair['high'],
+                last_activity=pair['last_activity'],
+                unread_low=pair.get('unread_low', 0),
+                unread_high=pair.get('unread_high', 0),
+            ))
+            if len(batch) >= batch_size:
+                written += self.write_batch(batch)
+                batch = []
+        if batch:
+            written += self.write_batch(batch)
+        return written
+
+    def write_batch(self, batch):
+        # MySQL upserts on any unique key and rejects an explicit target
+        unique_fields = None
+        if connection.features.supports_update_conflicts_with_target:
+            unique_fields = ['user_low', 'user_high']
+
+        Conversation.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=['last_activity', 'unread_low', 'unread_high'],
+        )
+        return len(batch)
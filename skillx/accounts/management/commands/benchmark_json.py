@@ -0,0 +1,91 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import ConnectionRequest, User
+from accounts.renderers import FastJSONRenderer, orjson
+from accounts.serializers import ConnectionRequestSerializer, UserSerializer
+
+
+def make_users(count):
+    return [
+        User(
+            id=i,
+            username=f'user{i}',
+            email=f'user{i}@example.com',
+            bio='Enseño guitarra y aprendo Python — 🎸 & 🐍',
+            skills_have='Python, Django, React',
+            skills_want='Machine Learning, Rust',
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def make_payloads(rows):
+    """Payloads shaped like the user list, my-connections and the inbox"""
+    users = make_users(rows + 1)
+    now = timezone.now()
+
+    connections = [
+        ConnectionRequest(id=i, sender=users[0], receiver=user, status='accepted', created_at=now - timedelta(days=i))
+        for i, user in enumerate(users[1:], start=1)
+    ]
+
+    conversations = {
+        'results': [{
+            'id': user.id,
+            'other_user_id': user.id,
+            'other_user_username': user.username,
+            'other_user_email': user.email,
+            'other_user_skills': user.skills_have,
+            'last_message_id': user.id * 10,
+            'last_message': 'See you at 5? We can go over the serializer changes then.',
+            'last_message_is_from_me': user.id % 2 == 0,
+            'last_message_timestamp': now - timedelta(minutes=user.id),
+            'unread_count': user.id % 3,
+        } for user in users[1:]],
+        'page': 1,
+        'page_size': rows,
+        'has_next': False,
+        'unread_by_sender': {user.id: user.id % 3 for user in users[1:]},
+    }
+
+    return {
+        'users': UserSerializer(users[1:], many=True).data,
+        'connections': ConnectionRequestSerializer(connections, many=True).data,
+        'conversations': conversations,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare FastJSONRenderer with DRF\'s JSONRenderer on realistic API payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Rows per payload (default: 1000)')
+        parser.add_argument('--repeat', type=int, default=50, help='Renders per measurement (default: 50)')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed, FastJSONRenderer falls back to DRF'))
+
+        renderers = {'drf': JSONRenderer(), 'fast': FastJSONRenderer()}
+        repeat = options['repeat']
+
+        self.stdout.write(f'{"payload":<14}{"drf ms":>10}{"fast ms":>10}{"speedup":>9}{"bytes":>10}  identical')
+        for name, data in make_payloads(options['rows']).items():
+            timings = {}
+            outputs = {}
+            for key, renderer in renderers.items():
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    outputs[key] = renderer.render(data)
+                timings[key] = (time.perf_counter() - start) / repeat * 1000
+
+            self.stdout.write(
+                f'{name:<14}{timings["drf"]:>10.2f}{timings["fast"]:>10.2f}'
+                f'{timings["drf"] / timings["fast"]:>8.1f}x{len(outputs["fast"]):>10}  '
+                f'{"yes" if outputs["drf"] == outputs["fast"] else "NO"}'
+            )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from accounts.query_plans import HOT_QUERIES, explain, is_full_scan
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot API queries and fail if any of them does a full table scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, help='User to build the queries for (default: first user)')
+        parser.add_argument('--other-id', type=int, help='Counterpart user (default: second user)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the plan of every query')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        try:
+            user = users.get(id=options['user_id']) if options['user_id'] else users[0]
+            other = users.get(id=options['other_id']) if options['other_id'] else users.exclude(id=user.id)[0]
+        except (User.DoesNotExist, IndexError):
+            raise CommandError('Need two users in the database to build the queries')
+
+        failures = []
+        for name, build in HOT_QUERIES.items():
+            plan = explain(build(user, other))
+            full_scan = is_full_scan(plan)
+            if full_scan:
+                failures.append(name)
+
+            if full_scan or options['verbose_plans']:
+                style = self.style.ERROR if full_scan else self.style.SUCCESS
+                self.stdout.write(style(f"{'FULL SCAN' if full_scan else 'ok'}: {name}"))
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+
+        if failures:
+            raise CommandError(f"Full table scan in: {', '.join(failures)}")
+
+        self.stdout.write(self.style.SUCCESS(f'All {len(HOT_QUERIES)} hot queries use an index'))
@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.export import CHUNK_SIZE, FORMATS, stream_export
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Write a user\'s profile, connection requests and messages as NDJSON or a zip of JSON files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('user', help='Username or id of the user to export')
+        parser.add_argument('--format', choices=list(FORMATS), default='ndjson', help='Output format (default: ndjson)')
+        parser.add_argument('--output', default='-', help='File to write, or - for stdout (default: -)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows read per query (default: {CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        lookup = {'id': options['user']} if options['user'].isdigit() else {'username': options['user']}
+        try:
+            user = User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]} not found')
+
+        output = options['output']
+        out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            written = 0
+            for chunk in stream_export(user, options['format'], options['chunk_size']):
+                out.write(chunk)
+                written += len(chunk)
+            out.flush()
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'Exported {user.username} to {output} ({written} bytes)'))
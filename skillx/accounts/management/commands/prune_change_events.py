@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import BigIntegerField, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from accounts.models import ChangeEvent, ChangeEventFloor
+
+
+class Command(BaseCommand):
+    help = 'Delete sync change events older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CHANGE_EVENT_RETENTION_DAYS,
+            help='Keep events from the last N days (default: CHANGE_EVENT_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of events deleted per query (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+
+        deleted = 0
+        while True:
+            # Ids are monotonic, so walk from the oldest event forward
+            ids = list(
+                ChangeEvent.objects.filter(created_at__lt=cutoff)
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                # Raised with the delete, so no cursor can miss these events
+                # without being told to reset
+                floor, _ = ChangeEventFloor.objects.get_or_create(pk=1)
+                ChangeEventFloor.objects.filter(pk=floor.pk).update(pruned_through=Greatest('pruned_through', Value(ids[-1], output_field=BigIntegerField())))
+                ChangeEvent.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change events older than {cutoff:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from accounts.search import rebuild_index, uses_fulltext
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the MessageToken search index (not needed on MySQL, which uses FULLTEXT)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of messages indexed per INSERT (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if uses_fulltext():
+            self.stdout.write('Message search uses the database FULLTEXT index, nothing to rebuild')
+            return
+
+        indexed = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} messages'))
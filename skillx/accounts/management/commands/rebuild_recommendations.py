@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from accounts.recommendations import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute every user\'s complementary skill-match recommendations'
+
+    def handle(self, *args, **options):
+        users = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt recommendations for {users} users'))
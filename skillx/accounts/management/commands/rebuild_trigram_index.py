@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts.trigrams import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the trigram index behind fuzzy user and skill search'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of users or skills indexed per INSERT (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        users, skills = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {users} users and {skills} skills'))
@@ -0,0 +1,308 @@
+"""
+Request metrics in the Prometheus text format, served at /metrics.
+
+MetricsMiddleware times each request and counts its SQL queries and
+query time through connection.execute_wrapper(), then adds them, the
+status code and the response size to this process's Registry under the
+resolved URL name. It only does a few dict updates per request.
+
+With several worker processes (gunicorn), set METRICS_DIR to a directory
+shared by the workers and emptied when the service starts. Every process
+then writes its totals to its own file there, at most every
+METRICS_FLUSH_INTERVAL seconds, and /metrics adds up all the files, so
+the numbers cover every worker whichever one answers the scrape.
+Without METRICS_DIR, /metrics reports the answering process only.
+
+The compression (accounts.compression) and audit log (accounts.audit)
+totals are reported and aggregated the same way.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from . import audit, compression
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+COUNTERS = {
+    'skillx_http_requests_total': 'Requests handled, by URL name, method and status code.',
+    'skillx_http_response_bytes_total': 'Response body bytes sent, after compression.',
+    'skillx_db_query_seconds_total': 'Time spent in SQL queries.',
+    'skillx_compression_responses_total': 'Responses compressed, by endpoint and encoding.',
+    'skillx_compression_bytes_in_total': 'Bytes before compression.',
+    'skillx_compression_bytes_out_total': 'Bytes after compression.',
+    'skillx_compression_cpu_seconds_total': 'CPU time spent compressing.',
+    'skillx_audit_records_total': 'Audit records by outcome.',
+}
+GAUGES = {
+    'skillx_audit_queue_length': 'Audit records waiting to be written.',
+}
+HISTOGRAMS = {
+    'skillx_http_request_duration_seconds': ('Time to produce the response.', LATENCY_BUCKETS),
+    'skillx_db_queries_per_request': ('SQL queries run per request.', QUERY_BUCKETS),
+}
+
+
+class Registry:
+    """Counters and histograms of one process, keyed by (metric, labels)"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        key = (name, labels)
+        with self.lock:
+            # One count per bucket plus +Inf, then sum and count
+            row = self.histograms.get(key)
+            if row is None:
+                row = self.histograms[key] = [0] * (len(buckets) + 3)
+            row[bisect_left(buckets, value)] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def dump(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(row)] for (name, labels), row in self.histograms.items()],
+            }
+
+    def merge(self, data):
+        with self.lock:
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, row in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                if key in self.histograms:
+                    self.histograms[key] = [a + b for a, b in zip(self.histograms[key], row)]
+                else:
+                    self.histograms[key] = list(row)
+
+
+registry = Registry()
+_flushed_at = 0.0
+_flush_lock = threading.Lock()
+# Tells this process's file from one left by a dead worker with the same pid
+_started_at = int(time.time() * 1000)
+
+
+def _forked():
+    """
+    Start a worker forked from a master that imported this module (gunicorn
+    --preload) with its own totals, locks and file, not copies of the master's.
+    """
+    global registry, _flushed_at, _flush_lock, _started_at
+    registry = Registry()
+    _flushed_at = 0.0
+    _flush_lock = threading.Lock()
+    _started_at = int(time.time() * 1000)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forked)
+
+
+def file_name():
+    """This process's file in METRICS_DIR"""
+    return f'{os.getpid()}-{_started_at}.json'
+
+
+def snapshot():
+    """This process's registry plus its compression and audit log totals"""
+    data = registry.dump()
+    counters = data['counters']
+    for row in compression.stats():
+        labels = [['endpoint', row['endpoint']], ['encoding', row['encoding']]]
+        counters += [
+            ['skillx_compression_responses_total', labels, row['responses']],
+            ['skillx_compression_bytes_in_total', labels, row['bytes_in']],
+            ['skillx_compression_bytes_out_total', labels, row['bytes_out']],
+            ['skillx_compression_cpu_seconds_total', labels, row['cpu_ms'] / 1000],
+        ]
+    audit_stats = audit.get_audit_log().stats()
+    for outcome in ('written', 'dropped', 'failed'):
+        counters.append(['skillx_audit_records_total', [['outcome', outcome]], audit_stats[outcome]])
+    counters.append(['skillx_audit_queue_length', [], audit_stats['queued']])
+    return data
+
+
+def flush(force=False):
+    """Write this process's totals to its file in METRICS_DIR, if configured"""
+    global _flushed_at
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    with _flush_lock:
+        now = time.monotonic()
+        if not force and now - _flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        _flushed_at = now
+
+        path = os.path.join(directory, file_name())
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(snapshot(), file)
+        os.replace(temporary, path)
+
+
+# Keep the last requests of a worker that is shutting down
+atexit.register(flush, force=True)
+
+
+def collect():
+    """Totals over every process that reports to METRICS_DIR, or this one"""
+    combined = Registry()
+    if not settings.METRICS_DIR:
+        combined.merge(snapshot())
+        return combined
+
+    flush(force=True)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.json')):
+        try:
+            with open(path) as file:
+                combined.merge(json.load(file))
+        except (OSError, ValueError):
+            # Being replaced or left half written by a dead worker
+            continue
+    return combined
+
+
+class QueryTimer:
+    """execute_wrapper that counts queries and adds up their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        labels = (('view', match.view_name if match else '<unresolved>'),)
+
+        def finish(sent):
+            registry.inc('skillx_http_requests_total', labels + (('method', request.method), ('status', str(response.status_code))))
+            registry.observe('skillx_http_request_duration_seconds', labels, time.perf_counter() - start)
+            registry.observe('skillx_db_queries_per_request', labels, timer.count)
+            registry.inc('skillx_db_query_seconds_total', labels, timer.seconds)
+            registry.inc('skillx_http_response_bytes_total', labels, sent)
+            flush()
+
+        if not response.streaming:
+            finish(len(response.content))
+        elif response.is_async:
+            response.streaming_content = self.measure_async(response.streaming_content, finish)
+        else:
+            # Streamed bodies run their queries while being sent
+            response.streaming_content = self.measure_stream(response.streaming_content, timer, finish)
+        return response
+
+    @staticmethod
+    def measure_stream(chunks, timer, finish):
+        sent = 0
+        try:
+            with connection.execute_wrapper(timer):
+                for chunk in chunks:
+                    sent += len(chunk)
+                    yield chunk
+        finally:
+            finish(sent)
+
+    @staticmethod
+    async def measure_async(chunks, finish):
+        sent = 0
+        try:
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        finally:
+            finish(sent)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(source):
+    lines = []
+    for kind, metrics in (('counter', COUNTERS), ('gauge', GAUGES)):
+        for name, help_text in metrics.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            for (metric, labels), value in sorted(source.counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (metric, labels), row in sorted(source.histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], row):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(row[-2])}')
+            lines.append(f'{name}_count{_labels(labels)} {row[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape target for "Authorization: Bearer <METRICS_TOKEN>",
+    and for METRICS_ALLOWED_IPS if any are listed. Closed when neither is set.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = bool(token) and constant_time_compare(authorization, f'Bearer {token}')
+    if not allowed and settings.METRICS_ALLOWED_IPS:
+        allowed = request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        return HttpResponse(status=403)
+
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
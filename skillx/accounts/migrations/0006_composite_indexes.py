@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='connectionrequest',
+            index=models.Index(fields=['receiver', 'status'], name='connreq_receiver_status'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionrequest',
+            index=models.Index(fields=['sender', 'status'], name='connreq_sender_status'),
+        ),
+        migrations.AddIndex(
+            model_name='connectionrequest',
+            index=models.Index(fields=['sender', 'receiver'], name='connreq_pair'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_pair_timestamp'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['receiver', 'is_read', 'sender'], name='message_receiver_unread'),
+        ),
+    ]
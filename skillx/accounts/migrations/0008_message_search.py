@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    # MySQL serves message search from a FULLTEXT index, other databases
+    # use the MessageToken table
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('CREATE FULLTEXT INDEX message_content_fulltext ON accounts_message (content)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX message_content_fulltext ON accounts_message')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_archivedmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('count', models.PositiveIntegerField(default=1)),
+                ('message', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.message')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('token', 'message'), name='unique_message_token')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
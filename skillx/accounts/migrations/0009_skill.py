@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_message_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Skill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('normalized_name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SkillAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(max_length=100, unique=True)),
+                ('skill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='accounts.skill')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserSkillHave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.skill')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='have_skills',
+            field=models.ManyToManyField(blank=True, related_name='users_having', through='accounts.UserSkillHave', to='accounts.skill'),
+        ),
+        migrations.CreateModel(
+            name='UserSkillWant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.skill')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='want_skills',
+            field=models.ManyToManyField(blank=True, related_name='users_wanting', through='accounts.UserSkillWant', to='accounts.skill'),
+        ),
+        migrations.AddIndex(
+            model_name='userskillhave',
+            index=models.Index(fields=['skill', 'user'], name='skill_have_lookup'),
+        ),
+        migrations.AddConstraint(
+            model_name='userskillhave',
+            constraint=models.UniqueConstraint(fields=('user', 'skill'), name='unique_user_skill_have'),
+        ),
+        migrations.AddIndex(
+            model_name='userskillwant',
+            index=models.Index(fields=['skill', 'user'], name='skill_want_lookup'),
+        ),
+        migrations.AddConstraint(
+            model_name='userskillwant',
+            constraint=models.UniqueConstraint(fields=('user', 'skill'), name='unique_user_skill_want'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:03
+
+import re
+
+from django.db import migrations
+
+
+def normalize(name):
+    return re.sub(r'\s+', ' ', name).strip().lower()[:100]
+
+
+def migrate_skill_strings(apps, schema_editor):
+    User = apps.get_model('accounts', 'User')
+    Skill = apps.get_model('accounts', 'Skill')
+    UserSkillHave = apps.get_model('accounts', 'UserSkillHave')
+    UserSkillWant = apps.get_model('accounts', 'UserSkillWant')
+
+    skills = {skill.normalized_name: skill for skill in Skill.objects.all()}
+    have_rows, want_rows = [], []
+
+    users = User.objects.only('id', 'skills_have', 'skills_want').iterator(chunk_size=1000)
+    for user in users:
+        for text, rows, through in (
+            (user.skills_have, have_rows, UserSkillHave),
+            (user.skills_want, want_rows, UserSkillWant),
+        ):
+            seen = set()
+            for name in (text or '').split(','):
+                name = re.sub(r'\s+', ' ', name).strip()[:100]
+                key = normalize(name)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                if key not in skills:
+                    skills[key] = Skill.objects.create(name=name, normalized_name=key)
+                rows.append(through(user_id=user.id, skill_id=skills[key].id))
+
+    UserSkillHave.objects.bulk_create(have_rows, batch_size=1000, ignore_conflicts=True)
+    UserSkillWant.objects.bulk_create(want_rows, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_skill'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrate_skill_strings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_migrate_skill_strings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkillMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skill_matches', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-score'], name='skill_match_ranking')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'candidate'), name='unique_skill_match')],
+            },
+        ),
+    ]
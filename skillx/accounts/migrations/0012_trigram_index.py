@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_skillmatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkillTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('size', models.PositiveSmallIntegerField()),
+                ('skill', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.skill')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'skill'), name='unique_skill_trigram')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('size', models.PositiveSmallIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('trigram', 'user'), name='unique_user_trigram')],
+            },
+        ),
+    ]
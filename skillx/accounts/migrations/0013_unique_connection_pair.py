@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:12
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def dedupe_connection_requests(apps, schema_editor):
+    """
+    Keep one request per pair of users before the constraint is added: an
+    accepted one if there is any, otherwise the oldest.
+    """
+    ConnectionRequest = apps.get_model('accounts', 'ConnectionRequest')
+
+    keep = {}
+    duplicates = []
+    rows = ConnectionRequest.objects.order_by('id').values_list('id', 'sender_id', 'receiver_id', 'status')
+    for request_id, sender_id, receiver_id, status in rows.iterator(chunk_size=1000):
+        pair = (min(sender_id, receiver_id), max(sender_id, receiver_id))
+        kept = keep.get(pair)
+        if kept is None:
+            keep[pair] = (request_id, status)
+        elif status == 'accepted' and kept[1] != 'accepted':
+            duplicates.append(kept[0])
+            keep[pair] = (request_id, status)
+        else:
+            duplicates.append(request_id)
+
+    for start in range(0, len(duplicates), 1000):
+        ConnectionRequest.objects.filter(id__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_trigram_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_connection_requests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='connectionrequest',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Least('sender', 'receiver'), django.db.models.functions.comparison.Greatest('sender', 'receiver'), name='unique_connection_pair'),
+        ),
+    ]
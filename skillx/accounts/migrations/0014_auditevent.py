@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_unique_connection_pair'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('user_id', models.BigIntegerField(null=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('ip_address', models.CharField(blank=True, max_length=45)),
+                ('user_agent', models.CharField(blank=True, max_length=255)),
+                ('sensitive', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'timestamp'], name='auditevent_user_time'), models.Index(fields=['timestamp'], name='auditevent_time')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:05
+
+from django.db import migrations
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest, Least
+
+BATCH_SIZE = 1000
+
+
+def backfill_conversations(apps, schema_editor):
+    """
+    Give every pair of users that already exchanged messages its
+    Conversation row, which the conversation summaries are read from.
+    Same result as the backfill_conversations command.
+    """
+    Message = apps.get_model('accounts', 'Message')
+    ArchivedMessage = apps.get_model('accounts', 'ArchivedMessage')
+    Conversation = apps.get_model('accounts', 'Conversation')
+
+    # MySQL upserts on any unique key and rejects an explicit target
+    unique_fields = None
+    if schema_editor.connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['user_low', 'user_high']
+
+    def upsert(pairs, update_fields):
+        batch = []
+        for pair in pairs.iterator(chunk_size=BATCH_SIZE):
+            batch.append(Conversation(
+                user_low_id=pair['low'],
+                user_high_id=pair['high'],
+                last_activity=pair['last_activity'],
+                unread_low=pair.get('unread_low', 0),
+                unread_high=pair.get('unread_high', 0),
+            ))
+            if len(batch) >= BATCH_SIZE:
+                Conversation.objects.bulk_create(batch, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+                batch = []
+        if batch:
+            Conversation.objects.bulk_create(batch, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+
+    # Archived messages are older than the hot ones, so pairs with both
+    # take their activity and unread counts from the second pass
+    upsert(
+        ArchivedMessage.objects
+        .annotate(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+        .values('low', 'high')
+        .annotate(last_activity=Max('timestamp'))
+        .order_by(),
+        ['last_activity'],
+    )
+    upsert(
+        Message.objects
+        .annotate(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+        .values('low', 'high')
+        .annotate(
+            last_activity=Max('timestamp'),
+            unread_low=Count('id', filter=Q(is_read=False, receiver_id__lt=F('sender_id'))),
+            unread_high=Count('id', filter=Q(is_read=False, receiver_id__gt=F('sender_id'))),
+        )
+        .order_by(),
+        ['last_activity', 'unread_low', 'unread_high'],
+    )
+
+    last_message = Message.objects.filter(
+        Q(sender_id=OuterRef('user_low_id'), receiver_id=OuterRef('user_high_id')) |
+        Q(sender_id=OuterRef('user_high_id'), receiver_id=OuterRef('user_low_id'))
+    ).order_by('-timestamp', '-id').values('id')[:1]
+    Conversation.objects.update(last_message_id=Subquery(last_message))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_user_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_backfill_conversations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEventFloor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pruned_through', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
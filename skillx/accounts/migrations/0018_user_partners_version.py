@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_changeeventfloor'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='updated_at',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='partners_version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
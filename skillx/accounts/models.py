@@ -1,12 +1,175 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.db.models.functions import Greatest, Least
 
 # Create your models here.
 
+class OwnedQuerySet(models.QuerySet):
+    """
+    For models holding users' private rows. The model lists in
+    owner_fields the foreign keys to the users who may see a row.
+    """
+
+    def for_user(self, user):
+        """Rows user may see: those where any owner field is user"""
+        condition = models.Q()
+        for field in self.model.owner_fields:
+            condition |= models.Q(**{field: user})
+        return self.filter(condition)
+
+
 class User(AbstractUser):
     bio = models.TextField(blank=True, null=True)
+    # Comma-separated canonical skill names, kept in step with have_skills /
+    # want_skills by accounts.skills.set_user_skills
     skills_have = models.CharField(max_length=255, blank=True, null=True)
     skills_want = models.CharField(max_length=255, blank=True, null=True)
+    # Bumped when a profile shown in this user's lists changes or its
+    # account is deleted; part of their ETags, see accounts.conditional
+    partners_version = models.PositiveBigIntegerField(default=0)
+
+    have_skills = models.ManyToManyField(
+        'Skill',
+        through='UserSkillHave',
+        related_name='users_having',
+        blank=True
+    )
+
+    want_skills = models.ManyToManyField(
+        'Skill',
+        through='UserSkillWant',
+        related_name='users_wanting',
+        blank=True
+    )
+
+    def save(self, *args, **kwargs):
+        # partners_version only moves through F() updates (events.notify);
+        # saving an instance loaded before one must not write it back
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'partners_version'
+            ]
+        super().save(*args, **kwargs)
+
+
+class Skill(models.Model):
+    name = models.CharField(max_length=100)
+    # Lower-cased, whitespace-collapsed name used for lookups
+    normalized_name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+
+class SkillAlias(models.Model):
+    """Alternative spelling that resolves to a canonical Skill (e.g. "js" -> JavaScript)"""
+    skill = models.ForeignKey(
+        Skill,
+        related_name='aliases',
+        on_delete=models.CASCADE
+    )
+
+    alias = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.alias
+
+
+class UserSkillHave(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    skill = models.ForeignKey(Skill, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'skill'], name='unique_user_skill_have'),
+        ]
+        indexes = [
+            models.Index(fields=['skill', 'user'], name='skill_have_lookup'),
+        ]
+
+
+class UserSkillWant(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    skill = models.ForeignKey(Skill, on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'skill'], name='unique_user_skill_want'),
+        ]
+        indexes = [
+            models.Index(fields=['skill', 'user'], name='skill_want_lookup'),
+        ]
+
+
+
+class SkillMatch(models.Model):
+    """
+    Precomputed complementary-skill recommendation: candidate has skills
+    user wants and/or wants skills user has. Maintained by
+    accounts.recommendations.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='skill_matches',
+        on_delete=models.CASCADE
+    )
+
+    candidate = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    score = models.FloatField()
+
+    owner_fields = ('user',)
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'candidate'], name='unique_skill_match'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-score'], name='skill_match_ranking'),
+        ]
+
+
+class UserTrigram(models.Model):
+    """Trigram of a username, used by fuzzy user search (see accounts.trigrams)"""
+    trigram = models.CharField(max_length=3)
+
+    user = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    # Number of distinct trigrams in the username, for the similarity score
+    size = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'user'], name='unique_user_trigram'),
+        ]
+
+
+class SkillTrigram(models.Model):
+    """Trigram of a skill name, used by fuzzy skill search (see accounts.trigrams)"""
+    trigram = models.CharField(max_length=3)
+
+    skill = models.ForeignKey(
+        Skill,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    size = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['trigram', 'skill'], name='unique_skill_trigram'),
+        ]
 
 
 class ConnectionRequest(models.Model):
@@ -35,6 +198,24 @@ class ConnectionRequest(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    owner_fields = ('sender', 'receiver')
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # At most one request per pair of users, whichever way it was sent
+            models.UniqueConstraint(
+                Least('sender', 'receiver'),
+                Greatest('sender', 'receiver'),
+                name='unique_connection_pair',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['receiver', 'status'], name='connreq_receiver_status'),
+            models.Index(fields=['sender', 'status'], name='connreq_sender_status'),
+            models.Index(fields=['sender', 'receiver'], name='connreq_pair'),
+        ]
+
 
 class Message(models.Model):
     sender = models.ForeignKey(
@@ -52,6 +233,304 @@ class Message(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+
+    owner_fields = ('sender', 'receiver')
+    objects = OwnedQuerySet.as_manager()
     
     class Meta:
-        ordering = ['-timestamp']
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            # Thread history, conversation deletes, last-message lookups
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='message_pair_timestamp'),
+            # Unread counters and mark-as-read
+            models.Index(fields=['receiver', 'is_read', 'sender'], name='message_receiver_unread'),
+        ]
+
+
+
+class MessageToken(models.Model):
+    """
+    Inverted index over Message.content, used by message search on
+    databases without a FULLTEXT index (see accounts.search).
+    """
+    token = models.CharField(max_length=64)
+
+    message = models.ForeignKey(
+        Message,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'message'], name='unique_message_token'),
+        ]
+
+class ArchivedMessage(models.Model):
+    """
+    Cold storage for old messages, moved here by the archive_messages
+    command. Rows keep their original Message id so history cursors work
+    across both tables.
+    """
+    id = models.BigIntegerField(primary_key=True)
+
+    sender = models.ForeignKey(
+        User,
+        related_name='archived_sent_messages',
+        on_delete=models.CASCADE
+    )
+
+    receiver = models.ForeignKey(
+        User,
+        related_name='archived_received_messages',
+        on_delete=models.CASCADE
+    )
+
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    owner_fields = ('sender', 'receiver')
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='archived_pair_timestamp'),
+        ]
+
+class ConversationQuerySet(OwnedQuerySet):
+    def between(self, user_a_id, user_b_id):
+        low, high = ConversationManager.ordered_pair(user_a_id, user_b_id)
+        return self.filter(user_low_id=low, user_high_id=high)
+
+
+class ConversationManager(models.Manager.from_queryset(ConversationQuerySet)):
+    """
+    Keeps Conversation rows in step with Message writes. Every method is
+    meant to be called inside the transaction that changed the messages.
+    """
+
+    @staticmethod
+    def ordered_pair(user_a_id, user_b_id):
+        user_a_id, user_b_id = int(user_a_id), int(user_b_id)
+        return min(user_a_id, user_b_id), max(user_a_id, user_b_id)
+
+    def record_message(self, message):
+        """Make message the last one of its conversation and count it as unread"""
+        low, high = self.ordered_pair(message.sender_id, message.receiver_id)
+        unread_field = 'unread_low' if message.receiver_id == low else 'unread_high'
+
+        updated = self.filter(user_low_id=low, user_high_id=high).update(**{
+            'last_message': message,
+            'last_activity': message.timestamp,
+            unread_field: models.F(unread_field) + 1,
+        })
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(**{
+                    'user_low_id': low,
+                    'user_high_id': high,
+                    'last_message': message,
+                    'last_activity': message.timestamp,
+                    unread_field: 1,
+                })
+        except IntegrityError:
+            # Someone else created the row concurrently, update theirs
+            self.record_message(message)
+
+    def record_broadcast(self, sender_id, messages):
+        """
+        record_message for many messages from one sender, in a constant
+        number of queries
+        """
+        if not messages:
+            return
+        sender_id = int(sender_id)
+        by_receiver = {message.receiver_id: message for message in messages}
+
+        # Create missing conversations first so the UPDATEs below see them
+        self.bulk_create([
+            Conversation(
+                user_low_id=min(sender_id, receiver_id),
+                user_high_id=max(sender_id, receiver_id),
+                last_message=message,
+                last_activity=message.timestamp,
+            )
+            for receiver_id, message in by_receiver.items()
+        ], ignore_conflicts=True)
+
+        # The receiver is user_high where the sender is user_low and vice versa
+        for sender_side, receiver_side in (('user_low', 'user_high'), ('user_high', 'user_low')):
+            receiver_field = f'{receiver_side}_id'
+            unread_field = 'unread_high' if receiver_side == 'user_high' else 'unread_low'
+            self.filter(**{
+                f'{sender_side}_id': sender_id,
+                f'{receiver_field}__in': list(by_receiver),
+            }).update(**{
+                'last_message_id': models.Case(*[
+                    models.When(**{receiver_field: receiver_id}, then=models.Value(message.id))
+                    for receiver_id, message in by_receiver.items()
+                ]),
+                'last_activity': models.Case(*[
+                    models.When(**{receiver_field: receiver_id}, then=models.Value(message.timestamp))
+                    for receiver_id, message in by_receiver.items()
+                ]),
+                unread_field: models.F(unread_field) + 1,
+            })
+
+    def mark_read(self, reader_id, other_user_id):
+        """All messages from other_user_id to reader_id have been read"""
+        low, _ = self.ordered_pair(reader_id, other_user_id)
+        unread_field = 'unread_low' if int(reader_id) == low else 'unread_high'
+        self.between(reader_id, other_user_id).update(**{unread_field: 0})
+
+    def message_deleted(self, message):
+        """Update the conversation after message has been deleted"""
+        conversation = self.between(message.sender_id, message.receiver_id).select_for_update().first()
+        if conversation is None:
+            return
+
+        if not message.is_read:
+            unread_field = 'unread_low' if message.receiver_id == conversation.user_low_id else 'unread_high'
+            setattr(conversation, unread_field, max(getattr(conversation, unread_field) - 1, 0))
+            conversation.save(update_fields=[unread_field])
+
+        # Deleting the last message nulls the foreign key
+        if conversation.last_message_id is None:
+            self.refresh_last_message(conversation)
+
+    def refresh_last_message(self, conversation):
+        """
+        Point the conversation at its newest message. When only archived
+        messages are left it keeps their latest time without a
+        last_message; with none left at all it is dropped.
+        """
+        pair = (
+            models.Q(sender_id=conversation.user_low_id, receiver_id=conversation.user_high_id) |
+            models.Q(sender_id=conversation.user_high_id, receiver_id=conversation.user_low_id)
+        )
+        last_message = Message.objects.filter(pair).order_by('-timestamp', '-id').only('id', 'timestamp').first()
+        if last_message is None:
+            # Archived messages are not a last_message candidate, see
+            # archive_messages, but they are still the conversation's history
+            last_message = ArchivedMessage.objects.filter(pair).order_by('-timestamp', '-id').only('timestamp').first()
+            if last_message is None:
+                conversation.delete()
+                return
+            conversation.last_message = None
+        else:
+            conversation.last_message = last_message
+
+        conversation.last_activity = last_message.timestamp
+        conversation.save(update_fields=['last_message', 'last_activity'])
+
+
+class Conversation(models.Model):
+    """
+    One row per pair of users that have exchanged messages, keyed by the
+    ordered pair (user_low.id < user_high.id).
+    """
+    user_low = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    user_high = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+
+    last_message = models.ForeignKey(
+        Message,
+        related_name='+',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+
+    last_activity = models.DateTimeField()
+
+    # Unread messages addressed to user_low / user_high
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+
+    owner_fields = ('user_low', 'user_high')
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity'], name='conversation_low_activity'),
+            models.Index(fields=['user_high', '-last_activity'], name='conversation_high_activity'),
+        ]
+
+    def other_user(self, user):
+        return self.user_high if user.id == self.user_low_id else self.user_low
+
+    def unread_count_for(self, user):
+        return self.unread_low if user.id == self.user_low_id else self.unread_high
+
+
+class ChangeEvent(models.Model):
+    """
+    Per-user change log behind the sync endpoint. The auto-increment id is
+    the sync cursor: a client that has seen id N only needs events > N.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='change_events',
+        on_delete=models.CASCADE
+    )
+
+    event_type = models.CharField(max_length=32)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    owner_fields = ('user',)
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='changeevent_user_cursor'),
+        ]
+
+
+class ChangeEventFloor(models.Model):
+    """
+    At most one row: the highest ChangeEvent id prune_change_events has
+    deleted. Sync cursors below it may have missed events.
+    """
+    pruned_through = models.BigIntegerField(default=0)
+
+
+class AuditEvent(models.Model):
+    """
+    One API request, written in batches by accounts.audit when
+    AUDIT_LOG_BACKEND is 'database'. user_id is a plain column so the
+    trail outlives deleted accounts.
+    """
+    timestamp = models.DateTimeField()
+    user_id = models.BigIntegerField(null=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    ip_address = models.CharField(max_length=45, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True)
+    sensitive = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'timestamp'], name='auditevent_user_time'),
+            models.Index(fields=['timestamp'], name='auditevent_time'),
+        ]
@@ -0,0 +1,64 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.utils import timezone
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Read ``page_size`` from the query string, clamped to ``maximum``.
+    Raises ValueError for anything that is not a positive integer.
+    """
+    raw = request.query_params.get('page_size')
+    if raw in (None, ''):
+        return default
+    return min(_positive_int(raw, 'page_size'), maximum)
+
+
+def get_page_number(request):
+    """
+    Read the 1-based ``page`` number from the query string.
+    Raises ValueError for anything that is not a positive integer.
+    """
+    raw = request.query_params.get('page')
+    if raw in (None, ''):
+        return 1
+    return _positive_int(raw, 'page')
+
+
+def _positive_int(raw, name):
+    try:
+        value = int(raw)
+    except (TypeError, ValueError):
+        value = 0
+    if value < 1:
+        raise ValueError(f'{name} must be a positive integer')
+    return value
+
+
+def encode_cursor(timestamp, pk):
+    """Opaque keyset cursor for a (timestamp, id) position."""
+    raw = f"{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor. Returns a (timestamp, id) tuple.
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        timestamp = datetime.fromisoformat(timestamp)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+    if timezone.is_naive(timestamp):
+        raise ValueError('Invalid cursor')
+    return timestamp, pk
@@ -0,0 +1,124 @@
+"""
+EXPLAIN-based guard against index regressions on the hot query paths.
+
+Each entry in HOT_QUERIES builds the queryset a view runs for a given
+user and counterpart. find_full_scans() asks the database for the plan
+of each one and reports the ones that read a whole table instead of an
+index range. Used by the check_query_plans management command and the
+test suite.
+"""
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import (
+    ArchivedMessage, ChangeEvent, ConnectionRequest, Conversation, Message, MessageToken, SkillMatch, SkillTrigram,
+    UserSkillHave, UserTrigram,
+)
+
+
+def _thread(user, other, model=Message):
+    # get_conversation_messages: owned() rows of the pair, newest first
+    return model.objects.for_user(user).filter(
+        Q(sender=user, receiver=other) | Q(sender=other, receiver=user)
+    ).order_by('-timestamp', '-id')
+
+
+# Built the way the views build them, owned() scoping (for_user) included,
+# so a change to a view's query belongs here too
+HOT_QUERIES = {
+    'conversation history': _thread,
+    'archived history': lambda user, other: _thread(user, other, ArchivedMessage),
+    'conversation list': lambda user, other: Message.objects.for_user(user).select_related('sender', 'receiver'),
+    'archived conversation list': lambda user, other: (
+        ArchivedMessage.objects.for_user(user).select_related('sender', 'receiver')
+    ),
+    'inbox': lambda user, other: Conversation.objects.for_user(user).order_by('-last_activity', '-id'),
+    'conversation lookup': lambda user, other: Conversation.objects.for_user(user).between(user.id, other.id),
+    'unread counts': lambda user, other: (
+        Message.objects.filter(receiver_id=user.id, is_read=False)
+        .values('sender_id').annotate(count=Count('id')).order_by()
+    ),
+    'mark messages read': lambda user, other: Message.objects.for_user(user).filter(
+        sender_id=other.id, receiver=user, is_read=False
+    ),
+    'unread receivers of a deleted account': lambda user, other: (
+        Message.objects.for_user(user).filter(sender=user, is_read=False)
+        .values_list('receiver_id', flat=True).order_by().distinct()
+    ),
+    'pending requests': lambda user, other: ConnectionRequest.objects.for_user(user).filter(
+        receiver=user, status='pending'
+    ),
+    'my connections': lambda user, other: ConnectionRequest.objects.for_user(user).filter(status='accepted'),
+    # SendConnectionRequestView, after the pair constraint rejected an insert
+    'existing request': lambda user, other: ConnectionRequest.objects.for_user(user).filter(
+        Q(sender_id=other.id) | Q(receiver_id=other.id)
+    ),
+    'bulk requests': lambda user, other: ConnectionRequest.objects.for_user(user).filter(
+        id__in=[1, 2], receiver=user, status='pending'
+    ),
+    'message search tokens': lambda user, other: (
+        MessageToken.objects.filter(token__in=['django', 'python'])
+        .filter(Q(message__sender=user) | Q(message__receiver=user))
+        .values('message_id').annotate(matched=Count('token'))
+    ),
+    'username trigrams': lambda user, other: (
+        UserTrigram.objects.exclude(user_id=user.id).filter(trigram__in=['  a', ' al', 'ali'])
+        .values('user_id').annotate(matched=Count('id'))
+    ),
+    'skill trigrams': lambda user, other: (
+        SkillTrigram.objects.filter(trigram__in=['  p', ' py', 'pyt'])
+        .values('skill_id').annotate(matched=Count('id'))
+    ),
+    'users with skills': lambda user, other: (
+        UserSkillHave.objects.filter(skill_id__in=[1, 2]).exclude(user_id=user.id).values('user_id')
+    ),
+    'recommendations': lambda user, other: (
+        SkillMatch.objects.for_user(user.id).exclude(candidate_id__in=[other.id])
+        .select_related('candidate').order_by('-score', 'candidate_id')
+    ),
+    'sync changes': lambda user, other: ChangeEvent.objects.for_user(user).filter(id__gt=0).order_by('id'),
+}
+
+
+def explain(queryset):
+    """Return the database's plan for queryset as a list of text lines"""
+    sql, params = queryset.query.sql_with_params()
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [column[0] for column in cursor.description]
+        if connection.vendor == 'mysql':
+            return [
+                ' '.join(f'{name}={value}' for name, value in zip(columns, row))
+                for row in cursor.fetchall()
+            ]
+        return [row[0] for row in cursor.fetchall()]
+
+
+def is_full_scan(plan):
+    """True if any step of plan reads a whole table"""
+    for line in plan:
+        if connection.vendor == 'sqlite':
+            # "SEARCH t USING INDEX" is a range scan, "SCAN t" reads every row
+            if line.startswith('SCAN ') and 'accounts_' in line:
+                return True
+        elif connection.vendor == 'mysql':
+            if ' type=ALL ' in f' {line} ':
+                return True
+        elif 'Seq Scan' in line:
+            return True
+    return False
+
+
+def find_full_scans(user, other):
+    """Map of query name to plan for every hot query that does a full scan"""
+    full_scans = {}
+    for name, build in HOT_QUERIES.items():
+        plan = explain(build(user, other))
+        if is_full_scan(plan):
+            full_scans[name] = plan
+    return full_scans
@@ -0,0 +1,111 @@
+"""
+Query budgets and N+1 detection.
+
+Views declare the most SQL queries one request may run: query_budget on
+APIViews, either a number or a dict per HTTP method, and the
+@query_budget decorator on @api_view functions. The test suite calls
+every endpoint against seeded data and fails when a view goes over its
+budget or runs the same query shape over and over (an N+1: one query per
+row of an earlier result).
+
+QueryRecorder records the queries run inside it; query_shape() reduces a
+query to its shape by replacing literal values, so the per-row queries of
+an N+1 compare equal. QueryInspectorMiddleware applies both to every
+request while DEBUG is on, logs a warning for budgets exceeded and
+repeated shapes, and adds an X-Query-Count header.
+"""
+import logging
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('accounts.queries')
+
+# Savepoints come from transaction.atomic() and are not data access
+IGNORED_RE = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b', re.I)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s|\?")
+IN_LIST_RE = re.compile(r'\bIN \((?:\s*\?\s*,?)+\)', re.I)
+
+
+def query_shape(sql):
+    """sql with its literal values and IN lists replaced by placeholders"""
+    return IN_LIST_RE.sub('IN (...)', LITERAL_RE.sub('?', sql))
+
+
+def budget_for(view_class, method):
+    """The view's budget for method, or None when it declares none"""
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method.lower())
+    return budget
+
+
+def query_budget(budget):
+    """Declare query_budget on an @api_view function; put it above @api_view"""
+    def decorator(view):
+        view.cls.query_budget = budget
+        return view
+    return decorator
+
+
+class QueryRecorder:
+    """execute_wrapper context manager collecting the SQL run inside it"""
+
+    def __init__(self, using=connection):
+        self.connection = using
+        self.queries = []
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._wrapper.__exit__(*exc_info)
+
+    def __call__(self, execute, sql, params, many, context):
+        if not IGNORED_RE.match(sql):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated(self, threshold=None):
+        """{shape: times} for shapes run at least threshold times"""
+        if threshold is None:
+            threshold = settings.N_PLUS_ONE_THRESHOLD
+        shapes = Counter(query_shape(sql) for sql in self.queries)
+        return {shape: times for shape, times in shapes.items() if times >= threshold}
+
+
+class QueryInspectorMiddleware:
+    """Development aid: flags N+1 queries and blown budgets, only with DEBUG on"""
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        view_class = getattr(match.func, 'cls', None) if match else None
+        budget = budget_for(view_class, request.method) if view_class else None
+
+        if budget is not None and recorder.count > budget:
+            logger.warning(
+                '%s %s ran %d queries, over its budget of %d',
+                request.method, request.path, recorder.count, budget,
+            )
+        for shape, times in recorder.repeated().items():
+            logger.warning('%s %s ran this query %d times (N+1?): %s', request.method, request.path, times, shape)
+
+        response['X-Query-Count'] = str(recorder.count)
+        return response
@@ -0,0 +1,299 @@
+"""
+Complementary skill matching.
+
+For users u and v, let wants_has(u, v) be the number of skills u wants
+that v has. The match score is
+
+    wants_has(u, v) + wants_has(v, u) + min(wants_has(u, v), wants_has(v, u))
+
+The last term rewards pairs that can teach each other. The score is
+symmetric.
+
+rebuild_all() computes every user's top-K list in blocks of users from
+sparse user x skill matrices: S = W @ H.T, where W and H are the want
+and have matrices. refresh_user() updates the lists after one profile
+changes; profile saves only queue it with refresh_later(), and a
+background thread runs it. Requests are then answered from the
+SkillMatch table alone.
+"""
+import atexit
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, Exists, F, Min, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+from scipy import sparse
+
+from .models import ConnectionRequest, SkillMatch, UserSkillHave, UserSkillWant
+
+logger = logging.getLogger(__name__)
+
+TOP_K = getattr(settings, 'RECOMMENDATIONS_TOP_K', 50)
+MAX_REVERSE_UPDATES = getattr(settings, 'RECOMMENDATIONS_MAX_REVERSE_UPDATES', 1000)
+# Users scored per sparse matrix product during a rebuild
+BLOCK_SIZE = 1000
+
+
+def combine(wants_has, has_wanted):
+    """Score from the two directed overlap counts (arrays or sparse matrices)"""
+    if sparse.issparse(wants_has):
+        return wants_has + has_wanted + wants_has.minimum(has_wanted)
+    return wants_has + has_wanted + np.minimum(wants_has, has_wanted)
+
+
+def connected_user_ids(user_id):
+    rows = ConnectionRequest.objects.filter(
+        status='accepted'
+    ).filter(
+        Q(sender_id=user_id) | Q(receiver_id=user_id)
+    ).values_list('sender_id', 'receiver_id')
+    return {sender_id if receiver_id == user_id else receiver_id for sender_id, receiver_id in rows}
+
+
+def top_k(candidate_ids, scores, excluded, k=TOP_K):
+    """The k best (candidate_id, score) pairs, skipping excluded ids and zero scores"""
+    candidate_ids = np.asarray(candidate_ids)
+    scores = np.asarray(scores, dtype=float)
+    keep = scores > 0
+    if excluded:
+        keep &= ~np.isin(candidate_ids, list(excluded))
+    candidate_ids, scores = candidate_ids[keep], scores[keep]
+
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        candidate_ids, scores = candidate_ids[best], scores[best]
+    order = np.lexsort((candidate_ids, -scores))
+    return [(int(candidate_ids[i]), float(scores[i])) for i in order]
+
+
+def _upsert(matches):
+    # MySQL upserts on any unique key and rejects an explicit target
+    unique_fields = None
+    if connection.features.supports_update_conflicts_with_target:
+        unique_fields = ['user', 'candidate']
+
+    SkillMatch.objects.bulk_create(
+        matches,
+        update_conflicts=True,
+        unique_fields=unique_fields,
+        update_fields=['score'],
+        batch_size=1000,
+    )
+
+
+def trim(user_ids):
+    """Cut the lists of user_ids back to their TOP_K best rows"""
+    if not user_ids:
+        return
+    surplus = SkillMatch.objects.filter(user_id__in=user_ids).annotate(
+        rank=Window(RowNumber(), partition_by=F('user_id'), order_by=[F('score').desc(), F('candidate_id').asc()])
+    ).filter(rank__gt=TOP_K).values_list('id', flat=True)
+    surplus = list(surplus)
+    if surplus:
+        SkillMatch.objects.filter(id__in=surplus).delete()
+
+
+def rebuild_all():
+    """Recompute every user's recommendation list. Returns the number of users with matches."""
+    have = np.array(UserSkillHave.objects.values_list('user_id', 'skill_id'), dtype=np.int64).reshape(-1, 2)
+    want = np.array(UserSkillWant.objects.values_list('user_id', 'skill_id'), dtype=np.int64).reshape(-1, 2)
+
+    user_ids = np.unique(np.concatenate([have[:, 0], want[:, 0]]))
+    skill_ids = np.unique(np.concatenate([have[:, 1], want[:, 1]]))
+    shape = (len(user_ids), len(skill_ids))
+
+    def matrix(pairs):
+        rows = np.searchsorted(user_ids, pairs[:, 0])
+        columns = np.searchsorted(skill_ids, pairs[:, 1])
+        return sparse.csr_matrix((np.ones(len(pairs)), (rows, columns)), shape=shape)
+
+    H, W = matrix(have), matrix(want)
+    H_t, W_t = H.T.tocsc(), W.T.tocsc()
+
+    connections = {}
+    for sender_id, receiver_id in ConnectionRequest.objects.filter(status='accepted').values_list('sender_id', 'receiver_id'):
+        connections.setdefault(sender_id, set()).add(receiver_id)
+        connections.setdefault(receiver_id, set()).add(sender_id)
+
+    # Only one block's lists are held in memory, and each is replaced in
+    # its own transaction
+    matched = 0
+    for start in range(0, len(user_ids), BLOCK_SIZE):
+        block = slice(start, start + BLOCK_SIZE)
+        block_user_ids = [int(user_id) for user_id in user_ids[block]]
+        scores = combine(W[block] @ H_t, H[block] @ W_t).tocsr()
+        matches = []
+        for offset, user_id in enumerate(block_user_ids):
+            row = scores.getrow(offset)
+            excluded = connections.get(user_id, set()) | {user_id}
+            for candidate_id, score in top_k(user_ids[row.indices], row.data, excluded):
+                matches.append(SkillMatch(user_id=user_id, candidate_id=candidate_id, score=score))
+
+        with transaction.atomic():
+            SkillMatch.objects.filter(user_id__in=block_user_ids).delete()
+            # Profile changes committed meanwhile may have refreshed some rows
+            _upsert(matches)
+        matched += len({match.user_id for match in matches})
+
+    # Users who no longer list any skill
+    SkillMatch.objects.exclude(
+        Exists(UserSkillHave.objects.filter(user_id=OuterRef('user_id')))
+    ).exclude(
+        Exists(UserSkillWant.objects.filter(user_id=OuterRef('user_id')))
+    ).delete()
+    return matched
+
+
+def refresh_user(user_id):
+    """
+    Recompute the scores involving user_id after their skills changed.
+
+    The user's own list is rebuilt. The user is added to, re-scored in or
+    removed from the lists of at most MAX_REVERSE_UPDATES other users, the
+    best matches first, and lists that grow past TOP_K are trimmed. Other
+    lists may drift slightly from an exact top-K until the next
+    rebuild_all().
+    """
+    wanted = list(UserSkillWant.objects.filter(user_id=user_id).values_list('skill_id', flat=True))
+    offered = list(UserSkillHave.objects.filter(user_id=user_id).values_list('skill_id', flat=True))
+
+    # Sparse row of S and column of S, counted by the database over the
+    # indexed (skill, user) lookups
+    def overlap(through, skill_ids):
+        if not skill_ids:
+            return {}
+        return dict(
+            through.objects.filter(skill_id__in=skill_ids)
+            .values_list('user_id').annotate(count=Count('id')).order_by()
+        )
+
+    wants_has = overlap(UserSkillHave, wanted)
+    has_wanted = overlap(UserSkillWant, offered)
+
+    candidate_ids = np.array(sorted(set(wants_has) | set(has_wanted)), dtype=np.int64)
+    scores = combine(
+        np.array([wants_has.get(int(c), 0) for c in candidate_ids], dtype=float),
+        np.array([has_wanted.get(int(c), 0) for c in candidate_ids], dtype=float),
+    )
+    excluded = connected_user_ids(user_id) | {user_id}
+    own_list = top_k(candidate_ids, scores, excluded)
+    reverse = dict(top_k(candidate_ids, scores, excluded, k=MAX_REVERSE_UPDATES))
+
+    # Only enter other users' lists where the score beats their current
+    # K-th entry (or the list is not full yet)
+    full = []
+    current = SkillMatch.objects.filter(user_id__in=list(reverse)).exclude(candidate_id=user_id)
+    for row in current.values('user_id').annotate(size=Count('id'), floor=Min('score')).order_by():
+        if row['size'] >= TOP_K:
+            if reverse[row['user_id']] <= row['floor']:
+                del reverse[row['user_id']]
+            else:
+                full.append(row['user_id'])
+
+    with transaction.atomic():
+        SkillMatch.objects.filter(user_id=user_id).delete()
+        SkillMatch.objects.filter(candidate_id=user_id).exclude(user_id__in=list(reverse)).delete()
+        # A concurrent refresh of a candidate may write into this user's
+        # list after the delete, so the own rows are upserted too
+        _upsert([
+            SkillMatch(user_id=user_id, candidate_id=candidate_id, score=score)
+            for candidate_id, score in own_list
+        ] + [
+            SkillMatch(user_id=candidate_id, candidate_id=user_id, score=score)
+            for candidate_id, score in reverse.items()
+        ])
+        trim(full)
+
+
+class RefreshQueue:
+    """
+    Users waiting for refresh_user(), each queued once however often their
+    profile changes before a background thread gets to them.
+    """
+
+    def __init__(self, background=True):
+        self.background = background
+        # dict as an ordered set
+        self.pending = {}
+        self.failed = 0
+        self._condition = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def add(self, user_id):
+        if self._thread is None and self.background:
+            self.start()
+        with self._condition:
+            self.pending[user_id] = None
+            self._condition.notify()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recommendations-refresh', daemon=True)
+                self._thread.start()
+
+    def _take(self, wait):
+        with self._condition:
+            while wait and not self.pending:
+                self._condition.wait()
+            if not self.pending:
+                return None
+            user_id = next(iter(self.pending))
+            del self.pending[user_id]
+            return user_id
+
+    def _refresh(self, user_id):
+        try:
+            refresh_user(user_id)
+        except Exception:
+            self.failed += 1
+            logger.exception('Could not refresh the recommendations involving user %s', user_id)
+
+    def _run(self):
+        while True:
+            user_id = self._take(wait=True)
+            close_old_connections()
+            self._refresh(user_id)
+
+    def flush(self):
+        """Refresh everyone queued so far from the calling thread"""
+        while True:
+            user_id = self._take(wait=False)
+            if user_id is None:
+                return
+            self._refresh(user_id)
+
+
+_refresh_queue = None
+_lock = threading.Lock()
+
+
+def get_refresh_queue():
+    """The process-wide RefreshQueue"""
+    global _refresh_queue
+    if _refresh_queue is None:
+        with _lock:
+            if _refresh_queue is None:
+                _refresh_queue = RefreshQueue()
+                # Refresh whoever is still queued when the process exits
+                atexit.register(_refresh_queue.flush)
+    return _refresh_queue
+
+
+def refresh_later(user_id):
+    """Queue refresh_user(user_id) for the background thread"""
+    get_refresh_queue().add(user_id)
+
+
+def recommendations_for(user_id, limit):
+    """Best precomputed matches for user_id, skipping users connected since the last refresh"""
+    return list(
+        SkillMatch.objects.for_user(user_id)
+        .exclude(candidate_id__in=connected_user_ids(user_id))
+        .select_related('candidate')
+        .order_by('-score', 'candidate_id')[:limit]
+    )
@@ -0,0 +1,80 @@
+"""
+Faster JSON rendering and parsing for the API, backed by orjson.
+
+The output matches DRF's JSONRenderer byte for byte (compact separators,
+UTF-8, "Z" for UTC datetimes, escaped U+2028/U+2029, int dict keys as
+strings). Types orjson does not know, such as Decimal, lazy translation
+strings, timedelta and querysets, go through DRF's own JSONEncoder.default.
+
+The exceptions are floats that need an exponent (1e16 renders as 1e16
+instead of 1e+16, 1e-05 as 0.00001) and NaN/Infinity, which render as
+null where DRF refuses them. API payloads do not contain either.
+
+Without orjson installed both classes behave exactly like their DRF
+parents. The renderer also defers to DRF for indented output and values
+orjson rejects (integers wider than 64 bits), and the parser for bodies
+orjson cannot read the same way, so results and error messages match.
+
+Compare the two with: python manage.py benchmark_json
+"""
+import codecs
+import re
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser, get_encoding
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = JSONEncoder()
+LONG_NUMBER_RE = re.compile(rb'\d{19}')
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            # e.g. integers wider than 64 bits, which the stdlib encoder handles
+            return super().render(data, accepted_media_type, renderer_context)
+
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = get_encoding(parser_context)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        # orjson turns integers beyond 64 bits into floats, leave any
+        # long run of digits to the stdlib parser
+        if not LONG_NUMBER_RE.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+
+        # Let the stdlib parser decide, so that what it accepts (such as
+        # very large integers) still parses and errors read the same
+        try:
+            parse_constant = json.strict_constant if self.strict else None
+            return json.loads(body.decode(encoding), parse_constant=parse_constant)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
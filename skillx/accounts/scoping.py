@@ -0,0 +1,32 @@
+"""
+Data isolation at the queryset level.
+
+Every view declares in owned_models the models whose private rows it
+reads or changes (models with an OwnedQuerySet, see accounts.models), or
+an empty tuple when it only serves public data. APIViews set it as a
+class attribute and @api_view functions with the @owns decorator.
+
+owned(request, Model) is then the only way a view gets at those rows:
+Model.objects.for_user(request.user), so the database never returns
+another user's rows and responses need no second pass to filter them.
+Asking for a model the view did not declare is a programming error.
+"""
+from django.core.exceptions import ImproperlyConfigured
+
+
+def owns(*models):
+    """Declare owned_models on an @api_view function; put it above @api_view"""
+    def decorator(view):
+        view.cls.owned_models = models
+        return view
+    return decorator
+
+
+def owned(request, model):
+    """model's rows that request.user may see"""
+    view = request.parser_context['view']
+    if model not in (getattr(view, 'owned_models', None) or ()):
+        raise ImproperlyConfigured(
+            f'{type(view).__name__} reads {model.__name__} rows without declaring it in owned_models'
+        )
+    return model.objects.for_user(request.user)
@@ -0,0 +1,137 @@
+"""
+Full-text search over a user's messages.
+
+On MySQL, search uses the FULLTEXT index on accounts_message.content that
+migration 0008 creates. Other databases (SQLite in development and tests)
+use the MessageToken inverted index, which is kept up to date by
+index_messages(). A post_save signal calls it, and bulk writers call it
+directly. Archived messages are not searchable.
+"""
+import re
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import Message, MessageToken
+
+TOKEN_RE = re.compile(r'\w+')
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 10
+SNIPPET_LENGTH = 160
+
+
+def uses_fulltext():
+    return connection.vendor == 'mysql'
+
+
+def tokenize(text):
+    return [
+        token for token in TOKEN_RE.findall(text.lower())
+        if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH
+    ]
+
+
+def index_messages(messages):
+    """Add messages to the MessageToken index (no-op with FULLTEXT)"""
+    if uses_fulltext():
+        return
+
+    MessageToken.objects.bulk_create([
+        MessageToken(token=token, message_id=message.id, count=count)
+        for message in messages
+        for token, count in Counter(tokenize(message.content)).items()
+    ], ignore_conflicts=True)
+
+
+def rebuild_index(batch_size=1000):
+    """Recreate the MessageToken index from scratch, returns messages indexed"""
+    if uses_fulltext():
+        return 0
+
+    MessageToken.objects.all().delete()
+    indexed = 0
+    batch = []
+    for message in Message.objects.order_by().only('id', 'content').iterator(chunk_size=batch_size):
+        batch.append(message)
+        if len(batch) >= batch_size:
+            index_messages(batch)
+            indexed += len(batch)
+            batch = []
+    index_messages(batch)
+    return indexed + len(batch)
+
+
+def search_messages(user, query, offset, limit):
+    """
+    Messages sent or received by user that match query, best match first.
+    Returns dicts with id, sender_id, receiver_id, content, timestamp and
+    score.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return []
+
+    fields = ('id', 'sender_id', 'receiver_id', 'content', 'timestamp')
+
+    if uses_fulltext():
+        match = RawSQL(
+            'MATCH (accounts_message.content) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            [' '.join(terms)],
+            output_field=FloatField(),
+        )
+        # Non-matching rows score 0; MySQL answers "> 0" from the FULLTEXT index
+        rows = (
+            Message.objects.for_user(user)
+            .annotate(score=match)
+            .filter(score__gt=0)
+            .order_by('-score', '-timestamp', '-id')
+            .values(*fields, 'score')
+        )
+        return list(rows[offset:offset + limit])
+
+    # Rank by number of distinct query terms matched, then total term frequency
+    hits = (
+        MessageToken.objects.filter(token__in=terms)
+        .filter(Q(message__sender=user) | Q(message__receiver=user))
+        .values('message_id')
+        .annotate(matched=Count('token'), frequency=Sum('count'), timestamp=F('message__timestamp'))
+        .order_by('-matched', '-frequency', '-timestamp', '-message_id')
+    )[offset:offset + limit]
+    hits = list(hits)
+
+    messages = Message.objects.in_bulk([hit['message_id'] for hit in hits])
+    results = []
+    for hit in hits:
+        message = messages[hit['message_id']]
+        row = {field: getattr(message, field) for field in fields}
+        row['score'] = hit['matched'] + hit['frequency'] / 100
+        results.append(row)
+    return results
+
+
+def highlight(content, query):
+    """HTML-escaped snippet of content around the first match, terms wrapped in <mark>"""
+    terms = tokenize(query)
+    if not terms:
+        return escape(content[:SNIPPET_LENGTH])
+
+    pattern = re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+    first = pattern.search(content)
+    start = max(first.start() - SNIPPET_LENGTH // 4, 0) if first else 0
+    snippet = content[start:start + SNIPPET_LENGTH]
+
+    parts = []
+    position = 0
+    for match in pattern.finditer(snippet):
+        parts.append(escape(snippet[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group(0))}</mark>')
+        position = match.end()
+    parts.append(escape(snippet[position:]))
+
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + SNIPPET_LENGTH < len(content) else ''
+    return prefix + ''.join(parts) + suffix
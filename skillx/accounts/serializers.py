@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from .models import User, ConnectionRequest, Message
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
+from .fieldsets import SparseFieldsSerializerMixin
+from .skills import set_user_skills
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'bio', 'skills_have', 'skills_want')
@@ -23,17 +26,21 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('password_confirm')
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
-            bio=validated_data.get('bio', ''),
-            skills_have=validated_data.get('skills_have', ''),
-            skills_want=validated_data.get('skills_want', '')
-        )
+        with transaction.atomic():
+            user = User.objects.create_user(
+                username=validated_data['username'],
+                email=validated_data['email'],
+                password=validated_data['password'],
+                bio=validated_data.get('bio', ''),
+            )
+            set_user_skills(
+                user,
+                skills_have=validated_data.get('skills_have') or '',
+                skills_want=validated_data.get('skills_want') or '',
+            )
         return user
 
-class ConnectionRequestSerializer(serializers.ModelSerializer):
+class ConnectionRequestSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
     
@@ -59,8 +66,20 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("This username is already taken.")
         return value
 
+    def update(self, instance, validated_data):
+        skills_have = validated_data.pop('skills_have', None)
+        skills_want = validated_data.pop('skills_want', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            set_user_skills(
+                instance,
+                skills_have=None if skills_have is None else skills_have or '',
+                skills_want=None if skills_want is None else skills_want or '',
+            )
+        return instance
 
-class MessageSerializer(serializers.ModelSerializer):
+
+class MessageSerializer(SparseFieldsSerializerMixin, serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
     
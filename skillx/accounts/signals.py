@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import autocomplete
+from .models import Message, Skill, SkillAlias, User
+from .search import index_messages
+from .trigrams import index_skills, index_users
+
+
+@receiver(post_save, sender=Message)
+def index_new_message(sender, instance, created, **kwargs):
+    if created:
+        index_messages([instance])
+
+
+@receiver(post_save, sender=User)
+def index_username(sender, instance, update_fields, **kwargs):
+    # Saves such as the last_login update on every login leave the name alone
+    if update_fields is None or 'username' in update_fields:
+        index_users([instance])
+
+
+@receiver(post_save, sender=Skill)
+def index_skill_name(sender, instance, **kwargs):
+    index_skills([instance])
+
+
+@receiver(post_save, sender=Skill)
+def refresh_renamed_skill(sender, instance, created, **kwargs):
+    # New skills have no listings yet, so autocomplete leaves them out
+    if not created:
+        transaction.on_commit(autocomplete.invalidate)
+
+
+@receiver(post_delete, sender=Skill)
+def refresh_deleted_skill(sender, **kwargs):
+    transaction.on_commit(autocomplete.invalidate)
+
+
+@receiver(post_save, sender=SkillAlias)
+def complete_new_alias(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: autocomplete.alias_added(instance))
+    else:
+        transaction.on_commit(autocomplete.invalidate)
+
+
+@receiver(post_delete, sender=SkillAlias)
+def forget_deleted_alias(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.alias_removed(instance))
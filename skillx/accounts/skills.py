@@ -0,0 +1,126 @@
+"""
+Normalized skills.
+
+Users still type skills as a comma-separated string. On write, the
+string is split and each name is resolved to a canonical Skill, either by
+its normalized name or through a SkillAlias. Unknown names become new
+skills. The result is stored in the have/want through tables, and the
+canonical names are written back to skills_have / skills_want for
+display.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Skill, SkillAlias, UserSkillHave, UserSkillWant
+from .autocomplete import skills_changed as autocomplete_skills_changed
+from .recommendations import refresh_later
+from .trigrams import index_skills
+
+MAX_SKILL_LENGTH = 100
+
+
+def normalize_skill_name(name):
+    return re.sub(r'\s+', ' ', name).strip().lower()[:MAX_SKILL_LENGTH]
+
+
+def parse_skills(text):
+    """Split a comma-separated skills string into distinct display names"""
+    names = {}
+    for name in (text or '').split(','):
+        name = re.sub(r'\s+', ' ', name).strip()[:MAX_SKILL_LENGTH]
+        if name:
+            names.setdefault(normalize_skill_name(name), name)
+    return list(names.values())
+
+
+def find_skills(names):
+    """Map of normalized name to Skill for the names that already exist"""
+    normalized = {normalize_skill_name(name) for name in names}
+    if not normalized:
+        return {}
+
+    found = {
+        skill.normalized_name: skill
+        for skill in Skill.objects.filter(normalized_name__in=normalized)
+    }
+    aliases = SkillAlias.objects.filter(alias__in=normalized - set(found)).select_related('skill')
+    for alias in aliases:
+        found[alias.alias] = alias.skill
+    return found
+
+
+def resolve_skills(names):
+    """Canonical Skill for each name, creating the unknown ones"""
+    found = find_skills(names)
+    missing = {}
+    for name in names:
+        normalized = normalize_skill_name(name)
+        if normalized not in found:
+            missing.setdefault(normalized, Skill(name=name, normalized_name=normalized))
+
+    if missing:
+        Skill.objects.bulk_create(missing.values(), ignore_conflicts=True)
+        created = find_skills([skill.name for skill in missing.values()])
+        # bulk_create skips the post_save signal that indexes new skills
+        index_skills(list(created.values()))
+        found.update(created)
+
+    skills = []
+    for name in names:
+        skill = found[normalize_skill_name(name)]
+        if skill not in skills:
+            skills.append(skill)
+    return skills
+
+
+def skill_ids_matching(text):
+    """Ids of the skills that text names exactly or through an alias"""
+    normalized = normalize_skill_name(text)
+    return list(
+        Skill.objects.filter(Q(normalized_name=normalized) | Q(aliases__alias=normalized))
+        .values_list('id', flat=True)
+        .distinct()
+    )
+
+
+def set_user_skills(user, skills_have=None, skills_want=None):
+    """
+    Replace the user's have and/or want skills from comma-separated strings
+    and store the canonical names back on the user. Passing None leaves
+    that side unchanged.
+    """
+    update_fields = []
+    # Listings gained (+1) and lost (-1) per skill, for the autocomplete index
+    deltas = {}
+    added = []
+    for text, through, field in (
+        (skills_have, UserSkillHave, 'skills_have'),
+        (skills_want, UserSkillWant, 'skills_want'),
+    ):
+        if text is None:
+            continue
+
+        skills = resolve_skills(parse_skills(text))
+        listed = through.objects.filter(user=user)
+        # The string mirrors the table, so an empty one means no rows
+        previous = set(listed.values_list('skill_id', flat=True)) if getattr(user, field) else set()
+        if previous:
+            listed.delete()
+        through.objects.bulk_create([through(user=user, skill=skill) for skill in skills])
+
+        for skill in skills:
+            if skill.id not in previous:
+                deltas[skill.id] = deltas.get(skill.id, 0) + 1
+                added.append(skill)
+        for skill_id in previous - {skill.id for skill in skills}:
+            deltas[skill_id] = deltas.get(skill_id, 0) - 1
+
+        setattr(user, field, ', '.join(skill.name for skill in skills)[:255])
+        update_fields.append(field)
+
+    if update_fields:
+        user.save(update_fields=update_fields)
+        transaction.on_commit(lambda: refresh_later(user.id))
+        transaction.on_commit(lambda: autocomplete_skills_changed(deltas, added))
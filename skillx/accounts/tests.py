@@ -1,3 +1,1941 @@
-from django.test import TestCase
+import gzip
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import URLPattern, resolve
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from skillx.asgi import application
+
+from . import autocomplete, compression, events, graph, metrics, recommendations
+from .audit import AuditLog, DatabaseBackend, FileBackend
+from .events import publish
+from .export import stream_ndjson
+from .urls import urlpatterns
+from .models import ArchivedMessage, AuditEvent, ChangeEvent, ConnectionRequest, Conversation, MessageToken, Skill, SkillAlias, SkillMatch, User, UserTrigram, Message
+from .pagination import encode_cursor
+from .querybudget import QueryInspectorMiddleware, QueryRecorder, budget_for, query_shape
+from .query_plans import find_full_scans
+from .renderers import FastJSONParser, FastJSONRenderer
+from .search import search_messages
+from .skills import set_user_skills
+from .views import MyConnectionsView, SyncView
+
+
+def make_message(sender, receiver, content, minutes_ago=0, is_read=False):
+    message = Message.objects.create(sender=sender, receiver=receiver, content=content, is_read=is_read)
+    # timestamp is auto_now_add, so backdate it with an update
+    Message.objects.filter(id=message.id).update(timestamp=timezone.now() - timedelta(minutes=minutes_ago))
+    message.refresh_from_db()
+    Conversation.objects.record_message(message)
+    return message
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # In-process indexes outlive each test's rolled back transaction
+        autocomplete.discard()
+        graph.invalidate()
+        # Refreshes run when a test flushes them, not on a thread outside its transaction
+        self.refresh_queue = recommendations.RefreshQueue(background=False)
+        patcher = mock.patch.object(recommendations, 'get_refresh_queue', return_value=self.refresh_queue)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+
+class ConversationSummaryTests(APITestCase):
+    def test_one_row_per_partner_newest_first(self):
+        make_message(self.alice, self.bob, 'hi bob', minutes_ago=30)
+        make_message(self.bob, self.alice, 'hi alice', minutes_ago=20)
+        make_message(self.carol, self.alice, 'hey', minutes_ago=10)
+        make_message(self.carol, self.alice, 'you there?', minutes_ago=5)
+
+        response = self.client.get('/api/conversations/?summary=true')
+
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([row['other_user_id'] for row in results], [self.carol.id, self.bob.id])
+        self.assertEqual(results[0]['last_message'], 'you there?')
+        self.assertEqual(results[0]['unread_count'], 2)
+        self.assertEqual(results[1]['last_message'], 'hi alice')
+        self.assertEqual(results[1]['unread_count'], 1)
+        self.assertNotIn('messages', results[0])
+
+    def test_pagination(self):
+        make_message(self.alice, self.bob, 'older', minutes_ago=30)
+        make_message(self.alice, self.carol, 'newer', minutes_ago=10)
+
+        first = self.client.get('/api/conversations/?summary=true&page_size=1')
+        second = self.client.get('/api/conversations/?summary=true&page_size=1&page=2')
+
+        self.assertTrue(first.data['has_next'])
+        self.assertEqual(first.data['results'][0]['other_user_id'], self.carol.id)
+        self.assertFalse(second.data['has_next'])
+        self.assertEqual(second.data['results'][0]['other_user_id'], self.bob.id)
+
+    def test_preview_is_truncated(self):
+        make_message(self.bob, self.alice, 'x' * 500)
+
+        response = self.client.get('/api/conversations/?summary=true')
+
+        self.assertEqual(len(response.data['results'][0]['last_message']), 100)
+
+    def test_invalid_page_size(self):
+        response = self.client.get('/api/conversations/?summary=true&page_size=0')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ConversationMessagesTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.thread = [
+            make_message(self.alice if i % 2 else self.bob, self.bob if i % 2 else self.alice, f'm{i}', minutes_ago=50 - i)
+            for i in range(5)
+        ]
+        make_message(self.carol, self.alice, 'other thread')
+
+    def url(self, query=''):
+        return f'/api/conversations/{self.bob.id}/messages/{query}'
+
+    def test_latest_page_then_older(self):
+        latest = self.client.get(self.url('?page_size=2'))
+
+        self.assertEqual([m['content'] for m in latest.data['results']], ['m3', 'm4'])
+        self.assertTrue(latest.data['has_older'])
+        self.assertFalse(latest.data['has_newer'])
+
+        older = self.client.get(self.url(f"?page_size=2&before={latest.data['older_cursor']}"))
+        oldest = self.client.get(self.url(f"?page_size=2&before={older.data['older_cursor']}"))
+
+        self.assertEqual([m['content'] for m in older.data['results']], ['m1', 'm2'])
+        self.assertEqual([m['content'] for m in oldest.data['results']], ['m0'])
+        self.assertFalse(oldest.data['has_older'])
+
+    def test_newer_than_cursor(self):
+        oldest = self.client.get(self.url('?page_size=5'))
+        cursor = self.client.get(self.url(f"?page_size=1&before={oldest.data['newer_cursor']}")).data['older_cursor']
+
+        newer = self.client.get(self.url(f'?page_size=10&after={cursor}'))
+
+        self.assertEqual([m['content'] for m in newer.data['results']], ['m4'])
+        self.assertFalse(newer.data['has_newer'])
+
+    def test_same_timestamp_is_split_by_id(self):
+        Message.objects.filter(sender=self.alice, receiver=self.bob).update(timestamp=self.thread[0].timestamp)
+        Message.objects.filter(sender=self.bob, receiver=self.alice).update(timestamp=self.thread[0].timestamp)
+
+        seen = []
+        cursor = None
+        while True:
+            query = f'?page_size=2&before={cursor}' if cursor else '?page_size=2'
+            response = self.client.get(self.url(query))
+            seen = [m['id'] for m in response.data['results']] + seen
+            cursor = response.data['older_cursor']
+            if not response.data['has_older']:
+                break
+
+        self.assertEqual(seen, sorted(m.id for m in self.thread))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url('?before=not-a-cursor'))
+
+        self.assertEqual(response.status_code, 400)
+
+
+class ConversationMaintenanceTests(APITestCase):
+    def conversation(self, user_a, user_b):
+        return Conversation.objects.between(user_a.id, user_b.id).get()
+
+    def test_send_creates_and_updates_conversation(self):
+        self.client.post('/api/send-message/', {'receiver_id': self.bob.id, 'content': 'one'})
+        self.client.post('/api/send-message/', {'receiver_id': self.bob.id, 'content': 'two'})
+
+        conversation = self.conversation(self.alice, self.bob)
+        self.assertEqual(conversation.last_message.content, 'two')
+        self.assertEqual(conversation.unread_count_for(self.bob), 2)
+        self.assertEqual(conversation.unread_count_for(self.alice), 0)
+
+    def test_mark_read_resets_counter(self):
+        make_message(self.bob, self.alice, 'hello')
+
+        self.client.post(f'/api/mark-messages-read/{self.bob.id}/')
+
+        self.assertEqual(self.conversation(self.alice, self.bob).unread_count_for(self.alice), 0)
+
+    def test_deleting_last_message_falls_back_to_previous(self):
+        first = make_message(self.alice, self.bob, 'first', minutes_ago=5)
+        last = make_message(self.alice, self.bob, 'last')
+
+        self.client.delete(f'/api/delete-message/{last.id}/')
+
+        conversation = self.conversation(self.alice, self.bob)
+        self.assertEqual(conversation.last_message_id, first.id)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+
+    def test_deleting_only_message_drops_conversation(self):
+        message = make_message(self.alice, self.bob, 'only')
+
+        self.client.delete(f'/api/delete-message/{message.id}/')
+
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_deleting_last_hot_message_falls_back_to_the_archive(self):
+        old = timezone.now() - timedelta(days=400)
+        ArchivedMessage.objects.create(id=1000, sender=self.bob, receiver=self.alice, content='from last year', timestamp=old)
+        message = make_message(self.alice, self.bob, 'only hot one')
+
+        self.client.delete(f'/api/delete-message/{message.id}/')
+
+        conversation = self.conversation(self.alice, self.bob)
+        self.assertIsNone(conversation.last_message_id)
+        self.assertEqual(conversation.last_activity, old)
+        [summary] = self.client.get('/api/conversations/?summary=true').data['results']
+        self.assertEqual(summary['last_message'], 'from last year')
+        self.assertFalse(summary['last_message_is_from_me'])
+
+        call_command('backfill_conversations', stdout=StringIO())
+        self.assertTrue(Conversation.objects.exists())
+
+    def test_delete_conversation(self):
+        make_message(self.alice, self.bob, 'hi')
+
+        self.client.delete(f'/api/delete-conversation/{self.bob.id}/')
+
+        self.assertFalse(Conversation.objects.exists())
+
+    def test_backfill_rebuilds_from_messages(self):
+        make_message(self.bob, self.alice, 'a', minutes_ago=10)
+        latest = make_message(self.alice, self.bob, 'b', minutes_ago=5)
+        make_message(self.carol, self.bob, 'c', is_read=True)
+        Conversation.objects.all().delete()
+
+        call_command('backfill_conversations', stdout=StringIO())
+
+        conversation = self.conversation(self.alice, self.bob)
+        self.assertEqual(conversation.last_message_id, latest.id)
+        self.assertEqual(conversation.last_activity, latest.timestamp)
+        self.assertEqual(conversation.unread_count_for(self.alice), 1)
+        self.assertEqual(conversation.unread_count_for(self.bob), 1)
+        self.assertEqual(self.conversation(self.bob, self.carol).unread_count_for(self.bob), 0)
+
+    def test_existing_messages_are_migrated(self):
+        migration = importlib.import_module('accounts.migrations.0016_backfill_conversations')
+        make_message(self.bob, self.alice, 'a', minutes_ago=10)
+        latest = make_message(self.alice, self.bob, 'b', minutes_ago=5)
+        old = timezone.now() - timedelta(days=400)
+        ArchivedMessage.objects.create(id=1000, sender=self.carol, receiver=self.alice, content='last year', timestamp=old)
+        Conversation.objects.all().delete()
+
+        migration.backfill_conversations(django_apps, mock.Mock(connection=connection))
+
+        conversation = self.conversation(self.alice, self.bob)
+        self.assertEqual(conversation.last_message_id, latest.id)
+        self.assertEqual(conversation.unread_count_for(self.alice), 1)
+        archived = self.conversation(self.alice, self.carol)
+        self.assertIsNone(archived.last_message_id)
+        self.assertEqual(archived.last_activity, old)
+        results = self.client.get('/api/conversations/?summary=true').data['results']
+        self.assertEqual(len(results), 2)
+
+
+class UnreadCountTests(APITestCase):
+    def unread(self):
+        response = self.client.get('/api/unread-count/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def send(self, sender, receiver, content='hi'):
+        client = APIClient()
+        client.force_authenticate(sender)
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post('/api/send-message/', {'receiver_id': receiver.id, 'content': content})
+
+    def test_cache_miss_is_repaired_from_messages(self):
+        make_message(self.bob, self.alice, 'a')
+        make_message(self.bob, self.alice, 'b')
+        make_message(self.carol, self.alice, 'c', is_read=True)
+
+        self.assertEqual(self.unread(), {'total': 2, 'by_sender': {self.bob.id: 2}})
+
+    def test_counters_served_without_queries(self):
+        self.unread()
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/unread-count/')
+
+    def test_send_increments_and_mark_read_clears(self):
+        self.unread()
+        self.send(self.bob, self.alice)
+        self.send(self.carol, self.alice)
+        self.send(self.carol, self.alice)
+
+        self.assertEqual(self.unread(), {'total': 3, 'by_sender': {self.bob.id: 1, self.carol.id: 2}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/mark-messages-read/{self.carol.id}/')
+
+        self.assertEqual(self.unread(), {'total': 1, 'by_sender': {self.bob.id: 1}})
+
+    def test_deletes_decrement(self):
+        self.unread()
+        message_id = self.send(self.bob, self.alice).data['id']
+        self.send(self.carol, self.alice)
+
+        bob_client = APIClient()
+        bob_client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            bob_client.delete(f'/api/delete-message/{message_id}/')
+
+        self.assertEqual(self.unread(), {'total': 1, 'by_sender': {self.carol.id: 1}})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/delete-conversation/{self.carol.id}/')
+
+        self.assertEqual(self.unread(), {'total': 0, 'by_sender': {}})
+
+    def test_deleted_accounts_leave_the_counters(self):
+        self.unread()
+        self.send(self.bob, self.alice)
+        self.send(self.carol, self.alice)
+        self.bob.set_password('password')
+        self.bob.save()
+
+        bob_client = APIClient()
+        bob_client.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = bob_client.delete('/api/delete-account/', {'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.unread(), {'total': 1, 'by_sender': {self.carol.id: 1}})
+
+
+class WebSocketEventTests(APITestCase):
+    def connect(self, user=None, token=None):
+        if token is None:
+            token = str(AccessToken.for_user(user))
+        return WebsocketCommunicator(application, f'/ws/events/?token={token}', headers=[(b'origin', b'http://localhost')])
+
+    def post_and_commit(self, client, url, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return client.post(url, data or {})
+
+    def test_rejects_invalid_token(self):
+        async def scenario():
+            communicator = self.connect(token='garbage')
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+            self.assertEqual(code, 4401)
+
+        async_to_sync(scenario)()
+
+    def test_receiver_gets_new_message_and_sender_gets_read_receipt(self):
+        bob_client = APIClient()
+        bob_client.force_authenticate(self.bob)
+
+        async def scenario():
+            alice_socket = self.connect(self.alice)
+            bob_socket = self.connect(self.bob)
+            self.assertTrue((await alice_socket.connect())[0])
+            self.assertTrue((await bob_socket.connect())[0])
+
+            response = await sync_to_async(self.post_and_commit)(
+                self.client, '/api/send-message/', {'receiver_id': self.bob.id, 'content': 'hello'})
+            event = await bob_socket.receive_json_from()
+            self.assertEqual(event['type'], 'message.created')
+            self.assertEqual(event['data']['id'], response.data['id'])
+            self.assertEqual((await alice_socket.receive_json_from())['type'], 'message.created')
+
+            await sync_to_async(self.post_and_commit)(bob_client, f'/api/mark-messages-read/{self.alice.id}/')
+            event = await alice_socket.receive_json_from()
+            self.assertEqual(event, {
+                'type': 'messages.read',
+                'data': {'reader_id': self.bob.id, 'sender_id': self.alice.id, 'count': 1},
+            })
+
+            await alice_socket.disconnect()
+            await bob_socket.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_rolled_back_writes_are_not_pushed(self):
+        async def scenario():
+            bob_socket = self.connect(self.bob)
+            await bob_socket.connect()
+
+            # Without executing on-commit callbacks nothing is sent
+            await sync_to_async(self.client.post)('/api/send-message/', {'receiver_id': self.bob.id, 'content': 'x'})
+            self.assertTrue(await bob_socket.receive_nothing())
+            await bob_socket.disconnect()
+
+        async_to_sync(scenario)()
+
+
+class SyncTests(APITestCase):
+    def sync(self, query=''):
+        response = self.client.get(f'/api/sync/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def as_user(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_bootstrap_then_incremental_changes(self):
+        cursor = self.sync()['cursor']
+
+        sent = self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.alice.id, 'content': 'hi'})
+        self.client.post(f'/api/mark-messages-read/{self.bob.id}/')
+        self.as_user(self.carol).post('/api/send-request/', {'receiver_id': self.alice.id})
+        self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.carol.id, 'content': 'not for alice'})
+
+        data = self.sync(f'?cursor={cursor}')
+
+        self.assertEqual(
+            [change['type'] for change in data['changes']],
+            ['message.created', 'messages.read', 'connection.requested'],
+        )
+        self.assertEqual(data['changes'][0]['data']['id'], sent.data['id'])
+        self.assertEqual(self.sync(f"?cursor={data['cursor']}")['changes'], [])
+
+    def test_batches_report_has_more(self):
+        for i in range(3):
+            self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.alice.id, 'content': str(i)})
+
+        with mock.patch.object(SyncView, 'batch_size', 2):
+            first = self.sync('?cursor=0')
+            second = self.sync(f"?cursor={first['cursor']}")
+
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(first['changes']), 2)
+        self.assertFalse(second['has_more'])
+        self.assertEqual(len(second['changes']), 1)
+
+    def test_long_poll_times_out_without_changes(self):
+        data = self.sync('?cursor=0&wait=0.05')
+
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['cursor'], 0)
+
+    def test_pruned_cursor_requests_reset(self):
+        for i in range(3):
+            self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.alice.id, 'content': str(i)})
+        last_id = ChangeEvent.objects.order_by('-id')[0].id
+
+        # Every event goes, so only the recorded floor tells old cursors apart
+        call_command('prune_change_events', '--days=0', stdout=StringIO())
+        self.assertFalse(ChangeEvent.objects.exists())
+
+        data = self.sync('?cursor=0')
+
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['cursor'], last_id)
+        self.assertFalse(self.sync(f"?cursor={data['cursor']}")['reset'])
+
+        self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.alice.id, 'content': 'new'})
+        call_command('prune_change_events', '--days=1', stdout=StringIO())
+        self.assertEqual(len(self.sync(f"?cursor={data['cursor']}")['changes']), 1)
+
+    def test_message_events_carry_ids_not_bodies(self):
+        self.as_user(self.bob).post('/api/send-message/', {'receiver_id': self.alice.id, 'content': 'secret'})
+
+        [change] = self.sync('?cursor=0')['changes']
+
+        self.assertEqual(change['type'], 'message.created')
+        self.assertNotIn('content', change['data'])
+        self.assertEqual(Message.objects.get(id=change['data']['id']).content, 'secret')
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/sync/?cursor=abc')
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_users_are_locked_before_the_first_write(self):
+        # Locking after a foreign key check has share-locked the rows deadlocks on MySQL
+        message = make_message(self.alice, self.bob, 'to delete')
+        pending = ConnectionRequest.objects.create(sender=self.carol, receiver=self.alice)
+        calls = [
+            ('post', '/api/send-message/', {'receiver_id': self.bob.id, 'content': 'hi'}),
+            ('post', '/api/broadcast-message/', {'receiver_ids': [self.bob.id, self.carol.id], 'content': 'hi'}),
+            ('post', '/api/send-request/', {'receiver_id': self.bob.id}),
+            ('post', '/api/accept-requests/', {'request_ids': [pending.id]}),
+            ('delete', f'/api/delete-message/{message.id}/', None),
+            ('post', f'/api/mark-messages-read/{self.bob.id}/', None),
+        ]
+        for method, url, data in calls:
+            log = []
+
+            def record_writes(execute, sql, params, many, context):
+                if sql.startswith(('INSERT', 'UPDATE', 'DELETE')):
+                    log.append('write')
+                return execute(sql, params, many, context)
+
+            def lock_users(user_ids, lock=events.lock_users):
+                log.append('lock')
+                return lock(user_ids)
+
+            with mock.patch('accounts.views.lock_users', lock_users), connection.execute_wrapper(record_writes):
+                response = getattr(self.client, method)(url, data, format='json')
+
+            self.assertLess(response.status_code, 300, url)
+            self.assertEqual(log[0], 'lock', url)
+            self.assertEqual(log.count('lock'), 1, url)
+
+
+class QueryPlanTests(APITestCase):
+    def test_hot_queries_use_indexes(self):
+        self.assertEqual(find_full_scans(self.alice, self.bob), {})
+
+    def test_command_reports_success(self):
+        out = StringIO()
+
+        call_command('check_query_plans', stdout=out)
+
+        self.assertIn('use an index', out.getvalue())
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        # Ten old read messages followed by two recent ones
+        self.old = [
+            make_message(self.alice, self.bob, f'old{i}', minutes_ago=(400 * 24 * 60) - i, is_read=True)
+            for i in range(10)
+        ]
+        self.recent = [make_message(self.bob, self.alice, f'new{i}', minutes_ago=5 - i) for i in range(2)]
+
+    def archive(self, **options):
+        call_command('archive_messages', stdout=StringIO(), **options)
+
+    def history(self, query):
+        return self.client.get(f'/api/conversations/{self.bob.id}/messages/{query}').data
+
+    def test_moves_old_read_messages_in_batches(self):
+        self.archive(batch_size=3)
+
+        self.assertEqual(ArchivedMessage.objects.count(), 10)
+        self.assertEqual(set(Message.objects.values_list('content', flat=True)), {'new0', 'new1'})
+        self.assertEqual(ArchivedMessage.objects.get(id=self.old[0].id).content, 'old0')
+
+    def test_keeps_unread_and_last_messages_hot(self):
+        make_message(self.carol, self.alice, 'old unread', minutes_ago=400 * 24 * 60)
+        make_message(self.alice, self.carol, 'old last', minutes_ago=300 * 24 * 60, is_read=True)
+
+        self.archive()
+
+        self.assertEqual(
+            set(Message.objects.filter(Q(sender=self.carol) | Q(receiver=self.carol)).values_list('content', flat=True)),
+            {'old unread', 'old last'},
+        )
+
+    def test_limit(self):
+        self.archive(limit=4)
+
+        self.assertEqual(ArchivedMessage.objects.count(), 4)
+
+    def test_history_reads_through_to_archive(self):
+        self.archive()
+
+        contents = []
+        cursor = None
+        while True:
+            data = self.history(f'?page_size=4&before={cursor}' if cursor else '?page_size=4')
+            contents = [m['content'] for m in data['results']] + contents
+            cursor = data['older_cursor']
+            if not data['has_older']:
+                break
+
+        self.assertEqual(contents, [f'old{i}' for i in range(10)] + ['new0', 'new1'])
+
+        newer = self.history(f"?page_size=20&after={encode_cursor(self.old[7].timestamp, self.old[7].id)}")
+        self.assertEqual([m['content'] for m in newer['results']], ['old8', 'old9', 'new0', 'new1'])
+
+    def test_delete_archived_message_and_conversation(self):
+        self.archive()
+
+        response = self.client.delete(f'/api/delete-message/{self.old[0].id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ArchivedMessage.objects.filter(id=self.old[0].id).exists())
+
+        self.client.delete(f'/api/delete-conversation/{self.bob.id}/')
+
+        self.assertFalse(ArchivedMessage.objects.exists())
+
+
+class BroadcastTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.others = [User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com') for i in range(10)]
+
+    def broadcast(self, data):
+        return self.client.post('/api/broadcast-message/', data, format='json')
+
+    def test_sends_to_each_receiver_with_per_recipient_results(self):
+        missing_id = self.others[-1].id + 100
+
+        response = self.broadcast({'receiver_ids': [self.bob.id, self.alice.id, missing_id], 'content': 'news'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['sent'], 1)
+        results = response.data['results']
+        self.assertEqual(results[0]['status'], 'sent')
+        self.assertEqual(Message.objects.get(id=results[0]['message_id']).receiver, self.bob)
+        self.assertEqual(results[1]['error'], 'Cannot send message to yourself')
+        self.assertEqual(results[2], {'receiver_id': missing_id, 'status': 'error', 'error': 'User not found'})
+
+    def test_all_connections(self):
+        ConnectionRequest.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        ConnectionRequest.objects.create(sender=self.carol, receiver=self.alice, status='accepted')
+        ConnectionRequest.objects.create(sender=self.alice, receiver=self.others[0], status='pending')
+
+        response = self.broadcast({'all_connections': True, 'content': 'hello all'})
+
+        self.assertEqual(
+            {row['receiver_id'] for row in response.data['results']},
+            {self.bob.id, self.carol.id},
+        )
+
+    def test_updates_conversations_and_events(self):
+        make_message(self.bob, self.alice, 'earlier')
+        make_message(self.alice, self.others[0], 'earlier')
+
+        self.broadcast({'receiver_ids': [self.bob.id, self.others[0].id, self.others[1].id], 'content': 'news'})
+
+        for user in (self.bob, self.others[0], self.others[1]):
+            conversation = Conversation.objects.between(self.alice.id, user.id).get()
+            self.assertEqual(conversation.last_message.content, 'news')
+            self.assertEqual(conversation.unread_count_for(user), 1 if user != self.others[0] else 2)
+            self.assertTrue(ChangeEvent.objects.filter(user=user, event_type='message.created').exists())
+        self.assertEqual(Conversation.objects.between(self.alice.id, self.bob.id).get().unread_count_for(self.alice), 1)
+
+    def test_query_count_is_constant(self):
+        def queries_for(receivers):
+            with CaptureQueriesContext(connection) as context:
+                self.broadcast({'receiver_ids': [user.id for user in receivers], 'content': 'x'})
+            return len(context.captured_queries)
+
+        self.assertEqual(queries_for(self.others[:2]), queries_for(self.others[2:10]))
+
+    def test_rejects_bad_receiver_ids(self):
+        response = self.broadcast({'receiver_ids': 'nope', 'content': 'x'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class MessageSearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.both = make_message(self.bob, self.alice, 'Can you review my Django models and the Django admin?')
+        self.one = make_message(self.alice, self.bob, 'Django is great')
+        self.none = make_message(self.alice, self.carol, 'Let us talk about React')
+        self.foreign = make_message(self.bob, self.carol, 'Django for carol only')
+
+    def search(self, query):
+        response = self.client.get(f'/api/messages/search/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranked_results_scoped_to_user(self):
+        data = self.search('?q=django+admin')
+
+        self.assertEqual([row['id'] for row in data['results']], [self.both.id, self.one.id])
+        self.assertEqual(data['results'][0]['other_user_id'], self.bob.id)
+
+    def test_highlighted_snippet_is_escaped(self):
+        make_message(self.carol, self.alice, '<b>python</b> tips')
+
+        data = self.search('?q=Python')
+
+        self.assertEqual(data['results'][0]['snippet'], '&lt;b&gt;<mark>python</mark>&lt;/b&gt; tips')
+
+    def test_paginated(self):
+        first = self.search('?q=django&page_size=1')
+        second = self.search('?q=django&page_size=1&page=2')
+
+        self.assertTrue(first['has_next'])
+        self.assertFalse(second['has_next'])
+        self.assertNotEqual(first['results'][0]['id'], second['results'][0]['id'])
+
+    def test_broadcast_messages_are_indexed(self):
+        self.client.post('/api/broadcast-message/', {'receiver_ids': [self.bob.id], 'content': 'kubernetes workshop'}, format='json')
+
+        self.assertEqual(len(self.search('?q=kubernetes')['results']), 1)
+
+    def test_rebuild_command(self):
+        MessageToken.objects.all().delete()
+
+        call_command('rebuild_message_search_index', stdout=StringIO())
+
+        self.assertEqual(len(self.search('?q=react')['results']), 1)
+
+    def test_query_required(self):
+        self.assertEqual(self.client.get('/api/messages/search/').status_code, 400)
+
+    def test_fulltext_query_filters_on_the_match_score(self):
+        # SQLite cannot run MATCH ... AGAINST, so only the SQL is checked
+        with mock.patch('accounts.search.uses_fulltext', return_value=True), CaptureQueriesContext(connection) as queries:
+            with self.assertRaises(OperationalError):
+                search_messages(self.alice, 'react hooks', 0, 10)
+
+        sql = queries[-1]['sql']
+        match = "MATCH (accounts_message.content) AGAINST ('react hooks' IN NATURAL LANGUAGE MODE)"
+        self.assertIn(f'({match}) AS "score"', sql)
+        self.assertIn(f'({match}) > 0', sql)
+
+
+class SkillTests(APITestCase):
+    def test_register_links_canonical_skills(self):
+        Skill.objects.create(name='JavaScript', normalized_name='javascript')
+
+        response = APIClient().post('/api/register/', {
+            'username': 'dave', 'email': 'dave@example.com',
+            'password': 'a-Long-passw0rd', 'password_confirm': 'a-Long-passw0rd',
+            'skills_have': 'javascript,  Go , go', 'skills_want': 'Rust',
+        })
+
+        self.assertEqual(response.status_code, 201)
+        dave = User.objects.get(username='dave')
+        self.assertEqual(dave.skills_have, 'JavaScript, Go')
+        self.assertEqual(set(dave.have_skills.values_list('name', flat=True)), {'JavaScript', 'Go'})
+        self.assertEqual(list(dave.want_skills.values_list('name', flat=True)), ['Rust'])
+
+    def test_profile_update_resolves_aliases_and_keeps_other_side(self):
+        js = Skill.objects.create(name='JavaScript', normalized_name='javascript')
+        SkillAlias.objects.create(skill=js, alias='js')
+        self.client.put('/api/profile/', {'username': 'alice', 'email': 'alice@example.com', 'skills_want': 'Python'})
+
+        response = self.client.put('/api/profile/', {'username': 'alice', 'email': 'alice@example.com', 'skills_have': 'JS'})
+
+        self.assertEqual(response.data['skills_have'], 'JavaScript')
+        self.assertEqual(list(self.alice.have_skills.all()), [js])
+        self.assertEqual(list(self.alice.want_skills.values_list('name', flat=True)), ['Python'])
+
+    def test_skill_search_ranks_whole_skills_first(self):
+        set_user_skills(self.bob, skills_have='Java')
+        set_user_skills(self.carol, skills_have='JavaScript, Java')
+        dave = User.objects.create_user(username='dave', email='dave@example.com')
+        set_user_skills(dave, skills_have='JavaScript')
+
+        response = self.client.get('/api/search/?skill=java')
+
+        self.assertEqual([user['username'] for user in response.data], ['bob', 'carol', 'dave'])
+
+    def test_existing_strings_are_migrated(self):
+        migration = importlib.import_module('accounts.migrations.0010_migrate_skill_strings')
+        User.objects.filter(id=self.bob.id).update(skills_have='Python, Django', skills_want='python')
+
+        migration.migrate_skill_strings(django_apps, None)
+
+        self.assertEqual(set(self.bob.have_skills.values_list('normalized_name', flat=True)), {'python', 'django'})
+        self.assertEqual(list(self.bob.want_skills.values_list('normalized_name', flat=True)), ['python'])
+
+
+class FuzzySearchTests(APITestCase):
+    def test_username_typos_and_prefixes_match(self):
+        User.objects.create_user(username='alicia', email='alicia@example.com')
+        User.objects.create_user(username='christopher', email='chris@example.com')
+
+        response = self.client.get('/api/search/?username=bobb')
+        self.assertEqual([user['username'] for user in response.data], ['bob'])
+
+        response = self.client.get('/api/search/?username=chr')
+        self.assertEqual([user['username'] for user in response.data], ['christopher'])
+
+        # The searching user is left out, closer lengths rank first
+        response = self.client.get('/api/search/?username=alic')
+        self.assertEqual([user['username'] for user in response.data], ['alicia'])
+
+    def test_skill_typo_matches(self):
+        set_user_skills(self.bob, skills_have='Python')
+        set_user_skills(self.carol, skills_have='Rust')
+
+        response = self.client.get('/api/search/?skill=pyhton')
+
+        self.assertEqual([user['username'] for user in response.data], ['bob'])
+
+    def test_general_search_merges_usernames_and_skills(self):
+        set_user_skills(self.carol, skills_have='Bobsleigh')
+
+        response = self.client.get('/api/search/?q=bob')
+
+        self.assertEqual([user['username'] for user in response.data], ['bob', 'carol'])
+
+    def test_paginated(self):
+        for i in range(5):
+            User.objects.create_user(username=f'dev{i}', email=f'dev{i}@example.com')
+
+        first = self.client.get('/api/search/?username=dev&page_size=3')
+        second = self.client.get('/api/search/?username=dev&page_size=3&page=2')
+
+        self.assertEqual([user['username'] for user in first.data], ['dev0', 'dev1', 'dev2'])
+        self.assertEqual([user['username'] for user in second.data], ['dev3', 'dev4'])
+
+    def test_index_follows_renames_deletes_and_rebuilds(self):
+        self.bob.username = 'robert'
+        self.bob.save()
+        self.assertEqual([user['username'] for user in self.client.get('/api/search/?username=robert').data], ['robert'])
+        self.assertEqual(self.client.get('/api/search/?username=bob').data, [])
+
+        self.carol.delete()
+        self.assertFalse(UserTrigram.objects.filter(user_id=self.carol.id).exists())
+
+        UserTrigram.objects.all().delete()
+        call_command('rebuild_trigram_index', stdout=StringIO())
+        self.assertEqual([user['username'] for user in self.client.get('/api/search/?username=robrt').data], ['robert'])
+
+
+class ConnectionGraphTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.dave = User.objects.create_user(username='dave', email='dave@example.com')
+        self.erin = User.objects.create_user(username='erin', email='erin@example.com')
+        for sender, receiver in ((self.alice, self.bob), (self.alice, self.carol), (self.bob, self.dave), (self.carol, self.dave), (self.bob, self.erin)):
+            ConnectionRequest.objects.create(sender=sender, receiver=receiver, status='accepted')
+
+    def test_suggestions_ranked_by_mutual_connections(self):
+        response = self.client.get('/api/suggestions/')
+
+        self.assertEqual(
+            [(row['user']['username'], row['mutual_connections']) for row in response.data],
+            [('dave', 2), ('erin', 1)],
+        )
+
+    def test_pending_requests_are_not_suggested(self):
+        ConnectionRequest.objects.create(sender=self.erin, receiver=self.alice)
+
+        response = self.client.get('/api/suggestions/')
+
+        self.assertEqual([row['user']['username'] for row in response.data], ['dave'])
+
+    def test_user_detail_includes_mutual_count(self):
+        response = self.client.get(f'/api/users/{self.dave.id}/')
+
+        self.assertEqual(response.data['mutual_connections'], 2)
+        self.assertNotIn('mutual_connections', self.client.get(f'/api/users/{self.alice.id}/').data)
+
+    def test_accept_and_remove_update_the_graph(self):
+        graph.get_graph()
+        request = ConnectionRequest.objects.create(sender=self.dave, receiver=self.alice)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/accept-request/', {'request_id': request.id})
+
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.get_graph().is_connected(self.alice.id, self.dave.id))
+        self.assertEqual([row['user']['username'] for row in self.client.get('/api/suggestions/').data], ['erin'])
+
+        connection = ConnectionRequest.objects.get(sender=self.alice, receiver=self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/connections/{connection.id}/')
+
+        self.assertEqual(graph.get_graph().mutual_count(self.alice.id, self.erin.id), 0)
+
+    def test_other_processes_changes_are_applied_without_a_reload(self):
+        local = graph.get_graph()
+        self.assertEqual(local.mutual_count(self.alice.id, self.erin.id), 1)
+
+        # Another process removes a connection and adds one
+        with mock.patch.object(graph, '_graph', None):
+            graph.connection_removed(self.bob.id, self.erin.id)
+            graph.connection_added(self.carol.id, self.erin.id)
+
+        with self.assertNumQueries(0):
+            self.assertIs(graph.get_graph(), local)
+        self.assertEqual(local.mutual_count(self.alice.id, self.erin.id), 1)
+        self.assertFalse(local.is_connected(self.bob.id, self.erin.id))
+        self.assertTrue(local.is_connected(self.carol.id, self.erin.id))
+
+    def test_missing_changes_trigger_a_reload(self):
+        self.assertEqual(graph.get_graph().mutual_count(self.alice.id, self.erin.id), 1)
+
+        # Another process removes a connection, and its delta has expired
+        ConnectionRequest.objects.filter(sender=self.bob, receiver=self.erin).delete()
+        cache.incr(graph.VERSION_KEY)
+
+        self.assertEqual(graph.get_graph().mutual_count(self.alice.id, self.erin.id), 0)
+
+    def test_deleted_users_leave_the_graph(self):
+        local = graph.get_graph()
+        self.dave.set_password('password')
+        self.dave.save()
+        dave_id = self.dave.id
+        dave_client = APIClient()
+        dave_client.force_authenticate(self.dave)
+
+        dave_client.delete('/api/delete-account/', {'password': 'password'})
+
+        with self.assertNumQueries(0):
+            self.assertIs(graph.get_graph(), local)
+        self.assertEqual(local.mutual_count(self.bob.id, self.carol.id), 1)
+        self.assertNotIn(dave_id, local.adjacency)
+
+
+class ConnectionRequestTests(APITestCase):
+    def test_one_request_per_pair_in_either_direction(self):
+        self.assertEqual(self.client.post('/api/send-request/', {'receiver_id': self.bob.id}).status_code, 201)
+
+        response = self.client.post('/api/send-request/', {'receiver_id': self.bob.id})
+        self.assertEqual(response.data, {'error': 'Request already sent'})
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.post('/api/send-request/', {'receiver_id': self.alice.id})
+        self.assertEqual(response.data, {'error': 'This user has already sent you a request'})
+
+        ConnectionRequest.objects.update(status='accepted')
+        response = self.client.post('/api/send-request/', {'receiver_id': self.alice.id})
+        self.assertEqual(response.data, {'error': 'Already connected with this user'})
+        self.assertEqual(ConnectionRequest.objects.count(), 1)
+
+    def test_constraint_rejects_duplicates_written_directly(self):
+        ConnectionRequest.objects.create(sender=self.alice, receiver=self.bob)
+
+        with self.assertRaises(IntegrityError):
+            ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice)
+
+    def test_send_checks_receiver_then_inserts(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/send-request/', {'receiver_id': self.bob.id})
+        self.assertEqual(response.status_code, 201)
+
+        # user lock (which finds the receiver), insert, and publish's user check + event insert
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 4)
+
+        self.assertEqual(self.client.post('/api/send-request/', {'receiver_id': 999}).status_code, 404)
+
+    def test_only_the_pair_constraint_means_already_sent(self):
+        with mock.patch.object(ConnectionRequest.objects, 'create', side_effect=IntegrityError('FOREIGN KEY constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/api/send-request/', {'receiver_id': self.bob.id})
+
+    def test_bulk_accept(self):
+        dave = User.objects.create_user(username='dave', email='dave@example.com')
+        from_bob = ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice)
+        from_carol = ConnectionRequest.objects.create(sender=self.carol, receiver=self.alice)
+        to_dave = ConnectionRequest.objects.create(sender=self.alice, receiver=dave)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/accept-requests/', {'request_ids': [from_bob.id, from_carol.id, to_dave.id, 999]}, format='json')
+
+        self.assertEqual(response.data, {'processed': [from_bob.id, from_carol.id], 'not_found': [to_dave.id, 999]})
+        self.assertEqual(
+            set(ConnectionRequest.objects.filter(status='accepted').values_list('id', flat=True)),
+            {from_bob.id, from_carol.id},
+        )
+        self.assertEqual(ChangeEvent.objects.filter(event_type='connection.accepted').count(), 4)
+        self.assertTrue(graph.get_graph().is_connected(self.alice.id, self.carol.id))
+
+    def test_bulk_reject(self):
+        from_bob = ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice)
+        accepted = ConnectionRequest.objects.create(sender=self.carol, receiver=self.alice, status='accepted')
+
+        response = self.client.post('/api/reject-requests/', {'request_ids': [from_bob.id, accepted.id]}, format='json')
+
+        self.assertEqual(response.data, {'processed': [from_bob.id], 'not_found': [accepted.id]})
+        self.assertEqual(list(ConnectionRequest.objects.values_list('id', flat=True)), [accepted.id])
+
+    def test_bulk_requires_a_list(self):
+        response = self.client.post('/api/accept-requests/', {'request_ids': 'all'}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.others = [User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com') for i in range(5)]
+        for other in self.others:
+            ConnectionRequest.objects.create(sender=other, receiver=self.alice, status='accepted')
+
+    def test_connection_lists_use_one_query(self):
+        for url in ('/api/my-connections/', '/api/pending-requests/'):
+            # The version lookup for conditional GET, then the list
+            with self.assertNumQueries(2):
+                self.client.get(url)
+
+        response = self.client.get('/api/my-connections/')
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['sender']['email'], 'user0@example.com')
+
+    def test_fields_limit_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/my-connections/?fields=id,sender.id,sender.username')
+
+        self.assertEqual(response.data[0], {'id': response.data[0]['id'], 'sender': {'id': self.others[0].id, 'username': 'user0'}})
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"email"', queries[1]['sql'])
+        self.assertNotIn('"status"', queries[1]['sql'].split('WHERE')[0])
+
+    def test_whole_nested_field_and_unknown_names(self):
+        response = self.client.get('/api/my-connections/?fields=receiver,bogus')
+
+        self.assertEqual(set(response.data[0]), {'receiver'})
+        self.assertEqual(set(response.data[0]['receiver']), {'id', 'username', 'email', 'bio', 'skills_have', 'skills_want'})
+
+    def test_send_message_fields(self):
+        response = self.client.post('/api/send-message/?fields=id,content,receiver.username', {'receiver_id': self.bob.id, 'content': 'hi'})
+
+        self.assertEqual(set(response.data), {'id', 'content', 'receiver'})
+        self.assertEqual(response.data['receiver'], {'username': 'bob'})
+
+
+class FastJSONTests(TestCase):
+    def assertSameAsDRF(self, data, accepted_media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, accepted_media_type),
+            JSONRenderer().render(data, accepted_media_type),
+        )
+
+    def test_output_matches_drf(self):
+        now = timezone.now()
+        self.assertSameAsDRF({
+            'utc': now,
+            'utc_whole_second': now.replace(microsecond=0),
+            'offset': now.astimezone(timezone.get_fixed_timezone(330)),
+            'date': now.date(),
+            'duration': timedelta(minutes=90),
+            'price': Decimal('12.50'),
+            'lazy': gettext_lazy('Hello'),
+            'text': 'line\u2028separator\u2029 é 🎸 "quoted" </script>',
+            'by_sender': {1: 2, 30: 4},
+            'nested': [None, True, 1.5, {'ids': User.objects.none()}],
+        })
+
+    def test_falls_back_where_orjson_differs(self):
+        self.assertSameAsDRF({'big': 2 ** 70})
+        self.assertSameAsDRF({'a': [1, 2]}, 'application/json; indent=4')
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+    def test_parser_matches_drf(self):
+        for body in (b'{"a": [1, 2.5, "\xc3\xa9"], "b": null}', b'{"big": 123456789012345678901234567890}'):
+            self.assertEqual(FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+
+        for body in (b'{"a": NaN}', b'{"a": ', b''):
+            with self.assertRaises(ParseError) as fast:
+                FastJSONParser().parse(BytesIO(body))
+            with self.assertRaises(ParseError) as drf:
+                JSONParser().parse(BytesIO(body))
+            self.assertEqual(str(fast.exception.detail), str(drf.exception.detail))
+
+    def test_api_uses_fast_renderer(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='alice', email='alice@example.com'))
+
+        response = client.get('/api/unread-count/')
+
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, b'{"total":0,"by_sender":{}}')
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice)
+        make_message(self.carol, self.alice, 'hello')
+
+    def test_unchanged_response_is_a_304_after_one_query(self):
+        for url in ('/api/conversations/?summary=true', '/api/my-connections/', '/api/pending-requests/', '/api/profile/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response['ETag'].startswith('W/"'))
+            self.assertIn('private', response['Cache-Control'])
+
+            with self.assertNumQueries(1):
+                cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.content, b'')
+
+    def test_changes_for_the_user_change_the_etag(self):
+        etag = self.client.get('/api/pending-requests/')['ETag']
+
+        request = ConnectionRequest.objects.get(sender=self.bob)
+        self.client.post('/api/accept-request/', {'request_id': request.id})
+
+        response = self.client.get('/api/pending-requests/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, [])
+
+    def test_profile_updates_reach_related_users(self):
+        connections_etag = self.client.get('/api/pending-requests/')['ETag']
+        conversations_etag = self.client.get('/api/conversations/?summary=true')['ETag']
+
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            bob.put('/api/profile/', {'username': 'bob', 'email': 'bob@example.com', 'bio': 'New bio'})
+
+        response = self.client.get('/api/pending-requests/', HTTP_IF_NONE_MATCH=connections_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['sender']['bio'], 'New bio')
+        self.assertNotEqual(self.client.get('/api/conversations/?summary=true')['ETag'], conversations_etag)
+        # Only bob's own events record the change
+        self.assertEqual(list(ChangeEvent.objects.values_list('user_id', flat=True)), [self.bob.id])
+
+    def test_unrelated_profile_updates_keep_the_etag(self):
+        etag = self.client.get('/api/my-connections/')['ETag']
+        dave = User.objects.create_user(username='dave', email='dave@example.com')
+        dave.bio = 'Changed'
+        dave.save()
+
+        self.assertEqual(self.client.get('/api/my-connections/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_deleted_partners_change_the_etag(self):
+        etag = self.client.get('/api/conversations/?summary=true')['ETag']
+        self.carol.set_password('password')
+        self.carol.save()
+
+        carol = APIClient()
+        carol.force_authenticate(self.carol)
+        with self.captureOnCommitCallbacks(execute=True):
+            carol.delete('/api/delete-account/', {'password': 'password'}, format='json')
+
+        response = self.client.get('/api/conversations/?summary=true', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+    def test_changes_within_a_second_are_not_hidden(self):
+        response = self.client.get('/api/pending-requests/')
+        # Only the ETag validates: If-Modified-Since cannot tell apart
+        # changes made in the same second as the last fetch
+        self.assertNotIn('Last-Modified', response)
+
+        bob = APIClient()
+        bob.force_authenticate(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            bob.put('/api/profile/', {'username': 'bob', 'email': 'bob@example.com', 'bio': 'Now'})
+
+        changed = self.client.get('/api/pending-requests/', HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(changed.status_code, 200)
+
+    def test_saving_a_stale_user_keeps_the_partners_version(self):
+        stale = User.objects.get(id=self.alice.id)
+        User.objects.filter(id=self.alice.id).update(partners_version=1)
+
+        stale.bio = 'Changed'
+        stale.save()
+
+        self.assertEqual(User.objects.values_list('bio', 'partners_version').get(id=self.alice.id), ('Changed', 1))
+
+    def test_pruned_events_do_not_bring_back_an_old_version(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        self.client.put('/api/profile/', {'username': 'alice', 'email': 'alice@example.com', 'bio': 'Changed'})
+        call_command('prune_change_events', '--days=0', stdout=StringIO())
+
+        self.assertEqual(self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CompressionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        compression.reset_stats()
+        for i in range(40):
+            make_message(self.bob, self.alice, f'message number {i} about the same old thing')
+
+    def middleware(self, response):
+        return compression.CompressionMiddleware(lambda request: response)
+
+    def test_large_responses_are_compressed(self):
+        response = self.client.get(f'/api/conversations/{self.bob.id}/messages/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        body = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(body['results']), 40)
+
+        [row] = compression.stats()
+        self.assertEqual(row['endpoint'], '/api/conversations/<int:user_id>/messages/')
+        self.assertEqual(row['responses'], 1)
+        self.assertEqual(row['bytes_out'], len(response.content))
+        self.assertGreater(row['ratio'], 2)
+
+    def test_small_or_unaccepted_responses_are_left_alone(self):
+        small = self.client.get('/api/unread-count/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+        url = f'/api/conversations/{self.bob.id}/messages/'
+        for accept in ('', 'identity', 'gzip;q=0', 'br'):
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING=accept)
+            self.assertFalse(response.has_header('Content-Encoding'), accept)
+        self.assertEqual(compression.stats(), [])
+
+    def test_negotiation(self):
+        preference = ['zstd', 'br', 'gzip']
+
+        self.assertEqual(compression.negotiate('gzip, br, zstd', preference), 'zstd')
+        self.assertEqual(compression.negotiate('gzip, br;q=0.5, zstd;q=0.1', preference), 'gzip')
+        self.assertEqual(compression.negotiate('*;q=0.5, zstd;q=0', preference), 'br')
+        self.assertEqual(compression.negotiate('deflate, bogus;q=x', preference), None)
+        self.assertEqual(compression.negotiate(None, preference), None)
+
+    def test_streaming_responses_are_compressed_per_chunk(self):
+        chunks = [b'{"id": %d}\n' % i * 50 for i in range(3)]
+        response = StreamingHttpResponse(iter(chunks), content_type='application/x-ndjson')
+        request = RequestFactory().get('/export/', HTTP_ACCEPT_ENCODING='gzip')
+
+        response = self.middleware(response)(request)
+        parts = list(response.streaming_content)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # Each chunk is flushed on its own, plus the gzip trailer
+        self.assertEqual(len(parts), 4)
+        self.assertEqual(gzip.decompress(b''.join(parts)), b''.join(chunks))
+        self.assertEqual(compression.stats()[0]['bytes_in'], sum(map(len, chunks)))
+
+    def test_binary_and_encoded_responses_are_not_recompressed(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        archive = HttpResponse(b'PK' * 2000, content_type='application/zip')
+        encoded = HttpResponse(b'x' * 2000, content_type='text/plain', headers={'Content-Encoding': 'br'})
+
+        self.assertFalse(self.middleware(archive)(request).has_header('Content-Encoding'))
+        self.assertEqual(self.middleware(encoded)(request)['Content-Encoding'], 'br')
+
+    def test_stats_endpoint_is_for_staff(self):
+        self.assertEqual(self.client.get('/api/compression-stats/').status_code, 403)
+
+        User.objects.filter(id=self.alice.id).update(is_staff=True)
+        self.alice.refresh_from_db()
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/compression-stats/').data, [])
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice, status='accepted')
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.carol)
+        for i in range(4):
+            make_message(self.alice, self.bob, f'hi {i}')
+        make_message(self.carol, self.bob, 'not for alice')
+        ArchivedMessage.objects.create(id=9999, sender=self.bob, receiver=self.alice, content='old', timestamp=timezone.now())
+
+    def read_ndjson(self, content):
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/export/')
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('skillx-alice.ndjson', response['Content-Disposition'])
+        records = self.read_ndjson(b''.join(response.streaming_content))
+
+        self.assertEqual(records[0]['type'], 'profile')
+        self.assertEqual(records[0]['data']['username'], 'alice')
+        self.assertEqual([r['data']['sender__username'] for r in records if r['type'] == 'connection'], ['bob'])
+        messages = [r['data'] for r in records if r['type'] == 'message']
+        self.assertEqual([m['content'] for m in messages], ['hi 0', 'hi 1', 'hi 2', 'hi 3', 'old'])
+        self.assertEqual(messages[-1]['archived'], True)
+
+    def test_rows_are_read_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(stream_ndjson(self.alice, chunk_size=3))
+
+        # profile, connections in one chunk, messages in 3 + 1, archive in 1
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(len(self.read_ndjson(chunks[2])), 3)
+
+    def test_zip_export(self):
+        response = self.client.get('/api/export/?as=zip')
+
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['profile.json', 'connections.json', 'messages.json'])
+        self.assertEqual(json.loads(archive.read('profile.json'))['email'], 'alice@example.com')
+        self.assertEqual(len(json.loads(archive.read('connections.json'))), 1)
+        self.assertEqual(len(json.loads(archive.read('messages.json'))), 5)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/api/export/?as=csv').status_code, 400)
+
+    def test_command_writes_a_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bob.ndjson')
+            call_command('export_user_data', 'bob', output=path, chunk_size=2, stdout=StringIO())
+
+            with open(path, 'rb') as file:
+                records = self.read_ndjson(file.read())
+
+        self.assertEqual(records[0]['data']['username'], 'bob')
+        self.assertEqual(len([r for r in records if r['type'] == 'message']), 6)
+
+
+class ListBackend:
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+
+class AuditTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.backend = ListBackend()
+        self.audit_log = AuditLog(self.backend, background=False)
+        patcher = mock.patch('accounts.middleware.get_audit_log', return_value=self.audit_log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requests_are_recorded_without_queries(self):
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice, status='accepted')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/my-connections/', HTTP_USER_AGENT='tests', REMOTE_ADDR='10.0.0.1')
+        # No connection counting for the log line
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT COUNT(')])
+        self.assertEqual(self.backend.records, [])
+
+        self.audit_log.flush()
+
+        [record] = self.backend.records
+        self.assertEqual(record['user_id'], self.alice.id)
+        self.assertEqual(record['path'], '/api/my-connections/')
+        self.assertEqual(record['status_code'], 200)
+        self.assertEqual(record['ip_address'], '10.0.0.1')
+        self.assertEqual(record['user_agent'], 'tests')
+        self.assertTrue(record['sensitive'])
+
+    def test_jwt_user_is_recorded(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.bob)}')
+        client.get('/api/unread-count/')
+        APIClient().get('/api/unread-count/')
+        self.audit_log.flush()
+
+        self.assertEqual([(r['user_id'], r['status_code'], r['sensitive']) for r in self.backend.records], [
+            (self.bob.id, 200, False),
+            (None, 401, False),
+        ])
+
+    def test_full_queue_policies(self):
+        dropping = AuditLog(self.backend, queue_size=2, when_full='drop', background=False)
+        blocking = AuditLog(self.backend, queue_size=1, when_full='block', block_timeout=0.01, background=False)
+        entry = (0.0, 'GET', '/api/users/', 200, 1, '127.0.0.1', '')
+
+        for _ in range(3):
+            dropping.record(entry)
+        blocking.record(entry)
+        blocking.record(entry)
+
+        self.assertEqual(dropping.stats(), {'queued': 2, 'written': 0, 'dropped': 1, 'failed': 0})
+        self.assertEqual(blocking.stats()['dropped'], 1)
+
+    def test_batches_are_bounded_and_failures_counted(self):
+        audit_log = AuditLog(mock.Mock(), batch_size=2, background=False)
+        audit_log.backend.write.side_effect = [None, OSError('disk full'), None]
+        for i in range(5):
+            audit_log.record((0.0, 'GET', f'/api/users/{i}/', 200, 1, '', ''))
+
+        with self.assertLogs('security', 'ERROR'):
+            audit_log.flush()
+
+        self.assertEqual([len(call.args[0]) for call in audit_log.backend.write.call_args_list], [2, 2, 1])
+        self.assertEqual(audit_log.stats(), {'queued': 0, 'written': 3, 'dropped': 0, 'failed': 2})
+
+    def test_file_and_database_backends(self):
+        entry = (1700000000.5, 'POST', '/api/send-message/', 201, self.alice.id, '127.0.0.1', 'tests')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'audit.log')
+            audit_log = AuditLog(FileBackend(path), background=False)
+            audit_log.record(entry)
+            audit_log.flush()
+            with open(path) as file:
+                line = json.loads(file.read())
+        self.assertEqual(line['timestamp'], '2023-11-14T22:13:20.500000+00:00')
+        self.assertEqual(line['path'], '/api/send-message/')
+
+        audit_log = AuditLog(DatabaseBackend(), background=False)
+        audit_log.record(entry)
+        audit_log.flush()
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.user_id, event.method, event.status_code), (self.alice.id, 'POST', 201))
+
+
+class DataIsolationTests(APITestCase):
+    """
+    Seeds private rows between bob, carol and dave, then calls every
+    endpoint as alice and checks that none of them comes back or changes.
+    """
+    SECRET = 'SECRET-bob-carol'
+
+    # Query strings each GET endpoint is crawled with
+    queries = {
+        'search/': ['q=bob', 'skill=python'],
+        'skills/autocomplete/': ['prefix=py'],
+        'conversations/': ['', 'summary=true'],
+        'messages/search/': ['q=secret'],
+        'sync/': ['', 'cursor=0'],
+        'export/': ['', 'as=zip'],
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.dave = User.objects.create_user(username='dave', email='dave@example.com')
+        set_user_skills(self.bob, skills_have='Python', skills_want='Rust')
+        set_user_skills(self.carol, skills_have='Rust', skills_want='Python')
+        self.connection = ConnectionRequest.objects.create(sender=self.bob, receiver=self.carol, status='accepted')
+        self.pending = ConnectionRequest.objects.create(sender=self.dave, receiver=self.bob)
+        self.message = self.client_for(self.bob).post('/api/send-message/', {'receiver_id': self.carol.id, 'content': self.SECRET}).data
+        self.archived = ArchivedMessage.objects.create(
+            id=9999, sender=self.carol, receiver=self.bob, content=self.SECRET, timestamp=timezone.now() - timedelta(days=400)
+        )
+        publish([self.bob.id], 'note', {'content': self.SECRET})
+
+        # alice's own data, so that her lists are not trivially empty
+        ConnectionRequest.objects.create(sender=self.alice, receiver=self.bob, status='accepted')
+        make_message(self.bob, self.alice, 'hello alice')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def body(self, response):
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        if response.get('Content-Type') == 'application/zip':
+            archive = zipfile.ZipFile(BytesIO(content))
+            content = b''.join(archive.read(name) for name in archive.namelist())
+        return content
+
+    def assert_only_alices_rows(self, data, url):
+        """Anything with two parties must have alice as one of them"""
+        if isinstance(data, list):
+            for item in data:
+                self.assert_only_alices_rows(item, url)
+        elif isinstance(data, dict):
+            parties = [data.get(key) for key in ('sender_id', 'receiver_id', 'sender', 'receiver') if key in data]
+            parties = [party['id'] if isinstance(party, dict) else party for party in parties]
+            if len(parties) >= 2:
+                self.assertIn(self.alice.id, parties, f'{url} returned {data}')
+            for value in data.values():
+                self.assert_only_alices_rows(value, url)
+
+    def test_every_view_declares_its_owned_models(self):
+        for pattern in urlpatterns:
+            view = pattern.callback.cls
+            if view.__module__.startswith('accounts.'):
+                self.assertIsNotNone(getattr(view, 'owned_models', None), f'{pattern.pattern} does not declare owned_models')
+
+    def test_no_get_endpoint_returns_other_users_rows(self):
+        crawled = 0
+        for pattern in urlpatterns:
+            self.assertIsInstance(pattern, URLPattern)
+            if not hasattr(pattern.callback.cls, 'get'):
+                continue
+            route = str(pattern.pattern).replace('<int:user_id>', str(self.bob.id))
+            for query in self.queries.get(route, ['']):
+                url = f'/api/{route}?{query}'
+                response = self.client.get(url)
+                body = self.body(response)
+
+                self.assertLess(response.status_code, 500, url)
+                self.assertNotIn(self.SECRET.encode(), body, url)
+                if response.get('Content-Type') == 'application/json':
+                    self.assert_only_alices_rows(json.loads(body), url)
+                elif response.get('Content-Type') == 'application/x-ndjson':
+                    self.assert_only_alices_rows([json.loads(line) for line in body.splitlines()], url)
+                crawled += 1
+        self.assertGreater(crawled, 15)
+
+    def test_no_write_endpoint_touches_other_users_rows(self):
+        for method, url, data in [
+            ('delete', f'/api/connections/{self.connection.id}/', None),
+            ('delete', f'/api/delete-message/{self.message["id"]}/', None),
+            ('delete', f'/api/delete-message/{self.archived.id}/', None),
+            ('post', '/api/accept-request/', {'request_id': self.pending.id}),
+            ('post', '/api/reject-request/', {'request_id': self.pending.id}),
+            ('post', '/api/accept-requests/', {'request_ids': [self.pending.id]}),
+            ('post', '/api/reject-requests/', {'request_ids': [self.pending.id]}),
+        ]:
+            response = getattr(self.client, method)(url, data, format='json')
+            self.assertIn(response.status_code, (200, 404), url)
+            self.assertNotIn(self.SECRET, json.dumps(response.data), url)
+
+        self.client.post(f'/api/mark-messages-read/{self.carol.id}/')
+        self.client.delete(f'/api/delete-conversation/{self.carol.id}/')
+
+        self.assertTrue(ConnectionRequest.objects.filter(id=self.connection.id, status='accepted').exists())
+        self.assertTrue(ConnectionRequest.objects.filter(id=self.pending.id, status='pending').exists())
+        self.assertTrue(Message.objects.filter(id=self.message['id'], is_read=False).exists())
+        self.assertTrue(ArchivedMessage.objects.filter(id=self.archived.id).exists())
+        self.assertTrue(Conversation.objects.between(self.bob.id, self.carol.id).exists())
+
+    def test_undeclared_models_are_refused(self):
+        with mock.patch.object(MyConnectionsView, 'owned_models', ()):
+            with self.assertRaises(ImproperlyConfigured):
+                self.client.get('/api/my-connections/')
+
+
+class MetricsTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(metrics, 'registry', metrics.Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+        compression.reset_stats()
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice, status='accepted')
+        settings_override = override_settings(METRICS_TOKEN='s3cret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def scrape(self, **extra):
+        extra.setdefault('HTTP_AUTHORIZATION', 'Bearer s3cret')
+        response = self.client.get('/metrics', **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    def test_requests_are_counted_per_view(self):
+        self.client.get('/api/my-connections/')
+        self.client.get('/api/my-connections/')
+        self.client.get('/api/users/999/')
+
+        text = self.scrape()
+
+        view = 'view="accounts.views.MyConnectionsView"'
+        self.assertIn(f'skillx_http_requests_total{{{view},method="GET",status="200"}} 2', text)
+        self.assertIn('skillx_http_requests_total{view="user_detail",method="GET",status="404"} 1', text)
+        self.assertIn(f'skillx_http_request_duration_seconds_count{{{view}}} 2', text)
+        self.assertIn(f'skillx_http_request_duration_seconds_bucket{{{view},le="+Inf"}} 2', text)
+        # The version lookup for conditional GET and the list itself
+        self.assertIn(f'skillx_db_queries_per_request_bucket{{{view},le="1"}} 0', text)
+        self.assertIn(f'skillx_db_queries_per_request_bucket{{{view},le="2"}} 2', text)
+        self.assertIn(f'skillx_db_queries_per_request_sum{{{view}}} 4', text)
+        self.assertIn(f'skillx_db_query_seconds_total{{{view}}}', text)
+        self.assertIn('# TYPE skillx_http_request_duration_seconds histogram', text)
+        self.assertIn('skillx_audit_records_total{outcome="dropped"}', text)
+
+    def test_response_bytes_and_compression(self):
+        for i in range(30):
+            make_message(self.bob, self.alice, f'message {i} with some padding to compress')
+        compressed = self.client.get(f'/api/conversations/{self.bob.id}/messages/', HTTP_ACCEPT_ENCODING='gzip')
+        export = self.client.get('/api/export/')
+        body = b''.join(export.streaming_content)
+
+        text = self.scrape()
+
+        self.assertIn(f'skillx_http_response_bytes_total{{view="accounts.conversations_view.get_conversation_messages"}} {len(compressed.content)}', text)
+        self.assertIn(f'skillx_http_response_bytes_total{{view="accounts.views.ExportView"}} {len(body)}', text)
+        # The export's queries run while it streams
+        self.assertIn('skillx_db_queries_per_request_bucket{view="accounts.views.ExportView",le="0"} 0', text)
+        self.assertIn('skillx_compression_responses_total{endpoint="/api/conversations/<int:user_id>/messages/",encoding="gzip"} 1', text)
+
+    def test_totals_of_all_worker_processes(self):
+        other = metrics.Registry()
+        other.inc('skillx_http_requests_total', (('view', 'accounts.views.MyConnectionsView'), ('method', 'GET'), ('status', '200')), 5)
+        other.observe('skillx_http_request_duration_seconds', (('view', 'accounts.views.MyConnectionsView'),), 0.02)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, '1-1.json'), 'w') as file:
+                json.dump(other.dump(), file)
+            with open(os.path.join(directory, '2-1.json'), 'w') as file:
+                file.write('{"counters": [')
+            self.client.get('/api/my-connections/')
+
+            text = self.scrape()
+            self.assertEqual(len(os.listdir(directory)), 3)
+
+        self.assertIn('skillx_http_requests_total{view="accounts.views.MyConnectionsView",method="GET",status="200"} 6', text)
+        self.assertIn('skillx_http_request_duration_seconds_count{view="accounts.views.MyConnectionsView"} 2', text)
+
+    def test_forked_workers_write_their_own_files(self):
+        labels = (('view', 'accounts.views.MyConnectionsView'), ('method', 'GET'), ('status', '200'))
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            # Two workers forked from one preloading master: same module state, different pids
+            with mock.patch.object(metrics.os, 'getpid', return_value=1001):
+                metrics.registry.inc('skillx_http_requests_total', labels, 2)
+                metrics.flush(force=True)
+            with mock.patch.object(metrics.os, 'getpid', return_value=1002):
+                metrics.registry.inc('skillx_http_requests_total', labels, 1)
+                text = metrics.render(metrics.collect())
+
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+        # 2 from the first worker's file, 3 from the second's
+        self.assertIn('skillx_http_requests_total{view="accounts.views.MyConnectionsView",method="GET",status="200"} 5', text)
+
+    def test_forked_workers_start_from_zero(self):
+        self.registry.inc('skillx_http_requests_total', (('view', 'x'),))
+        started_at = metrics._started_at
+        time.sleep(0.002)
+
+        # setUp's patch puts the original registry back afterwards
+        metrics._forked()
+
+        self.assertEqual(metrics.registry.dump()['counters'], [])
+        self.assertNotEqual(metrics._started_at, started_at)
+
+    def test_access(self):
+        # Local addresses are not trusted unless listed: a reverse proxy
+        # on the same host makes every request come from 127.0.0.1
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        self.scrape(REMOTE_ADDR='10.0.0.5')
+
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.scrape(REMOTE_ADDR='10.0.0.5', HTTP_AUTHORIZATION='')
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.6').status_code, 403)
+
+    def test_concurrent_flushes_do_not_share_a_temporary_file(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            errors = []
+
+            def flush():
+                try:
+                    for _ in range(20):
+                        metrics.flush(force=True)
+                except OSError as error:
+                    errors.append(error)
+
+            threads = [threading.Thread(target=flush) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual(errors, [])
+            self.assertEqual(os.listdir(directory), [metrics.file_name()])
+
+    def test_label_values_are_escaped(self):
+        self.registry.inc('skillx_http_requests_total', (('view', 'a"b\\c\nd'),))
+
+        self.assertIn('skillx_http_requests_total{view="a\\"b\\\\c\\nd"} 1', metrics.render(self.registry))
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Calls every endpoint against enough seeded rows that a query per row
+    would show, and holds each to the query_budget its view declares.
+    """
+    ROWS = 8
+
+    def setUp(self):
+        super().setUp()
+        self.alice.set_password('password')
+        self.alice.save()
+        set_user_skills(self.alice, skills_have='Python, Django', skills_want='Rust')
+        self.others = []
+        for i in range(self.ROWS):
+            user = User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com')
+            set_user_skills(user, skills_have='Rust', skills_want='Python')
+            ConnectionRequest.objects.create(sender=user, receiver=self.alice, status='accepted')
+            make_message(user, self.alice, f'hello {i}', minutes_ago=i)
+            make_message(self.alice, user, f'hi back {i}', minutes_ago=i, is_read=True)
+            ArchivedMessage.objects.create(id=10000 + i, sender=user, receiver=self.alice, content=f'old {i}', timestamp=timezone.now() - timedelta(days=400))
+            self.others.append(user)
+        self.requests = [
+            ConnectionRequest.objects.create(sender=User.objects.create_user(username=f'fan{i}', email=f'fan{i}@example.com'), receiver=self.alice)
+            for i in range(4)
+        ]
+        for user in self.others[:3]:
+            ConnectionRequest.objects.create(sender=user, receiver=self.bob, status='accepted')
+        for user in (self.bob, self.carol):
+            set_user_skills(user, skills_have='Rust', skills_want='Django')
+        call_command('rebuild_recommendations', stdout=StringIO())
+
+    def endpoints(self):
+        first, second = self.others[:2]
+        message = Message.objects.filter(sender=self.alice).first()
+        connection_id = ConnectionRequest.objects.get(sender=first, receiver=self.alice).id
+        return [
+            ('get', '/api/profile/', None),
+            ('put', '/api/profile/', {'username': 'alice', 'email': 'alice@example.com', 'skills_have': 'Python, Go'}),
+            ('get', f'/api/users/{first.id}/', None),
+            ('get', '/api/users/', None),
+            ('get', '/api/search/?q=user', None),
+            ('get', '/api/search/?skill=rust', None),
+            ('get', '/api/recommendations/', None),
+            ('get', '/api/suggestions/', None),
+            ('get', '/api/skills/autocomplete/?prefix=r', None),
+            ('post', '/api/send-request/', {'receiver_id': self.carol.id}),
+            ('get', '/api/pending-requests/', None),
+            ('post', '/api/accept-request/', {'request_id': self.requests[0].id}),
+            ('post', '/api/reject-request/', {'request_id': self.requests[1].id}),
+            ('post', '/api/accept-requests/', {'request_ids': [self.requests[2].id]}),
+            ('post', '/api/reject-requests/', {'request_ids': [self.requests[3].id]}),
+            ('get', '/api/my-connections/', None),
+            ('delete', f'/api/connections/{connection_id}/', None),
+            ('get', '/api/conversations/', None),
+            ('get', '/api/conversations/?summary=true', None),
+            ('get', f'/api/conversations/{second.id}/messages/', None),
+            ('post', '/api/send-message/', {'receiver_id': second.id, 'content': 'hey'}),
+            ('post', '/api/broadcast-message/', {'content': 'news', 'all_connections': True}),
+            ('get', '/api/messages/search/?q=hello', None),
+            ('delete', f'/api/delete-message/{message.id}/', None),
+            ('delete', f'/api/delete-conversation/{self.others[3].id}/', None),
+            ('post', f'/api/mark-messages-read/{self.others[4].id}/', None),
+            ('get', '/api/unread-count/', None),
+            ('get', '/api/sync/?cursor=0', None),
+            ('get', '/api/export/', None),
+            ('get', '/api/compression-stats/', None),
+            ('post', '/api/logout/', None),
+            ('post', '/api/register/', {'username': 'erin', 'email': 'erin@example.com', 'password': 'a-Long-passw0rd', 'password_confirm': 'a-Long-passw0rd', 'skills_have': 'Go'}),
+            ('delete', '/api/delete-account/', {'password': 'password'}),
+        ]
+
+    def call(self, method, url, data):
+        # Work deferred with on_commit counts against the request that queued it
+        with QueryRecorder() as recorder, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return response, recorder
+
+    def test_every_view_declares_a_budget(self):
+        for pattern in urlpatterns:
+            view = pattern.callback.cls
+            if view.__module__.startswith('accounts.'):
+                for method in view.http_method_names:
+                    if hasattr(view, method) and method not in ('options', 'head'):
+                        self.assertIsNotNone(budget_for(view, method), f'{pattern.pattern} {method.upper()} has no query budget')
+
+    def test_endpoints_stay_within_their_budgets(self):
+        covered = set()
+        for method, url, data in self.endpoints():
+            response, recorder = self.call(method, url, data)
+            label = f'{method.upper()} {url}'
+            self.assertLess(response.status_code, 500, label)
+            match = resolve(url.split('?')[0])
+            covered.add(match.route)
+
+            budget = budget_for(match.func.cls, method)
+            self.assertLessEqual(recorder.count, budget, f'{label} ran {recorder.count} queries:\n' + '\n'.join(recorder.queries))
+            self.assertEqual(recorder.repeated(), {}, f'{label} repeats queries')
+
+        routes = {str(pattern.pattern) for pattern in urlpatterns}
+        self.assertEqual(routes - {route[len('api/'):] for route in covered}, {'login/', 'refresh/'})
+
+    def test_query_shapes(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM "t" WHERE "t"."id" IN (%s, %s, %s) AND "name" = \'x\' LIMIT 21'),
+            query_shape('SELECT * FROM "t" WHERE "t"."id" IN (%s) AND "name" = \'y\' LIMIT 1'),
+        )
+
+    def test_per_row_queries_are_caught(self):
+        with QueryRecorder() as recorder:
+            for conn in ConnectionRequest.objects.filter(receiver=self.alice, status='accepted'):
+                conn.sender.username
+
+        self.assertEqual(list(recorder.repeated().values()), [self.ROWS])
+
+    def test_inspector_middleware_warns_in_debug_only(self):
+        def per_row_view(request):
+            for conn in ConnectionRequest.objects.filter(receiver=self.alice, status='accepted'):
+                conn.sender.username
+            return HttpResponse()
+
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryInspectorMiddleware(per_row_view)
+
+        with override_settings(DEBUG=True):
+            middleware = QueryInspectorMiddleware(per_row_view)
+        with self.assertLogs('accounts.queries', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/api/my-connections/'))
+
+        self.assertEqual(response['X-Query-Count'], str(self.ROWS + 1))
+        self.assertIn(f'ran this query {self.ROWS} times (N+1?)', logs.output[0])
+
+
+class SkillAutocompleteTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            set_user_skills(self.alice, skills_have='Python', skills_want='PyTorch')
+            set_user_skills(self.bob, skills_have='PyTorch, Rust')
+            set_user_skills(self.carol, skills_want='pytorch')
+
+    def test_prefix_matches_weighted_by_listings(self):
+        response = self.client.get('/api/skills/autocomplete/?prefix=PY')
+
+        self.assertEqual(response.data, [
+            {'id': Skill.objects.get(name='PyTorch').id, 'name': 'PyTorch', 'users': 3},
+            {'id': Skill.objects.get(name='Python').id, 'name': 'Python', 'users': 1},
+        ])
+
+    def test_answers_from_memory_until_a_profile_changes(self):
+        rust = Skill.objects.get(name='Rust')
+        self.client.get('/api/skills/autocomplete/?prefix=ru')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete.complete('ru'), [(rust.id, 'Rust', 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_user_skills(self.carol, skills_have='Ruby')
+            set_user_skills(self.bob, skills_have='PyTorch')
+
+        # Applied to the index in place rather than rebuilt
+        with self.assertNumQueries(0):
+            self.assertEqual([name for _, name, _ in autocomplete.complete('ru')], ['Ruby'])
+            self.assertEqual(autocomplete.complete('py')[0][1:], ('PyTorch', 3))
+
+    def test_aliases_complete_to_the_canonical_skill(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alias = SkillAlias.objects.create(skill=Skill.objects.get(name='PyTorch'), alias='torch')
+
+        response = self.client.get('/api/skills/autocomplete/?prefix=tor')
+        self.assertEqual([row['name'] for row in response.data], ['PyTorch'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            alias.delete()
+        self.assertEqual(autocomplete.complete('tor'), [])
+
+    def test_rebuilds_in_the_background(self):
+        old = autocomplete.get_index()
+        new = autocomplete.PrefixIndex([('rust', 1, 'Rust')], {1: 5})
+        started = threading.Event()
+        release = threading.Event()
+
+        def build_index():
+            started.set()
+            release.wait(5)
+            return new
+
+        with mock.patch('accounts.autocomplete.build_index', build_index):
+            autocomplete.invalidate()
+            self.assertIs(autocomplete.get_index(), old)
+            self.assertTrue(started.wait(5))
+            self.assertIs(autocomplete.get_index(), old)
+            release.set()
+            for _ in range(100):
+                if autocomplete.get_index() is new:
+                    break
+                time.sleep(0.01)
+
+        self.assertIs(autocomplete.get_index(), new)
+
+    def test_prefix_required(self):
+        self.assertEqual(self.client.get('/api/skills/autocomplete/?prefix=%20').status_code, 400)
+
+
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        set_user_skills(self.alice, skills_have='Python, Django', skills_want='Rust, Go')
+        set_user_skills(self.bob, skills_have='Rust', skills_want='Python')
+        set_user_skills(self.carol, skills_have='Go, Rust')
+
+    def test_rebuild_ranks_mutual_matches_first(self):
+        call_command('rebuild_recommendations', stdout=StringIO())
+
+        response = self.client.get('/api/recommendations/')
+
+        # bob and alice can teach each other (1 + 1 + 1), carol only teaches (2 + 0 + 0)
+        self.assertEqual([(row['user']['username'], row['score']) for row in response.data], [('bob', 3.0), ('carol', 2.0)])
+        self.assertEqual(response.data[0]['they_have'], ['Rust'])
+        self.assertEqual(response.data[0]['they_want'], ['Python'])
+        self.assertEqual(response.data[1]['they_have'], ['Go', 'Rust'])
+
+    def test_profile_change_refreshes_both_sides(self):
+        call_command('rebuild_recommendations', stdout=StringIO())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_user_skills(self.carol, skills_want='Django')
+        # Queued by the save, run off the request path
+        self.assertEqual(SkillMatch.objects.get(user=self.alice, candidate=self.carol).score, 2.0)
+        self.refresh_queue.flush()
+
+        self.assertEqual(SkillMatch.objects.get(user=self.alice, candidate=self.carol).score, 4.0)
+        self.assertEqual(SkillMatch.objects.get(user=self.carol, candidate=self.alice).score, 4.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            set_user_skills(self.bob, skills_have='', skills_want='')
+        self.refresh_queue.flush()
+
+        self.assertFalse(SkillMatch.objects.filter(Q(user=self.bob) | Q(candidate=self.bob)).exists())
+
+    def test_refresh_survives_a_concurrent_refresh_of_a_candidate(self):
+        inserted = []
+
+        def refresh_bob_meanwhile(execute, sql, params, many, context):
+            result = execute(sql, params, many, context)
+            if sql.startswith('DELETE FROM "accounts_skillmatch"') and not inserted:
+                # bob's refresh upserts (alice, bob) between alice's delete and insert
+                inserted.append(SkillMatch.objects.create(user=self.alice, candidate=self.bob, score=1.0))
+            return result
+
+        with connection.execute_wrapper(refresh_bob_meanwhile):
+            recommendations.refresh_user(self.alice.id)
+
+        self.assertTrue(inserted)
+        self.assertEqual(SkillMatch.objects.get(user=self.alice, candidate=self.bob).score, 3.0)
+
+    def test_refresh_keeps_other_lists_at_top_k(self):
+        call_command('rebuild_recommendations', stdout=StringIO())
+        dave = User.objects.create_user(username='dave', email='dave@example.com')
+        set_user_skills(dave, skills_have='Rust, Go', skills_want='Python')
+
+        with mock.patch.object(recommendations, 'TOP_K', 2):
+            recommendations.refresh_user(dave.id)
+
+        # dave (2 + 1 + 1) enters alice's full list and pushes carol (2) out
+        self.assertEqual(
+            list(SkillMatch.objects.filter(user=self.alice).order_by('-score', 'candidate_id').values_list('candidate__username', flat=True)),
+            ['dave', 'bob'],
+        )
+
+    def test_refresh_caps_the_lists_it_enters(self):
+        dave = User.objects.create_user(username='dave', email='dave@example.com')
+        set_user_skills(dave, skills_have='Python')
+
+        with mock.patch.object(recommendations, 'MAX_REVERSE_UPDATES', 1):
+            recommendations.refresh_user(self.bob.id)
+
+        # bob scores 3 with alice and 1 with dave; only the best list gets him
+        self.assertEqual(list(SkillMatch.objects.filter(candidate=self.bob).values_list('user__username', flat=True)), ['alice'])
+
+    def test_saves_queue_each_user_once(self):
+        queue = recommendations.RefreshQueue(background=False)
+        with mock.patch.object(recommendations, 'refresh_user') as refresh_user:
+            queue.add(self.bob.id)
+            queue.add(self.alice.id)
+            queue.add(self.bob.id)
+            queue.flush()
+
+        self.assertEqual(refresh_user.call_args_list, [mock.call(self.bob.id), mock.call(self.alice.id)])
+
+    def test_connected_users_are_excluded(self):
+        call_command('rebuild_recommendations', stdout=StringIO())
+        ConnectionRequest.objects.create(sender=self.bob, receiver=self.alice, status='accepted')
+
+        response = self.client.get('/api/recommendations/')
+
+        self.assertEqual([row['user']['username'] for row in response.data], ['carol'])
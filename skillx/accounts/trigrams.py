@@ -0,0 +1,153 @@
+"""
+Fuzzy search over usernames and skill names.
+
+Each username and skill name is split into words, each word is padded
+("  word ") and cut into overlapping three-letter trigrams. The trigrams
+are stored in UserTrigram / SkillTrigram, an inverted index kept current
+by the post_save signals in accounts.signals (rows go away with their
+user or skill through the CASCADE). Bulk writers call index_users() /
+index_skills() directly, and the rebuild_trigram_index command recreates
+both tables.
+
+A search looks up only the rows for the query's trigrams, so the cost
+depends on how many names share them, not on the size of the user table.
+Names are ranked by the average of two similarities:
+
+- the share of the query's trigrams found in the name, which favours
+  names that start with what has been typed so far, and
+- the Dice coefficient 2 * shared / (query + name), which favours names
+  of about the same length, so exact matches come first.
+
+Typos still share most trigrams with the intended name.
+"""
+import re
+
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Max, Value, When
+
+from .models import Skill, SkillTrigram, User, UserSkillHave, UserTrigram
+
+WORD_RE = re.compile(r'\w+')
+# Names scoring below this are not considered a match
+MIN_SIMILARITY = 0.4
+# Best matching skills whose users are included in a skill search
+MAX_MATCHING_SKILLS = 20
+
+
+def trigrams(text):
+    """Set of padded trigrams of the words in text"""
+    grams = set()
+    for word in WORD_RE.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _index(model, field, objects, text):
+    ids = [obj.id for obj in objects]
+    model.objects.filter(**{f'{field}_id__in': ids}).delete()
+
+    rows = []
+    for obj in objects:
+        grams = trigrams(text(obj))
+        rows.extend(model(trigram=gram, size=len(grams), **{field: obj}) for gram in grams)
+    model.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+def index_users(users):
+    _index(UserTrigram, 'user', users, lambda user: user.username)
+
+
+def index_skills(skills):
+    _index(SkillTrigram, 'skill', skills, lambda skill: skill.normalized_name)
+
+
+def rebuild_index(batch_size=1000):
+    """Recreate both trigram tables, returns (users, skills) indexed"""
+    counts = []
+    for model, queryset, index in (
+        (UserTrigram, User.objects.only('id', 'username'), index_users),
+        (SkillTrigram, Skill.objects.only('id', 'normalized_name'), index_skills),
+    ):
+        model.objects.all().delete()
+        indexed = 0
+        batch = []
+        for obj in queryset.order_by().iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                index(batch)
+                indexed += len(batch)
+                batch = []
+        index(batch)
+        counts.append(indexed + len(batch))
+    return tuple(counts)
+
+
+def _ranked(queryset, field, grams):
+    """(id, score) rows of the trigram queryset for names similar to grams, best first"""
+    size = len(grams)
+    score = ExpressionWrapper(
+        F('matched') * Value(0.5 / size) + F('matched') * Value(1.0) / (Value(size) + F('name_size')),
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(trigram__in=grams)
+        .values(f'{field}_id')
+        .annotate(matched=Count('id'), name_size=Max('size'))
+        .annotate(score=score)
+        .filter(score__gte=MIN_SIMILARITY)
+        .order_by('-score', f'{field}_id')
+        .values_list(f'{field}_id', 'score')
+    )
+
+
+def matching_skills(query, exact_skill_ids=()):
+    """Map of skill id to similarity for the skills closest to query"""
+    grams = trigrams(query)
+    scores = {}
+    if grams:
+        scores = dict(_ranked(SkillTrigram.objects.all(), 'skill', grams)[:MAX_MATCHING_SKILLS])
+    scores.update({skill_id: 1.0 for skill_id in exact_skill_ids})
+    return scores
+
+
+def search_users(query, exclude_id, by_username=True, by_skill=True, exact_skill_ids=(), offset=0, limit=20):
+    """
+    (user_id, score) pairs for users whose username and/or one of whose
+    skills resembles query, best match first. exact_skill_ids (such as
+    skills query names through an alias, which are not indexed) score as
+    exact matches.
+    """
+    grams = trigrams(query)
+    if not grams:
+        return []
+
+    # The first offset + limit users of the merged ranking are among the
+    # first offset + limit of each source ranking
+    depth = offset + limit
+    scores = {}
+
+    if by_username:
+        ranked = _ranked(UserTrigram.objects.exclude(user_id=exclude_id), 'user', grams)
+        for user_id, score in ranked[:depth]:
+            scores[user_id] = score
+
+    if by_skill:
+        skills = matching_skills(query, exact_skill_ids)
+        if skills:
+            best_skill = Max(
+                Case(*[When(skill_id=skill_id, then=Value(score)) for skill_id, score in skills.items()]),
+                output_field=FloatField(),
+            )
+            ranked = (
+                UserSkillHave.objects.filter(skill_id__in=list(skills))
+                .exclude(user_id=exclude_id)
+                .values('user_id')
+                .annotate(score=best_skill)
+                .values_list('user_id', 'score')
+                .order_by('-score', 'user_id')
+            )
+            for user_id, score in ranked[:depth]:
+                scores[user_id] = max(score, scores.get(user_id, 0))
+
+    ranking = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return ranking[offset:offset + limit]
@@ -0,0 +1,114 @@
+"""
+Unread message counters kept in Django's cache framework.
+
+Each user has one cache entry of the form
+``{'total': int, 'by_sender': {sender_id: int}}``. Writers adjust it after
+their transaction commits, while holding a short cache lock. If a writer
+cannot get the lock, it drops the entry. A missing entry is rebuilt from
+``Message.is_read`` on the next read.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Message
+
+UNREAD_CACHE_TIMEOUT = getattr(settings, 'UNREAD_COUNT_CACHE_TIMEOUT', 60 * 60)
+LOCK_TIMEOUT = 5
+LOCK_ATTEMPTS = 5
+
+
+def _counts_key(user_id):
+    return f'unread:{user_id}'
+
+
+def _lock_key(user_id):
+    return f'unread:{user_id}:lock'
+
+
+def _stale_key(user_id):
+    return f'unread:{user_id}:stale'
+
+
+def get_unread_counts(user_id):
+    counts = cache.get(_counts_key(user_id))
+    if counts is None:
+        counts = repair_unread_counts(user_id)
+    return counts
+
+
+def repair_unread_counts(user_id):
+    """Recompute a user's counters from the Message table and cache them"""
+    cache.delete(_stale_key(user_id))
+
+    rows = (
+        Message.objects.filter(receiver_id=user_id, is_read=False)
+        .values('sender_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    by_sender = {row['sender_id']: row['count'] for row in rows}
+    counts = {'total': sum(by_sender.values()), 'by_sender': by_sender}
+
+    # A writer committed while we were counting, our numbers may miss it
+    if cache.get(_stale_key(user_id)) is None:
+        cache.add(_counts_key(user_id), counts, UNREAD_CACHE_TIMEOUT)
+    return counts
+
+
+def adjust_unread(receiver_id, sender_id, delta):
+    """Add delta to receiver's unread count from sender once the transaction commits"""
+    transaction.on_commit(lambda: _apply(receiver_id, sender_id, delta))
+
+
+def clear_unread(receiver_id, sender_id):
+    """Receiver has read everything from sender"""
+    transaction.on_commit(lambda: _apply(receiver_id, sender_id, None))
+
+
+def invalidate_unread(user_id):
+    transaction.on_commit(lambda: _invalidate(user_id))
+
+
+def _invalidate(user_id):
+    cache.set(_stale_key(user_id), 1, LOCK_TIMEOUT)
+    cache.delete(_counts_key(user_id))
+
+
+def _apply(receiver_id, sender_id, delta):
+    receiver_id, sender_id = int(receiver_id), int(sender_id)
+
+    if not _acquire(receiver_id):
+        _invalidate(receiver_id)
+        return
+
+    try:
+        counts = cache.get(_counts_key(receiver_id))
+        if counts is None:
+            # Nothing cached, flag any in-flight repair as stale
+            cache.set(_stale_key(receiver_id), 1, LOCK_TIMEOUT)
+            return
+
+        by_sender = counts['by_sender']
+        current = by_sender.get(sender_id, 0)
+        new = 0 if delta is None else max(current + delta, 0)
+        if new:
+            by_sender[sender_id] = new
+        else:
+            by_sender.pop(sender_id, None)
+        counts['total'] = max(counts['total'] - current + new, 0)
+
+        cache.set(_counts_key(receiver_id), counts, UNREAD_CACHE_TIMEOUT)
+    finally:
+        cache.delete(_lock_key(receiver_id))
+
+
+def _acquire(user_id):
+    for attempt in range(LOCK_ATTEMPTS):
+        if cache.add(_lock_key(user_id), 1, LOCK_TIMEOUT):
+            return True
+        time.sleep(0.01 * (attempt + 1))
+    return False
@@ -1,6 +1,6 @@
 from django.urls import path
-from .views import MyConnectionsView, RegisterView, SearchUsersView, SendConnectionRequestView, UserListView, AcceptConnectionRequestView, PendingRequestsView, UserProfileView, UserDetailView, RejectConnectionRequestView, LogoutView, DeleteAccountView, SendMessageView, DeleteMessageView, DeleteConversationView, RemoveConnectionView, MarkMessagesAsReadView
-from .conversations_view import get_conversations
+from .views import MyConnectionsView, RegisterView, SearchUsersView, SendConnectionRequestView, UserListView, AcceptConnectionRequestView, PendingRequestsView, UserProfileView, UserDetailView, RejectConnectionRequestView, LogoutView, DeleteAccountView, SendMessageView, DeleteMessageView, DeleteConversationView, RemoveConnectionView, MarkMessagesAsReadView, UnreadCountView, SyncView, BroadcastMessageView, SearchMessagesView, RecommendationsView, SkillAutocompleteView, SuggestionsView, BulkAcceptConnectionRequestsView, BulkRejectConnectionRequestsView, CompressionStatsView, ExportView
+from .conversations_view import get_conversations, get_conversation_messages
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 
@@ -14,16 +14,28 @@ urlpatterns = [
     path('users/<int:user_id>/', UserDetailView.as_view(), name='user_detail'),
     path("users/", UserListView.as_view()),
     path("search/", SearchUsersView.as_view()),
+    path("recommendations/", RecommendationsView.as_view()),
+    path("suggestions/", SuggestionsView.as_view()),
+    path("skills/autocomplete/", SkillAutocompleteView.as_view()),
     path("send-request/", SendConnectionRequestView.as_view()),
     path("pending-requests/", PendingRequestsView.as_view()),
     path("accept-request/", AcceptConnectionRequestView.as_view()),
     path("reject-request/", RejectConnectionRequestView.as_view()),
+    path("accept-requests/", BulkAcceptConnectionRequestsView.as_view()),
+    path("reject-requests/", BulkRejectConnectionRequestsView.as_view()),
     path("my-connections/", MyConnectionsView.as_view()),
     path("connections/<int:connection_id>/", RemoveConnectionView.as_view()),
     path("conversations/", get_conversations),
+    path("conversations/<int:user_id>/messages/", get_conversation_messages),
     path("send-message/", SendMessageView.as_view()),
+    path("broadcast-message/", BroadcastMessageView.as_view()),
+    path("messages/search/", SearchMessagesView.as_view()),
     path("delete-message/<int:message_id>/", DeleteMessageView.as_view()),
     path("delete-conversation/<int:user_id>/", DeleteConversationView.as_view()),
     path("mark-messages-read/<int:user_id>/", MarkMessagesAsReadView.as_view()),
+    path("unread-count/", UnreadCountView.as_view()),
+    path("sync/", SyncView.as_view()),
+    path("export/", ExportView.as_view()),
+    path("compression-stats/", CompressionStatsView.as_view()),
     path("delete-account/", DeleteAccountView, name='delete_account'),
 ]
\ No newline at end of file
@@ -1,38 +1,51 @@
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from django.db.models import Q
-from django.db import models
+from django.db import IntegrityError, transaction
+from django.conf import settings
+from django.http import StreamingHttpResponse
+import time
 
 from accounts.serializers import RegisterSerializer, UserSerializer, ConnectionRequestSerializer, UserProfileUpdateSerializer, MessageSerializer
-from .models import ConnectionRequest, User, Message
+from .models import ArchivedMessage, ChangeEvent, ConnectionRequest, Conversation, User, Message, SkillMatch, UserSkillHave, UserSkillWant
+from .unread import adjust_unread, clear_unread, get_unread_counts, invalidate_unread
+from .fieldsets import SparseFieldsetMixin
+from .pagination import get_page_number, get_page_size
+from .search import highlight, index_messages, search_messages
+from .skills import normalize_skill_name, skill_ids_matching
+from .autocomplete import complete as complete_skill
+from .trigrams import search_users
+from .graph import connection_added, connection_removed, get_graph, user_removed as connection_graph_user_removed
+from .recommendations import TOP_K, recommendations_for
+from .events import changes_since, current_cursor, cursor_floor, lock_users, message_payload, notify, profile_payload, publish, publish_many, related_user_ids, wait_for_changes
+from .conditional import conditional_get
+from .scoping import owned, owns
+from .querybudget import query_budget
+from .compression import stats as compression_stats
+from .export import FORMATS as EXPORT_FORMATS, stream_export
 
 # Create your views here.
 
 class UserListView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 2
 
     def get(self, request):
         # Get users that are not the current user and not already connected
         users = User.objects.exclude(id=request.user.id)
         
         # Exclude users that are already connected with the current user
-        connected_users = ConnectionRequest.objects.filter(
+        connected_users = owned(request, ConnectionRequest).filter(
             status='accepted'
-        ).filter(
-            models.Q(sender=request.user) | models.Q(receiver=request.user)
-        )
+        ).values_list('sender_id', 'receiver_id')
         
-        # Get the IDs of connected users
-        connected_user_ids = set()
-        for conn in connected_users:
-            if conn.sender != request.user:
-                connected_user_ids.add(conn.sender.id)
-            if conn.receiver != request.user:
-                connected_user_ids.add(conn.receiver.id)
+        # Get the IDs of connected users, without loading the users
+        connected_user_ids = {user_id for pair in connected_users for user_id in pair}
         
         # Exclude connected users from the discover list
         users = users.exclude(id__in=connected_user_ids)
@@ -40,8 +53,55 @@ class UserListView(APIView):
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data)
     
+class RecommendationsView(APIView):
+    """
+    Users whose skills complement the current user's (they have what the
+    user wants and/or want what the user has), best match first. Served
+    from the precomputed SkillMatch lists.
+    """
+    permission_classes = [IsAuthenticated]
+    owned_models = (SkillMatch,)
+    query_budget = 4
+
+    def get(self, request):
+        try:
+            limit = get_page_size(request, default=20, maximum=TOP_K)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        matches = recommendations_for(request.user.id, limit)
+        candidate_ids = [match.candidate_id for match in matches]
+
+        # Explain each match with the overlapping skills, two queries per page
+        they_have = {}
+        for user_id, name in UserSkillHave.objects.filter(
+            user_id__in=candidate_ids, skill__users_wanting=request.user
+        ).values_list('user_id', 'skill__name'):
+            they_have.setdefault(user_id, []).append(name)
+        they_want = {}
+        for user_id, name in UserSkillWant.objects.filter(
+            user_id__in=candidate_ids, skill__users_having=request.user
+        ).values_list('user_id', 'skill__name'):
+            they_want.setdefault(user_id, []).append(name)
+
+        return Response([{
+            'user': UserSerializer(match.candidate).data,
+            'score': match.score,
+            'they_have': sorted(they_have.get(match.candidate_id, [])),
+            'they_want': sorted(they_want.get(match.candidate_id, [])),
+        } for match in matches])
+
+
 class SearchUsersView(APIView):
+    """
+    Fuzzy user search over the trigram index (accounts.trigrams): ?skill=
+    matches skill names, ?username= usernames and ?q= either. Tolerates
+    typos and partial words, best match first, paginated with page and
+    page_size.
+    """
     permission_classes = [IsAuthenticated]
+    owned_models = ()
+    query_budget = 4
 
     def get(self, request):
         skill = request.query_params.get('skill')
@@ -51,29 +111,92 @@ class SearchUsersView(APIView):
         if not skill and not username and not query:
             return Response({"error": "Search term required (skill, username, or q)"}, status=status.HTTP_400_BAD_REQUEST)
 
-        users = User.objects.exclude(id=request.user.id)
-        
-        # Search by skill
+        try:
+            page = get_page_number(request)
+            page_size = get_page_size(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         if skill:
-            users = users.filter(skills_have__icontains=skill)
-        
-        # Search by username
+            term, by_username, by_skill = skill, False, True
         elif username:
-            users = users.filter(username__icontains=username)
-        
-        # General search (search in both skills and username)
-        elif query:
-            users = users.filter(
-                models.Q(skills_have__icontains=query) |
-                models.Q(username__icontains=query)
-            )
-        
-        serializer = UserSerializer(users, many=True)
+            term, by_username, by_skill = username, True, False
+        else:
+            term, by_username, by_skill = query, True, True
+
+        ranking = search_users(
+            term,
+            exclude_id=request.user.id,
+            by_username=by_username,
+            by_skill=by_skill,
+            # Exact names and aliases always count as a full match
+            exact_skill_ids=skill_ids_matching(term) if by_skill else (),
+            offset=(page - 1) * page_size,
+            limit=page_size,
+        )
+
+        users = User.objects.in_bulk([user_id for user_id, _ in ranking])
+        serializer = UserSerializer([users[user_id] for user_id, _ in ranking], many=True)
         return Response(serializer.data)
-    
+
+
+class SkillAutocompleteView(APIView):
+    """Type-ahead for skill names, served from the in-process prefix index"""
+    permission_classes = [IsAuthenticated]
+    owned_models = ()
+    query_budget = 4
+
+    def get(self, request):
+        prefix = normalize_skill_name(request.query_params.get('prefix', ''))
+        if not prefix:
+            return Response({"error": "prefix is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = get_page_size(request, default=10, maximum=50)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response([
+            {'id': skill_id, 'name': name, 'users': weight}
+            for skill_id, name, weight in complete_skill(prefix, limit)
+        ])
+
+
+class SuggestionsView(APIView):
+    """
+    People you may know: users connected to your connections, most mutual
+    connections first. Users you already have a request with are left out.
+    """
+    permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    # 2, plus loading the graph in a process that has none yet
+    query_budget = 3
+
+    def get(self, request):
+        try:
+            limit = get_page_size(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        pending = owned(request, ConnectionRequest).filter(
+            status='pending'
+        ).values_list('sender_id', 'receiver_id')
+        exclude = {user_id for pair in pending for user_id in pair}
+
+        suggestions = get_graph().suggestions(request.user.id, limit, exclude=exclude)
+        users = User.objects.in_bulk([user_id for user_id, _ in suggestions])
+
+        return Response([
+            {'user': UserSerializer(users[user_id]).data, 'mutual_connections': mutual}
+            for user_id, mutual in suggestions
+            if user_id in users
+        ])
+
 
 class SendConnectionRequestView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 4
 
     def post(self, request):
         receiver_id = request.data.get("receiver_id")
@@ -84,76 +207,83 @@ class SendConnectionRequestView(APIView):
         if int(receiver_id) == request.user.id:
             return Response({"error": "Cannot send to yourself"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # The unique_connection_pair constraint rejects a second request
+        # between the same users, whoever sent it, so there is nothing to
+        # check first and concurrent requests cannot both get in
         try:
-            receiver = User.objects.get(id=receiver_id)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        # Prevent sending request to already connected users
-        already_connected = ConnectionRequest.objects.filter(
-            status="accepted"
-        ).filter(
-            Q(sender=request.user, receiver=receiver) |
-            Q(sender=receiver, receiver=request.user)
-        ).exists()
-
-        if already_connected:
-            return Response({"error": "Already connected with this user"}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Prevent duplicate request
-        existing = ConnectionRequest.objects.filter(
-            sender=request.user,
-            receiver=receiver
-        ).exists()
-
-        if existing:
+            with transaction.atomic():
+                # The lock also keeps the receiver from being deleted before commit
+                if int(receiver_id) not in lock_users([request.user.id, receiver_id]):
+                    return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+                connection_request = ConnectionRequest.objects.create(
+                    sender=request.user,
+                    receiver_id=receiver_id
+                )
+                publish([receiver_id], 'connection.requested', {
+                    'request_id': connection_request.id,
+                    'sender_id': request.user.id,
+                    'receiver_id': int(receiver_id),
+                })
+        except IntegrityError:
+            existing = owned(request, ConnectionRequest).filter(
+                Q(sender_id=receiver_id) | Q(receiver_id=receiver_id)
+            ).first()
+            if existing is None:
+                # Not the pair constraint
+                raise
+            if existing.status == "accepted":
+                return Response({"error": "Already connected with this user"}, status=status.HTTP_400_BAD_REQUEST)
+            if existing.sender_id != request.user.id:
+                return Response({"error": "This user has already sent you a request"}, status=status.HTTP_400_BAD_REQUEST)
             return Response({"error": "Request already sent"}, status=status.HTTP_400_BAD_REQUEST)
 
-        ConnectionRequest.objects.create(
-            sender=request.user,
-            receiver=receiver
-        )
-
         return Response({"message": "Request sent"}, status=status.HTTP_201_CREATED)
     
 
-class MyConnectionsView(APIView):
+class MyConnectionsView(SparseFieldsetMixin, APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 2
 
+    @conditional_get
     def get(self, request):
         # Get both sent and received accepted connections
-        connections = ConnectionRequest.objects.filter(
+        connections = owned(request, ConnectionRequest).filter(
             status="accepted"
-        ).filter(
-            Q(sender=request.user) | Q(receiver=request.user)
         )
         
-        serializer = ConnectionRequestSerializer(connections, many=True)
+        # Sender and receiver come from the same query, see SparseFieldsetMixin
+        serializer = self.serialize(request, ConnectionRequestSerializer, connections, many=True)
         return Response(serializer.data)
     
 
 
-class PendingRequestsView(APIView):
+class PendingRequestsView(SparseFieldsetMixin, APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 2
 
+    @conditional_get
     def get(self, request):
-        pending_requests = ConnectionRequest.objects.filter(
+        pending_requests = owned(request, ConnectionRequest).filter(
             receiver=request.user,
             status='pending'
         )
         
-        serializer = ConnectionRequestSerializer(pending_requests, many=True)
+        serializer = self.serialize(request, ConnectionRequestSerializer, pending_requests, many=True)
         return Response(serializer.data)
 
 
 class AcceptConnectionRequestView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 5
 
     def post(self, request):
         request_id = request.data.get("request_id")
         
         try:
-            connection_request = ConnectionRequest.objects.get(
+            connection_request = owned(request, ConnectionRequest).get(
                 id=request_id,
                 receiver=request.user,
                 status='pending'
@@ -161,15 +291,104 @@ class AcceptConnectionRequestView(APIView):
         except ConnectionRequest.DoesNotExist:
             return Response({"error": "Request not found or already processed"}, status=status.HTTP_404_NOT_FOUND)
         
-        connection_request.status = 'accepted'
-        connection_request.save()
+        with transaction.atomic():
+            lock_users([connection_request.sender_id, connection_request.receiver_id])
+            connection_request.status = 'accepted'
+            connection_request.save()
+            publish([connection_request.sender_id, connection_request.receiver_id], 'connection.accepted', {
+                'request_id': connection_request.id,
+                'sender_id': connection_request.sender_id,
+                'receiver_id': connection_request.receiver_id,
+            })
+            transaction.on_commit(lambda: connection_added(connection_request.sender_id, connection_request.receiver_id))
         
         return Response({"message": "Connection accepted"}, status=status.HTTP_200_OK)
 
 
+class BulkConnectionRequestView(APIView):
+    """
+    Base for endpoints that act on many pending requests received by the
+    current user. Takes request_ids and reports which ones were handled
+    and which were not found or already processed. Subclasses set accept:
+    True accepts the requests, False rejects (deletes) them.
+    """
+    permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 6
+
+    max_requests = 500
+
+    def post(self, request):
+        request_ids = request.data.get("request_ids")
+        try:
+            if not isinstance(request_ids, list) or not request_ids:
+                raise TypeError
+            request_ids = list(dict.fromkeys(int(request_id) for request_id in request_ids))
+        except (TypeError, ValueError):
+            return Response({"error": "request_ids must be a non-empty list of request ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(request_ids) > self.max_requests:
+            return Response({"error": f"Cannot process more than {self.max_requests} requests at once"}, status=status.HTTP_400_BAD_REQUEST)
+
+        requested = owned(request, ConnectionRequest).filter(
+            id__in=request_ids, receiver=request.user, status='pending'
+        )
+        sender_ids = set(requested.values_list('sender_id', flat=True))
+
+        with transaction.atomic():
+            # Users first, see accounts.events; then the requests, so a
+            # concurrent accept/reject cannot handle them too
+            lock_users(sender_ids | {request.user.id})
+            pending = list(
+                requested.select_for_update()
+                .filter(sender_id__in=sender_ids)
+                .order_by('id')
+                .values_list('id', 'sender_id')
+            )
+            if pending:
+                handled_requests = ConnectionRequest.objects.filter(id__in=[request_id for request_id, _ in pending])
+                if self.accept:
+                    handled_requests.update(status='accepted')
+                else:
+                    handled_requests.delete()
+                event_type = 'connection.accepted' if self.accept else 'connection.rejected'
+                publish_many([
+                    ([sender_id, request.user.id], event_type, {
+                        'request_id': request_id,
+                        'sender_id': sender_id,
+                        'receiver_id': request.user.id,
+                    })
+                    for request_id, sender_id in pending
+                ])
+                if self.accept:
+                    transaction.on_commit(lambda: self.update_graph(request, pending))
+
+        handled = {request_id for request_id, _ in pending}
+        return Response({
+            "processed": sorted(handled),
+            "not_found": [request_id for request_id in request_ids if request_id not in handled],
+        })
+
+    @staticmethod
+    def update_graph(request, pending):
+        for _, sender_id in pending:
+            connection_added(sender_id, request.user.id)
+
+
+class BulkAcceptConnectionRequestsView(BulkConnectionRequestView):
+    accept = True
+
+
+class BulkRejectConnectionRequestsView(BulkConnectionRequestView):
+    accept = False
+
+
 class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = ()
+    query_budget = {'get': 1, 'put': 22}
 
+    @conditional_get
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
@@ -177,52 +396,38 @@ class UserProfileView(APIView):
     def put(self, request):
         serializer = UserProfileUpdateSerializer(request.user, data=request.data, context={'request': request})
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                lock_users([request.user.id])
+                user = serializer.save()
+                publish([user.id], 'profile.updated', profile_payload(user))
+                # Other users' lists show this profile too; notify()
+                # moves their ETags without an event per user
+                notify(related_user_ids(user.id), 'profile.updated', profile_payload(user))
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
-def DeleteAccountView(request):
-    try:
-        user = request.user
-        password = request.data.get('password')
-        
-        # Verify password before deletion
-        if not user.check_password(password):
-            return Response(
-                {'error': 'Invalid password'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Delete user and all related data
-        user.delete()
-        
-        return Response(
-            {'message': 'Account deleted successfully'}, 
-            status=status.HTTP_200_OK
-        )
-    except Exception as e:
-        return Response(
-            {'error': 'Failed to delete account'}, 
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
-
 
 class UserDetailView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = ()
+    query_budget = 2
 
     def get(self, request, user_id):
         try:
             user = User.objects.get(id=user_id)
             serializer = UserSerializer(user)
-            return Response(serializer.data)
+            data = serializer.data
+            if user.id != request.user.id:
+                data['mutual_connections'] = get_graph().mutual_count(request.user.id, user.id)
+            return Response(data)
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-class SendMessageView(APIView):
+class SendMessageView(SparseFieldsetMixin, APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (Message,)
+    query_budget = 7
 
     def post(self, request):
         receiver_id = request.data.get("receiver_id")
@@ -239,30 +444,186 @@ class SendMessageView(APIView):
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        # Create message
-        message = Message.objects.create(
-            sender=request.user,
-            receiver=receiver,
-            content=content
-        )
+        # Create message and move its conversation to the top of the inbox
+        with transaction.atomic():
+            lock_users([request.user.id, receiver.id])
+            message = Message.objects.create(
+                sender=request.user,
+                receiver=receiver,
+                content=content
+            )
+            Conversation.objects.record_message(message)
+            adjust_unread(receiver.id, request.user.id, 1)
+            publish([request.user.id, receiver.id], 'message.created', message_payload(message))
 
         # Serialize and return message
-        serializer = MessageSerializer(message)
+        serializer = self.serialize(request, MessageSerializer, message)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+class BroadcastMessageView(APIView):
+    """
+    Send the same message to many users at once. Takes either a list of
+    receiver_ids or all_connections=true, and costs a constant number of
+    queries whatever the number of recipients.
+    """
+    permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest, Message)
+    # 9, plus reading back the ids on MySQL
+    query_budget = 10
+
+    max_recipients = getattr(settings, 'BROADCAST_MAX_RECIPIENTS', 500)
+
+    def post(self, request):
+        content = request.data.get("content")
+        receiver_ids = request.data.get("receiver_ids")
+        all_connections = str(request.data.get("all_connections", "")).lower() in ('1', 'true', 'yes')
+
+        if not content or (not receiver_ids and not all_connections):
+            return Response({"error": "content and receiver_ids or all_connections are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if all_connections:
+            connections = owned(request, ConnectionRequest).filter(
+                status="accepted"
+            ).values_list("sender_id", "receiver_id")
+            requested = sorted({
+                receiver_id if sender_id == request.user.id else sender_id
+                for sender_id, receiver_id in connections
+            })
+        else:
+            try:
+                if not isinstance(receiver_ids, list):
+                    raise TypeError
+                requested = list(dict.fromkeys(int(receiver_id) for receiver_id in receiver_ids))
+            except (TypeError, ValueError):
+                return Response({"error": "receiver_ids must be a list of user ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(requested) > self.max_recipients:
+            return Response({"error": f"Cannot send to more than {self.max_recipients} users at once"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = {}
+        if request.user.id in requested:
+            results[request.user.id] = {"receiver_id": request.user.id, "status": "error", "error": "Cannot send message to yourself"}
+
+        messages = []
+        with transaction.atomic():
+            # Validates all receivers in the same query
+            receiver_ids = lock_users(requested + [request.user.id]) - {request.user.id}
+            if receiver_ids:
+                messages = Message.objects.bulk_create([
+                    Message(sender=request.user, receiver_id=receiver_id, content=content)
+                    for receiver_id in sorted(receiver_ids)
+                ])
+                if any(message.pk is None for message in messages):
+                    # Backends that cannot return ids from a bulk INSERT (MySQL)
+                    inserted = owned(request, Message).filter(
+                        sender=request.user,
+                        receiver_id__in=receiver_ids,
+                        timestamp__gte=min(message.timestamp for message in messages),
+                    ).order_by("id")
+                    messages = list({message.receiver_id: message for message in inserted}.values())
+
+                Conversation.objects.record_broadcast(request.user.id, messages)
+                index_messages(messages)
+                for message in messages:
+                    adjust_unread(message.receiver_id, request.user.id, 1)
+                publish_many([
+                    ([request.user.id, message.receiver_id], 'message.created', message_payload(message))
+                    for message in messages
+                ])
+
+        for message in messages:
+            results[message.receiver_id] = {"receiver_id": message.receiver_id, "status": "sent", "message_id": message.id}
+
+        return Response({
+            "sent": len(messages),
+            "results": [
+                results.get(receiver_id, {"receiver_id": receiver_id, "status": "error", "error": "User not found"})
+                for receiver_id in requested
+            ],
+        }, status=status.HTTP_201_CREATED if messages else status.HTTP_400_BAD_REQUEST)
+
+
+class SearchMessagesView(APIView):
+    permission_classes = [IsAuthenticated]
+    owned_models = (Message,)
+    query_budget = 2
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Search term required (q)"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            page = get_page_number(request)
+            page_size = get_page_size(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = search_messages(request.user, query, (page - 1) * page_size, page_size + 1)
+
+        results = [{
+            'id': row['id'],
+            'sender_id': row['sender_id'],
+            'receiver_id': row['receiver_id'],
+            'other_user_id': row['receiver_id'] if row['sender_id'] == request.user.id else row['sender_id'],
+            'snippet': highlight(row['content'], query),
+            'timestamp': row['timestamp'].isoformat(),
+            'score': row['score'],
+        } for row in rows[:page_size]]
+
+        return Response({
+            'results': results,
+            'page': page,
+            'page_size': page_size,
+            'has_next': len(rows) > page_size,
+        })
+
+
+class UnreadCountView(APIView):
+    permission_classes = [IsAuthenticated]
+    owned_models = (Message,)
+    query_budget = 1
+
+    def get(self, request):
+        # Served from cached counters, rebuilt from Message.is_read on a miss
+        counts = get_unread_counts(request.user.id)
+        return Response({
+            'total': counts['total'],
+            'by_sender': counts['by_sender'],
+        })
+
+
 class DeleteMessageView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (Message, ArchivedMessage)
+    query_budget = 10
 
     def delete(self, request, message_id):
         try:
-            message = Message.objects.get(
-                id=message_id,
-                sender=request.user  # Only sender can delete their own messages
-            )
-            message.delete()
+            # Only sender can delete their own messages
+            message = owned(request, Message).filter(id=message_id, sender=request.user).first()
+            archived = message is None
+            if archived:
+                message = owned(request, ArchivedMessage).get(id=message_id, sender=request.user)
+
+            with transaction.atomic():
+                lock_users([message.sender_id, message.receiver_id])
+                if not archived:
+                    message.delete()
+                    Conversation.objects.message_deleted(message)
+                    if not message.is_read:
+                        adjust_unread(message.receiver_id, message.sender_id, -1)
+                else:
+                    # Archived messages are read and never a conversation's last message
+                    message.delete()
+                publish([message.sender_id, message.receiver_id], 'message.deleted', {
+                    'id': int(message_id),
+                    'sender_id': message.sender_id,
+                    'receiver_id': message.receiver_id,
+                })
             return Response({"message": "Message deleted successfully"}, status=status.HTTP_200_OK)
-        except Message.DoesNotExist:
+        except ArchivedMessage.DoesNotExist:
             return Response({"error": "Message not found or you don't have permission to delete it"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -270,14 +631,25 @@ class DeleteMessageView(APIView):
 
 class DeleteConversationView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (Message, ArchivedMessage, Conversation)
+    query_budget = 9
 
     def delete(self, request, user_id):
         try:
             # Delete all messages between current user and the specified user
-            Message.objects.filter(
-                (Q(sender=request.user, receiver_id=user_id) |
-                 Q(sender_id=user_id, receiver=request.user))
-            ).delete()
+            with transaction.atomic():
+                lock_users([request.user.id, user_id])
+                for model in (Message, ArchivedMessage):
+                    owned(request, model).filter(
+                        (Q(sender=request.user, receiver_id=user_id) |
+                         Q(sender_id=user_id, receiver=request.user))
+                    ).delete()
+                owned(request, Conversation).between(request.user.id, user_id).delete()
+                clear_unread(request.user.id, user_id)
+                clear_unread(user_id, request.user.id)
+                publish([request.user.id, user_id], 'conversation.deleted', {
+                    'user_ids': sorted([request.user.id, int(user_id)]),
+                })
             return Response({"message": "Conversation deleted successfully"}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -285,12 +657,14 @@ class DeleteConversationView(APIView):
 
 class RejectConnectionRequestView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 5
 
     def post(self, request):
         request_id = request.data.get("request_id")
         
         try:
-            connection_request = ConnectionRequest.objects.get(
+            connection_request = owned(request, ConnectionRequest).get(
                 id=request_id,
                 receiver=request.user,
                 status='pending'
@@ -298,12 +672,22 @@ class RejectConnectionRequestView(APIView):
         except ConnectionRequest.DoesNotExist:
             return Response({"error": "Request not found or already processed"}, status=status.HTTP_404_NOT_FOUND)
         
-        connection_request.delete()
+        with transaction.atomic():
+            lock_users([connection_request.sender_id, connection_request.receiver_id])
+            payload = {
+                'request_id': connection_request.id,
+                'sender_id': connection_request.sender_id,
+                'receiver_id': connection_request.receiver_id,
+            }
+            connection_request.delete()
+            publish([payload['sender_id'], payload['receiver_id']], 'connection.rejected', payload)
         return Response({"message": "Connection request rejected"}, status=status.HTTP_200_OK)
 
 
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = ()
+    query_budget = 0
 
     def post(self, request):
         # In a real implementation, you might want to blacklist the token
@@ -312,6 +696,9 @@ class LogoutView(APIView):
 
 
 class RegisterView(APIView):
+    owned_models = ()
+    query_budget = 7
+
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
 
@@ -324,6 +711,8 @@ class RegisterView(APIView):
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@owns(Message)
+@query_budget(22)
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def DeleteAccountView(request):
@@ -339,7 +728,16 @@ def DeleteAccountView(request):
             )
         
         # Delete user and all related data
-        user.delete()
+        user_id = user.id
+        with transaction.atomic():
+            notify(related_user_ids(user.id), 'user.deleted', {'user_id': user.id})
+            # The cascade deletes the user's unread messages, which other
+            # users' cached counters still include
+            receiver_ids = owned(request, Message).filter(sender=user, is_read=False).values_list('receiver_id', flat=True).order_by().distinct()
+            for receiver_id in receiver_ids:
+                invalidate_unread(receiver_id)
+            user.delete()
+        connection_graph_user_removed(user_id)
         
         return Response(
             {'message': 'Account deleted successfully'}, 
@@ -355,21 +753,28 @@ def DeleteAccountView(request):
 
 class RemoveConnectionView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest,)
+    query_budget = 5
 
     def delete(self, request, connection_id):
         try:
-            # Get the connection to remove
-            connection = ConnectionRequest.objects.get(id=connection_id)
-            
-            # Check if the current user is part of this connection
-            if connection.sender != request.user and connection.receiver != request.user:
-                return Response(
-                    {"error": "Permission denied"}, 
-                    status=status.HTTP_403_FORBIDDEN
-                )
+            # Get the connection to remove; other users' connections are
+            # not found, without revealing that they exist
+            connection = owned(request, ConnectionRequest).get(id=connection_id)
             
             # Delete the connection
-            connection.delete()
+            with transaction.atomic():
+                lock_users([connection.sender_id, connection.receiver_id])
+                payload = {
+                    'request_id': connection.id,
+                    'sender_id': connection.sender_id,
+                    'receiver_id': connection.receiver_id,
+                }
+                was_accepted = connection.status == 'accepted'
+                connection.delete()
+                publish([payload['sender_id'], payload['receiver_id']], 'connection.removed', payload)
+                if was_accepted:
+                    transaction.on_commit(lambda: connection_removed(payload['sender_id'], payload['receiver_id']))
             
             return Response(
                 {"message": "Connection removed successfully"}, 
@@ -389,15 +794,27 @@ class RemoveConnectionView(APIView):
 
 class MarkMessagesAsReadView(APIView):
     permission_classes = [IsAuthenticated]
+    owned_models = (Message,)
+    query_budget = 5
 
     def post(self, request, user_id):
         try:
             # Mark all messages from the specified user to current user as read
-            messages_updated = Message.objects.filter(
-                sender_id=user_id,
-                receiver=request.user,
-                is_read=False
-            ).update(is_read=True)
+            with transaction.atomic():
+                lock_users([request.user.id, user_id])
+                messages_updated = owned(request, Message).filter(
+                    sender_id=user_id,
+                    receiver=request.user,
+                    is_read=False
+                ).update(is_read=True)
+                Conversation.objects.mark_read(request.user.id, user_id)
+                clear_unread(request.user.id, user_id)
+                if messages_updated:
+                    publish([request.user.id, user_id], 'messages.read', {
+                        'reader_id': request.user.id,
+                        'sender_id': int(user_id),
+                        'count': messages_updated,
+                    })
             
             return Response({
                 'message': f'Marked {messages_updated} messages as read',
@@ -409,3 +826,90 @@ class MarkMessagesAsReadView(APIView):
                 {'error': 'Failed to mark messages as read'}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class SyncView(APIView):
+    """
+    Incremental sync. GET /api/sync/?cursor=<n> returns the caller's changes
+    after cursor n and the cursor to use next time. Without a cursor it only
+    returns the current cursor, to be taken before a full reload.
+    ?wait=<seconds> holds the request open until a change arrives.
+    """
+    permission_classes = [IsAuthenticated]
+    owned_models = (ChangeEvent,)
+    query_budget = 2
+
+    batch_size = getattr(settings, 'SYNC_BATCH_SIZE', 500)
+    max_wait = getattr(settings, 'SYNC_MAX_WAIT', 30)
+    # Events from other worker processes are only seen by re-querying
+    poll_interval = getattr(settings, 'SYNC_POLL_INTERVAL', 1)
+
+    def get(self, request):
+        try:
+            raw_cursor = request.query_params.get('cursor')
+            cursor = int(raw_cursor) if raw_cursor not in (None, '') else None
+            wait = min(float(request.query_params.get('wait') or 0), self.max_wait)
+            if (cursor is not None and cursor < 0) or wait < 0:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "cursor must be a non-negative integer and wait a non-negative number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # No cursor yet, or events after it were pruned: the client has to
+        # reload everything and continue from the current cursor
+        if cursor is None or cursor < cursor_floor():
+            return Response({
+                'changes': [],
+                'cursor': current_cursor(request.user.id),
+                'has_more': False,
+                'reset': cursor is not None,
+            })
+
+        deadline = time.monotonic() + wait
+        while True:
+            events = changes_since(request.user.id, cursor, self.batch_size + 1)
+            remaining = deadline - time.monotonic()
+            if events or remaining <= 0:
+                break
+            wait_for_changes(min(remaining, self.poll_interval))
+
+        has_more = len(events) > self.batch_size
+        events = events[:self.batch_size]
+
+        return Response({
+            'changes': [{
+                'cursor': event['id'],
+                'type': event['event_type'],
+                'data': event['payload'],
+                'timestamp': event['created_at'],
+            } for event in events],
+            'cursor': events[-1]['id'] if events else cursor,
+            'has_more': has_more,
+            'reset': False,
+        })
+
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    owned_models = (ConnectionRequest, Message, ArchivedMessage)
+    # One query per table while each fits in one export chunk
+    query_budget = 3
+
+    def get(self, request):
+        # Not ?format=, which DRF reserves for choosing a renderer
+        export_format = request.query_params.get('as', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": "as must be one of: " + ", ".join(EXPORT_FORMATS)}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(stream_export(request.user, export_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="skillx-{request.user.username}.{extension}"'
+        return response
+
+
+class CompressionStatsView(APIView):
+    permission_classes = [IsAdminUser]
+    owned_models = ()
+    query_budget = 0
+
+    def get(self, request):
+        return Response(compression_stats())
@@ -32,6 +32,7 @@ ALLOWED_HOSTS = ['localhost', '127.0.0.1', 'testserver']
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -40,12 +41,16 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'corsheaders',
+    'channels',
     'accounts',
 
 ]
 
 MIDDLEWARE = [
+    'accounts.metrics.MetricsMiddleware',
+    'accounts.querybudget.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'accounts.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -53,8 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    # 'accounts.middleware.SecurityAuditMiddleware',
-    # 'accounts.middleware.DataIsolationMiddleware',
+    'accounts.middleware.SecurityAuditMiddleware',
 ]
 
 ROOT_URLCONF = 'skillx.urls'
@@ -75,6 +79,19 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'skillx.wsgi.application'
+ASGI_APPLICATION = 'skillx.asgi.application'
+
+
+# Channels
+# https://channels.readthedocs.io/en/stable/topics/channel_layers.html
+# The in-memory layer only reaches clients connected to the same process.
+# Switch to channels_redis.core.RedisChannelLayer when running several.
+
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
 
 
 # Database
@@ -101,6 +118,94 @@ DATABASES = {
 AUTH_USER_MODEL = 'accounts.User'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Unread message counters live here. Use a shared backend (Redis, Memcached)
+# when running more than one worker process.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Seconds before cached unread counters are rebuilt from the database
+UNREAD_COUNT_CACHE_TIMEOUT = 60 * 60
+
+# Most receivers one broadcast message may have
+BROADCAST_MAX_RECIPIENTS = 500
+
+# Days of sync change events prune_change_events keeps; run it daily
+CHANGE_EVENT_RETENTION_DAYS = 30
+
+# Incremental sync (/api/sync/): most changes per response, longest
+# long-poll wait a client may ask for, and how often (seconds) a waiting
+# request re-checks for changes made by other worker processes
+SYNC_BATCH_SIZE = 500
+SYNC_MAX_WAIT = 30
+SYNC_POLL_INTERVAL = 1
+
+# Length of each user's precomputed skill-match recommendation list
+RECOMMENDATIONS_TOP_K = 50
+# Most other users' lists one profile change is written into, best
+# matches first; the rest catch up at the next rebuild_recommendations
+RECOMMENDATIONS_MAX_REVERSE_UPDATES = 1000
+
+# Seconds before a process rebuilds its skill autocomplete index, in the
+# background, to pick up profile changes made in other processes
+SKILL_AUTOCOMPLETE_TTL = 300
+
+# Processes up to this many connection changes behind apply them to their
+# connection graph; further behind, they reload it from the database
+CONNECTION_GRAPH_MAX_DELTAS = 1000
+
+# Responses smaller than this many bytes are not compressed
+RESPONSE_COMPRESSION_MIN_SIZE = 1024
+
+# Compression level per Content-Encoding, most preferred first. zstd and br
+# are used when the zstandard / brotli packages are installed.
+RESPONSE_COMPRESSION_LEVELS = {
+    'zstd': 3,
+    'br': 4,
+    'gzip': 6,
+}
+
+# Audit trail of API requests (accounts.audit). Backend: 'logging' (the
+# "security" logger), 'file' (JSON lines in AUDIT_LOG_FILE) or 'database'
+# (the AuditEvent table). Records are written in batches by a background
+# thread; when AUDIT_QUEUE_SIZE records are waiting, AUDIT_QUEUE_FULL
+# 'drop' discards new ones and 'block' waits up to AUDIT_BLOCK_TIMEOUT
+# seconds (None: forever) for room first.
+AUDIT_LOG_BACKEND = 'logging'
+AUDIT_LOG_FILE = os.path.join(BASE_DIR, 'audit.log')
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_QUEUE_FULL = 'drop'
+AUDIT_BLOCK_TIMEOUT = 0.05
+
+# Request metrics served at /metrics (accounts.metrics). With several
+# worker processes, point METRICS_DIR at a directory shared by them and
+# emptied on each deploy, so /metrics adds up every worker's totals.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 1.0
+# /metrics needs "Authorization: Bearer <METRICS_TOKEN>"; with no token set
+# it is closed. METRICS_ALLOWED_IPS opts addresses in without the token,
+# matched against REMOTE_ADDR: behind a reverse proxy on the same host
+# every client arrives from 127.0.0.1, so only list addresses that no
+# proxied request can come from.
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = []
+
+# With DEBUG on, QueryInspectorMiddleware warns about a query run this
+# many times in one request (see accounts.querybudget)
+N_PLUS_ONE_THRESHOLD = 5
+
+# Read messages older than this are moved to the archive table by
+# `manage.py archive_messages`. Once archiving has run, only ever lower it.
+MESSAGE_ARCHIVE_AFTER_DAYS = 180
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -153,6 +258,16 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # orjson-backed, same output as DRF's JSONRenderer/JSONParser
+    'DEFAULT_RENDERER_CLASSES': (
+        'accounts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'accounts.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -2,7 +2,10 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from accounts.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('accounts.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]